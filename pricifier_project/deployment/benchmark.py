@@ -0,0 +1,66 @@
+"""Benchmark the preprocessing and inference pipeline and compare against a stored baseline.
+
+    python benchmark.py                        # 1k, 10k and 100k rows
+    python benchmark.py --sizes 1000 --save-baseline
+    python benchmark.py --sizes 1000 --fail-on-regression
+
+Results are compared with the baseline file when it exists; any metric more
+than --tolerance worse is flagged. Baselines are only meaningful on the
+machine that recorded them.
+"""
+import argparse
+import os
+import sys
+import warnings
+
+import django
+from django.test.utils import setup_test_environment
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ramseyweb.settings")
+django.setup()
+# Lets the test client drive predict_view through the full middleware stack
+setup_test_environment()
+
+from pricifier.benchmarks import (  # noqa: E402
+    SIZES, TOLERANCE, Benchmark, compare, environment, load_baseline, save_baseline,
+)
+
+warnings.filterwarnings("ignore")
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "baseline.json")
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+parser.add_argument("--repeats", type=int, default=3)
+parser.add_argument("--baseline", default=BASELINE)
+parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown, 0.25 = 25%%")
+parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on regressions")
+parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak-memory runs")
+parser.add_argument("--view-requests", type=int, default=200)
+parser.add_argument("--view-clients", type=int, default=8)
+args = parser.parse_args()
+
+print(environment())
+benchmark = Benchmark(repeats=args.repeats, track_memory=not args.no_memory,
+                      view_requests=args.view_requests, view_clients=args.view_clients)
+for n in args.sizes:
+    benchmark.run(n)
+
+regressions = []
+if os.path.exists(args.baseline):
+    baseline = load_baseline(args.baseline)
+    if baseline["environment"] != environment():
+        print(f"Baseline was recorded on {baseline['environment']}; comparisons may not be meaningful")
+    regressions = compare(benchmark.results, baseline["results"], args.tolerance)
+    for name, metric, before, after, ratio in regressions:
+        print(f"REGRESSION {name} {metric}: {before:.4g} -> {after:.4g} ({ratio:.2f}x worse)")
+    if not regressions:
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+if args.save_baseline:
+    save_baseline(args.baseline, benchmark.results)
+    print(f"Saved baseline to {args.baseline}")
+
+if regressions and args.fail_on_regression:
+    sys.exit(1)
@@ -0,0 +1,108 @@
+import os
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor, StackingRegressor
+from sklearn.linear_model import Ridge
+
+from pricifier.compiled import COMPILED_MAX_ROWS, compile_model_per_cluster
+from pricifier.model import ClusterFit, ModelPerCluster, cluster_features
+
+warnings.filterwarnings("ignore")
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "machine_learning", "airbnb_sample.csv")
+
+
+def per_call_ms(func, repeats):
+    func()
+    started = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return 1000 * (time.perf_counter() - started) / repeats
+
+
+def peak_mib(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+df = pd.read_csv(SAMPLE).drop(columns=["city"])
+y = df.pop("log_price")
+X = df
+
+clusterer = ClusterFit(cluster_features=cluster_features, n_clusters=3)
+cluster_labels = clusterer.fit_predict(X)
+
+# One model type per cluster, plus the stacked ensemble, so every compiled path is exercised.
+estimators = {
+    0: RandomForestRegressor(n_estimators=200, max_depth=12, random_state=0),
+    1: GradientBoostingRegressor(n_estimators=200, max_depth=4, random_state=0),
+    2: StackingRegressor(
+        estimators=[("RandomForest", RandomForestRegressor(n_estimators=100, random_state=0)),
+                    ("GradientBoosting", GradientBoostingRegressor(random_state=0)),
+                    ("Ridge", Ridge())],
+        final_estimator=Ridge(),
+    ),
+}
+model = ModelPerCluster(X.columns.tolist(), {}, cluster_labels)
+for cluster_id, estimator in estimators.items():
+    mask = cluster_labels == cluster_id
+    model.cluster_models[cluster_id] = estimator.fit(X[mask], y[mask])
+    model.cluster_model_types[cluster_id] = type(estimator).__name__
+
+compiled = compile_model_per_cluster(model)
+
+expected = model.predicts(X, cluster_labels)
+actual = compiled.predicts(X, cluster_labels)
+print(f"max abs difference over {len(X)} rows: {np.abs(expected - actual).max():.2e}")
+
+print(f"{'rows':>6} {'cluster':>8} {'sklearn ms':>11} {'compiled ms':>12} {'speedup':>8}")
+for cluster_id in range(model.n_clusters):
+    row = np.flatnonzero(cluster_labels == cluster_id)[:1]
+    X_row, labels_row = X.iloc[row], cluster_labels[row]
+    before = per_call_ms(lambda: model.predicts(X_row, labels_row), 50)
+    after = per_call_ms(lambda: compiled.predicts(X_row, labels_row), 50)
+    print(f"{1:>6} {cluster_id:>8} {before:>11.3f} {after:>12.3f} {before / after:>7.1f}x")
+
+before = per_call_ms(lambda: model.predicts(X, cluster_labels), 10)
+after = per_call_ms(lambda: compiled.predicts(X, cluster_labels), 10)
+print(f"{len(X):>6} {'all':>8} {before:>11.3f} {after:>12.3f} {before / after:>7.1f}x")
+
+# The largest models of rf_space and gbr_space, fitted on the sample resampled
+# with noise so the trees reach their full depth. Every cluster gets the same
+# model, so ``rows`` is also the size of the one cluster group predicted.
+rng = np.random.default_rng(0)
+big = rng.integers(0, len(X), 5000)
+X_big = X.iloc[big].reset_index(drop=True) * rng.normal(1, 0.05, (len(big), X.shape[1]))
+y_big = y.iloc[big].to_numpy() + rng.normal(0, 0.1, len(big))
+labels_big = np.zeros(len(X_big), dtype=int)
+search_space_models = {
+    "RandomForest 300x20": RandomForestRegressor(n_estimators=300, max_depth=20, random_state=0, n_jobs=-1),
+    "GradientBoosting 300x10": GradientBoostingRegressor(n_estimators=300, max_depth=10, random_state=0),
+}
+print(f"\nserved = compiled up to {COMPILED_MAX_ROWS} rows per cluster, sklearn above")
+print(f"{'model':>24} {'rows':>6} {'sklearn ms':>11} {'compiled ms':>12} {'served ms':>10} "
+      f"{'compiled MiB':>13} {'served MiB':>11}")
+for name, estimator in search_space_models.items():
+    estimator.fit(X_big, y_big)
+    estimator.set_params(**({"n_jobs": None} if "n_jobs" in estimator.get_params() else {}))
+    model = ModelPerCluster(X.columns.tolist(), {}, labels_big)
+    model.cluster_models = {0: estimator}
+    always = compile_model_per_cluster(model, max_rows=None)
+    served = compile_model_per_cluster(model)
+    for rows in (1, COMPILED_MAX_ROWS, 500, 5000):
+        X_rows, labels_rows = X_big.iloc[:rows], labels_big[:rows]
+        repeats = max(1, 500 // rows)
+        before = per_call_ms(lambda: model.predicts(X_rows, labels_rows), repeats)
+        after = per_call_ms(lambda: always.predicts(X_rows, labels_rows), repeats)
+        both = per_call_ms(lambda: served.predicts(X_rows, labels_rows), repeats)
+        print(f"{name:>24} {rows:>6} {before:>11.3f} {after:>12.3f} {both:>10.3f} "
+              f"{peak_mib(lambda: always.predicts(X_rows, labels_rows)):>13.1f} "
+              f"{peak_mib(lambda: served.predicts(X_rows, labels_rows)):>11.1f}")
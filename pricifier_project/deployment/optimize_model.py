@@ -1,18 +1,47 @@
+"""Fit the preprocessor, clusterer and per-cluster models on Airbnb_Data.csv and publish them as a bundle.
+
+    python deployment/optimize_model.py                    # train on every row
+    python deployment/optimize_model.py --train-rows 5000  # tune on a uniform sample
+
+The preprocessor always streams the whole file; --train-rows only caps the rows
+the clusterer and the per-cluster models are tuned on, e.g. for a quick run.
+"""
+import argparse
+
 import pandas as pd
 from pricifier.model import ClusterFit, ModelPerCluster, cluster_features, model_types
 from pricifier.preprocessor import DataPreprocessor
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.linear_model import Ridge
-import joblib
+from pricifier.ingest import LISTING_COLUMNS, TARGET, ChunkedCsv, reservoir_sample
+from pricifier.feature_store import FeatureStore
+from pricifier.text_cache import configure_text_cache, get_text_cache
+from pricifier.bundles import save_bundle
+from pricifier.comparables import ComparablesIndex
+
+configure_text_cache(path="deployment/text_cache.sqlite3")
+
+DATA = "deployment/Airbnb_Data.csv"
 
-df = pd.read_csv("deployment/Airbnb_Data.csv").sample(500, random_state=42)
-X = df.drop(columns=["log_price"])
-y = df["log_price"]
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--train-rows", type=int, help="rows sampled for clustering and model tuning, default all")
+args = parser.parse_args()
 
-preprocessor = DataPreprocessor()
-X_processed = preprocessor.fit_transform(X)
+source = ChunkedCsv(DATA, columns=LISTING_COLUMNS + [TARGET])
+
+# Fit the preprocessor on the whole file, streamed in chunks; the target feeds the kNN price feature
+preprocessor = DataPreprocessor(n_jobs=-1)
+preprocessor.fit_chunks(source, target=TARGET)
+
+if args.train_rows:
+    df = reservoir_sample(source, args.train_rows)
+else:
+    df = pd.concat(source, ignore_index=True)
+X = df.drop(columns=[TARGET])
+y = df[TARGET]
+# Memory-mapped from the feature store; only rows not seen with this preprocessor are transformed
+X_processed = FeatureStore("deployment/feature_store").transform(preprocessor, X)
 
 print(X_processed.columns.tolist())
+print(get_text_cache().stats())
 clusterer = ClusterFit(cluster_features=cluster_features, n_clusters=3)
 cluster_labels = clusterer.fit_predict(X_processed)
 
@@ -22,11 +51,26 @@ selector = ModelPerCluster(
     model_types=model_types,
     cluster_labels=cluster_labels,
     n_trials=25,
-    timeout=300
+    timeout=300,
+    n_jobs=-1
 )
 selector.fit_cluster_models(X_processed, y, cluster_labels)
 selector.report()
 
-joblib.dump(selector, "deployment/pricifier/model.pkl")
-joblib.dump(preprocessor, "deployment/pricifier/preprocessor.pkl")
-joblib.dump(clusterer, "deployment/pricifier/clusterer.pkl")
+# Training listings served back as "similar listings" next to each prediction
+comparables = ComparablesIndex().fit(clusterer, X_processed, y, listings=X)
+
+bundle_dir = save_bundle(
+    "deployment/pricifier/bundles",
+    preprocessor, clusterer, selector,
+    comparables=comparables,
+    metadata={
+        "data": DATA,
+        "n_rows": len(X),
+        "train_rows_cap": args.train_rows,
+        "n_trials": selector.n_trials,
+        "cluster_model_types": selector.cluster_model_types,
+        "cluster_rmses": selector.cluster_rmses,
+    },
+)
+print(f"Saved bundle to {bundle_dir}")
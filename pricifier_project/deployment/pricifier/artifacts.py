@@ -0,0 +1,106 @@
+import hashlib
+import os
+import threading
+import time
+
+import joblib
+
+
+def resident_bytes():
+    """Current resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ArtifactRegistry:
+    """Lazily loaded, process-wide store for the pickled pipeline artifacts.
+
+    Each artifact is loaded with ``joblib.load`` the first time it is asked for.
+    With ``mmap_mode="r"`` the plain numpy arrays inside (centroids,
+    coefficients) are memory-mapped from the file rather than copied, so
+    workers share those pages through the OS page cache. Estimators that
+    rebuild their buffers when unpickled do not stay mapped: sklearn's
+    ``Tree.__setstate__`` copies every node array into private memory, so each
+    process holds its own copy of a forest. Those are only shared by loading
+    them before the server forks (``preload``, with gunicorn ``--preload``),
+    which leaves the copies in copy-on-write pages.
+    """
+
+    def __init__(self):
+        self._specs = {}
+        self._loaded = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, path, mmap_mode=None):
+        with self._lock:
+            self._specs[name] = (str(path), mmap_mode)
+            self._loaded.pop(name, None)
+            self._stats.pop(name, None)
+
+    def get(self, name):
+        artifact = self._loaded.get(name)
+        if artifact is not None:
+            return artifact
+        with self._lock:
+            if name not in self._loaded:
+                self._load(name)
+            return self._loaded[name]
+
+    def _load(self, name):
+        if name not in self._specs:
+            raise KeyError(f"No artifact registered under '{name}'")
+        path, mmap_mode = self._specs[name]
+        rss_before = resident_bytes()
+        started = time.perf_counter()
+        artifact = joblib.load(path, mmap_mode=mmap_mode)
+        load_seconds = time.perf_counter() - started
+        rss_after = resident_bytes()
+        self._loaded[name] = artifact
+        self._stats[name] = {
+            "path": path,
+            "mmap_mode": mmap_mode,
+            "file_bytes": os.path.getsize(path),
+            "load_seconds": load_seconds,
+            "resident_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        }
+
+    def set(self, name, artifact):
+        """Install an already loaded artifact, e.g. one fitted in-process."""
+        with self._lock:
+            self._loaded[name] = artifact
+            self._stats[name] = {"path": None, "mmap_mode": None, "file_bytes": None,
+                                 "load_seconds": 0.0, "resident_bytes": None}
+
+    def preload(self, *names):
+        for name in names or list(self._specs):
+            self.get(name)
+
+    def is_registered(self, name):
+        return name in self._specs or name in self._loaded
+
+    def is_loaded(self, name):
+        return name in self._loaded
+
+    def fingerprint(self):
+        """Short hash of the registered files' paths, sizes and modification times."""
+        digest = hashlib.blake2b(digest_size=8)
+        with self._lock:
+            specs = sorted(self._specs.items())
+        for name, (path, _) in specs:
+            try:
+                stat = os.stat(path)
+                digest.update(f"{name}:{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+            except OSError:
+                digest.update(f"{name}:{path}:missing;".encode())
+        return digest.hexdigest()
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+registry = ArtifactRegistry()
@@ -0,0 +1,135 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import pandas as pd
+
+from .profiling import profiler
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-listing predictions into one batched call.
+
+    Callers ``submit`` a dict of cleaned form data and get a ``Future``. A
+    background thread takes every request already queued. A lone request is
+    run at once; when others were waiting with it, the thread keeps
+    collecting until ``max_batch_size`` requests are queued or the oldest one
+    has waited ``max_wait_ms``. It then runs ``predict_fn`` once on
+    ``collate`` of the queued rows (by default a DataFrame of the whole
+    batch). ``predict_fn`` must return a tuple of sequences aligned with the
+    rows it was given, such as ``(prices, cluster_labels)``; each caller gets
+    the tuple of its own row's values.
+    Stage timings of the batch are credited to the profiler trace each
+    caller had open when it submitted. Any error while running a batch is set
+    on every caller still waiting, and ``predict`` gives up after
+    ``timeout_seconds``, so a bad batch never leaves a request hanging.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5, collate=pd.DataFrame, timeout_seconds=30):
+        self.predict_fn = predict_fn
+        self.collate = collate
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.timeout = timeout_seconds
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self.batches = 0
+        self.requests = 0
+        self.max_batch_seen = 0
+        self.total_queue_delay = 0.0
+        self.max_queue_delay = 0.0
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so each worker process starts its own.
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="pricifier-batcher", daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def submit(self, row):
+        future = Future()
+        self._queue.put((row, future, time.perf_counter(), profiler.current()))
+        self._ensure_worker()
+        return future
+
+    def predict(self, row, timeout=None):
+        return self.submit(row).result(self.timeout if timeout is None else timeout)
+
+    def _drain(self, batch):
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        self._drain(batch)
+        if len(batch) == 1:
+            # Nothing else is waiting, e.g. on a sync worker, so do not hold the request
+            return batch
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._run_batch(batch)
+            except Exception as exc:
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+
+    def _run_batch(self, batch):
+        started = time.perf_counter()
+        with profiler.trace("batch") as timings:
+            try:
+                outputs, error = self.predict_fn(self.collate([row for row, _, _, _ in batch])), None
+            except Exception as exc:
+                outputs, error = None, exc
+        for _, _, enqueued, trace in batch:
+            profiler.merge(trace, dict(timings, batch_wait=started - enqueued))
+        self._record(batch, started)
+        if error is not None:
+            raise error
+        results = list(zip(*outputs))
+        if len(results) != len(batch):
+            raise ValueError(f"predict_fn returned {len(results)} results for a batch of {len(batch)}")
+        for (_, future, _, _), values in zip(batch, results):
+            future.set_result(values)
+
+    def _record(self, batch, started):
+        delays = [started - enqueued for _, _, enqueued, _ in batch]
+        with self._lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.total_queue_delay += sum(delays)
+            self.max_queue_delay = max(self.max_queue_delay, max(delays))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "mean_queue_delay_ms": 1000 * self.total_queue_delay / self.requests if self.requests else 0.0,
+                "max_queue_delay_ms": 1000 * self.max_queue_delay,
+                "queue_depth": self._queue.qsize(),
+            }
@@ -0,0 +1,355 @@
+import json
+import os
+import platform
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import Ridge
+
+from .comparables import ComparablesIndex
+from .compiled import compile_model_per_cluster
+from .model import ClusterFit, ModelPerCluster, cluster_features
+from .preprocessor import DataPreprocessor
+from .text_cache import configure_text_cache
+from .whatif import price_grid, validate_grid
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "machine_learning", "airbnb_sample.csv")
+SIZES = (1000, 10000, 100000)
+# Clusterer and models are always fit on this many rows, so inference timings compare across sizes
+TRAIN_ROWS = 1000
+TOLERANCE = 0.25
+
+ROOM_TYPES = {0: "Private room", 1: "Entire home/apt", 2: "Shared room"}
+BED_TYPES = {5: "Real Bed", 4: "Futon", 3: "Pull-out Sofa", 2: "Airbed", 1: "Couch"}
+CANCELLATION_POLICIES = ["flexible", "moderate", "strict", "super_strict_30"]
+DESCRIPTION_PARTS = [
+    "Cozy studio in downtown", "Bright apartment with great lighting", "Quiet room near the park",
+    "Spacious family home", "Charming brownstone", "Small but clean room", "Modern loft",
+    "steps from the subway.", "close to great restaurants.", "with amazing views!", "on a noisy street.",
+    "with free parking.", "near the beach.", "in a safe neighborhood.", "Fast WiFi and a big desk.",
+    "Shared bathroom.", "Perfect for families.", "Not suitable for pets.", "Lovely garden.",
+    "Check-in is easy.", "Walls are thin.", "Host lives on site.", "Recently renovated kitchen.",
+]
+
+# Columns of airbnb_sample.csv that are amenity flags rather than listing attributes
+NON_AMENITY_COLUMNS = {
+    "log_price", "room_type", "accommodates", "bathrooms", "bed_type", "cleaning_fee", "host_has_profile_pic",
+    "host_identity_verified", "host_response_rate", "instant_bookable", "latitude", "longitude",
+    "number_of_reviews", "review_scores_rating", "beds", "review_gap_days", "n_amenities", "sentiment",
+    "objectivity", "description_score", "luxury_policy_flag", "city_value_score", "city_expense_score",
+    "days_between_reviews", "host_tenure", "distance_to_city_center", "amenity_score_normalized", "city",
+}
+
+
+def raw_listings(n, sample=SAMPLE, seed=0):
+    """``n`` raw listings shaped like Airbnb_Data.csv, resampled from the processed sample.
+
+    airbnb_sample.csv holds model features rather than raw listings, so each
+    row is decoded back to raw fields: codes to labels, amenity columns to an
+    amenity set, review gaps to dates. Coordinates are jittered by up to
+    ~500 m and every listing gets its own generated description, so scaled-up
+    frames are not just repeats that caches could serve.
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.read_csv(sample)
+    rows = df.iloc[rng.integers(0, len(df), n)].reset_index(drop=True)
+    amenity_columns = [col for col in df.columns if col not in NON_AMENITY_COLUMNS]
+    flags = rows[amenity_columns].to_numpy() > 0
+    amenities = ["{" + ",".join(f'"{name}"' for name, present in zip(amenity_columns, row) if present) + "}"
+                 for row in flags]
+    parts = rng.integers(0, len(DESCRIPTION_PARTS), (n, 3))
+    descriptions = [" ".join(DESCRIPTION_PARTS[i] for i in row) + f" Listing {j}." for j, row in enumerate(parts)]
+    host_since = pd.Timestamp("2010-01-01") + pd.to_timedelta(rng.integers(0, 2000, n), unit="D")
+    first_review = host_since + pd.to_timedelta(rng.integers(0, 400, n), unit="D")
+    last_review = first_review + pd.to_timedelta(rows["review_gap_days"].clip(lower=0).to_numpy(), unit="D")
+
+    return pd.DataFrame({
+        "id": np.arange(n),
+        "room_type": rows["room_type"].map(ROOM_TYPES),
+        "amenities": amenities,
+        "accommodates": rows["accommodates"],
+        "bathrooms": rows["bathrooms"],
+        "bed_type": rows["bed_type"].map(BED_TYPES),
+        "cancellation_policy": rng.choice(CANCELLATION_POLICIES, n),
+        "cleaning_fee": rows["cleaning_fee"].astype(bool),
+        "city": rows["city"],
+        "description": descriptions,
+        "first_review": first_review.strftime("%Y-%m-%d"),
+        "host_has_profile_pic": np.where(rows["host_has_profile_pic"] == 1, "t", "f"),
+        "host_identity_verified": np.where(rows["host_identity_verified"] == 1, "t", "f"),
+        "host_response_rate": rows["host_response_rate"].round().astype(int).astype(str) + "%",
+        "host_since": host_since.strftime("%Y-%m-%d"),
+        "instant_bookable": np.where(rows["instant_bookable"] == 1, "t", "f"),
+        "last_review": last_review.strftime("%Y-%m-%d"),
+        "latitude": rows["latitude"] + rng.uniform(-0.005, 0.005, n),
+        "longitude": rows["longitude"] + rng.uniform(-0.005, 0.005, n),
+        "neighbourhood": "Somewhere",
+        "number_of_reviews": rows["number_of_reviews"],
+        "review_scores_rating": rows["review_scores_rating"],
+        "thumbnail_url": "https://example.com/listing.jpg",
+        "zipcode": "00000",
+        "bedrooms": np.maximum(rows["beds"] - 1, 0),
+        "beds": rows["beds"],
+        "log_price": rows["log_price"],
+    })
+
+
+def form_data(listing):
+    """The ``PredictForm`` fields of one raw listing."""
+    amenities = listing["amenities"].strip("{}").replace('"', "")
+    return {
+        "room_type": listing["room_type"], "accommodates": int(listing["accommodates"]),
+        "beds": int(listing["beds"]), "latitude": float(listing["latitude"]),
+        "longitude": float(listing["longitude"]), "city": listing["city"],
+        "description": listing["description"], "amenities": amenities.replace(",", ", "),
+    }
+
+
+def fresh_text_cache():
+    # Every measurement starts cold, so a run never benefits from texts scored by an earlier one
+    configure_text_cache(maxsize=50000, path=None)
+
+
+def timed(func, repeats=1):
+    """Wall-clock seconds of each of ``repeats`` calls to ``func``."""
+    timings = []
+    for _ in range(repeats):
+        fresh_text_cache()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def peak_memory(func):
+    """Peak bytes allocated through Python and numpy while ``func`` runs (tracemalloc)."""
+    fresh_text_cache()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def latency_stats(seconds):
+    ms = 1000 * np.asarray(seconds)
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), "max_ms": float(ms.max())}
+
+
+def fit_models(X, y, labels, n_clusters):
+    """One model family per cluster, so tree and linear predict paths are all timed."""
+    families = [
+        lambda: RandomForestRegressor(n_estimators=100, max_depth=12, random_state=0),
+        lambda: GradientBoostingRegressor(n_estimators=100, max_depth=4, random_state=0),
+        lambda: Ridge(),
+    ]
+    model = ModelPerCluster(X.columns.tolist(), {}, labels)
+    for cluster_id in range(n_clusters):
+        mask = labels == cluster_id
+        model.cluster_models[cluster_id] = families[cluster_id % len(families)]().fit(X[mask], y[mask])
+        model.cluster_model_types[cluster_id] = type(model.cluster_models[cluster_id]).__name__
+    return model
+
+
+class Benchmark:
+    """Runs the pipeline benchmarks for one data size and collects their results.
+
+    Each result is keyed ``"<name>@<rows>"`` and holds ``seconds`` (the best
+    of ``repeats`` runs), ``rows_per_second`` and, with ``track_memory``,
+    ``peak_bytes`` from a separate tracemalloc run so tracing never skews the
+    timings. Single-row benchmarks report latency percentiles instead.
+    """
+
+    def __init__(self, repeats=3, latency_calls=100, track_memory=True, view_requests=200, view_clients=8,
+                 sample=SAMPLE, log=print):
+        self.repeats = repeats
+        self.latency_calls = latency_calls
+        self.track_memory = track_memory
+        self.view_requests = view_requests
+        self.view_clients = view_clients
+        self.sample = sample
+        self.log = log
+        self.results = {}
+
+    def record(self, name, n, func, repeats=None):
+        timings = timed(func, repeats or self.repeats)
+        result = {"seconds": min(timings), "rows_per_second": n / min(timings)}
+        if self.track_memory:
+            result["peak_bytes"] = peak_memory(func)
+        self.results[f"{name}@{n}"] = result
+        self.log(f"{name}@{n}: {format_result(result)}")
+        return result
+
+    def record_latency(self, name, n, func):
+        func()
+        calls = []
+        for _ in range(self.latency_calls):
+            started = time.perf_counter()
+            func()
+            calls.append(time.perf_counter() - started)
+        result = latency_stats(calls)
+        self.results[f"{name}@{n}"] = result
+        self.log(f"{name}@{n}: {format_result(result)}")
+        return result
+
+    def run(self, n):
+        raw = raw_listings(n, sample=self.sample)
+        y = raw.pop("log_price")
+
+        outputs = {}
+        # Fitting takes minutes at the largest sizes, so it is timed once
+        self.record("preprocessor_fit", n, lambda: outputs.update(preprocessor=DataPreprocessor().fit(raw)),
+                    repeats=1)
+        preprocessor = outputs["preprocessor"]
+        self.record("preprocessor_transform", n, lambda: outputs.update(X=preprocessor.transform(raw)))
+        X = outputs["X"]
+        self.record_latency("preprocessor_transform_row", n, lambda: preprocessor.transform(raw.iloc[[0]]))
+        listing = raw.iloc[0].to_dict()
+        self.record_latency("preprocessor_transform_one", n, lambda: preprocessor.transform_one(listing))
+        latitude, longitude = [listing["latitude"]], [listing["longitude"]]
+        self.record_latency("geo_features_row", n, lambda: preprocessor.geo_index.features(latitude, longitude))
+
+        train = slice(0, min(n, TRAIN_ROWS))
+        clusterer = ClusterFit(cluster_features=cluster_features, n_clusters=3)
+        clusterer.fit(X.iloc[train])
+        labels = clusterer.predict(X)
+        self.record("cluster_predict", n, lambda: clusterer.predict(X))
+        self.record_latency("cluster_predict_row", n, lambda: clusterer.predict(X.iloc[[0]]))
+
+        model = fit_models(X.iloc[train], y.iloc[train], labels[train], clusterer.n_clusters)
+        self.record("model_predicts", n, lambda: model.predicts(X, labels))
+        self.record_latency("model_predicts_row", n, lambda: model.predicts(X.iloc[[0]], labels[:1]))
+        compiled = compile_model_per_cluster(model)
+        self.record("compiled_predicts", n, lambda: compiled.predicts(X, labels))
+        self.record_latency("compiled_predicts_row", n, lambda: compiled.predicts(X.iloc[[0]], labels[:1]))
+
+        comparables = ComparablesIndex().fit(clusterer, X, y, listings=raw)
+        self.record_latency("comparables_query_row", n, lambda: comparables.query(X.iloc[[0]]))
+        # 10 guest counts x every room type x 144 nearby locations, served through the compiled model
+        room_types = list(preprocessor.encoders["mapping"]["room_type"])
+        offsets = [[north, east] for north in np.linspace(-2, 2, 12) for east in np.linspace(-2, 2, 12)]
+        grid = validate_grid({"accommodates": list(range(1, 11)), "room_type": room_types, "offset_km": offsets},
+                             room_types, 10 * len(room_types) * len(offsets))
+        self.record_latency("whatif_grid", n, lambda: price_grid(preprocessor, clusterer, compiled, listing, grid))
+
+        if self.view_requests:
+            self.run_view(n, preprocessor, clusterer, model, raw)
+        return self.results
+
+    def run_view(self, n, preprocessor, clusterer, model, raw):
+        """``predict_view`` end to end through the Django test client, from ``view_clients`` threads.
+
+        Needs ``django.test.utils.setup_test_environment()`` outside the test runner.
+        """
+        from django.test import Client
+        from django.urls import reverse
+        from .artifacts import ArtifactRegistry
+        from .bundles import ModelBundle
+        from . import views
+
+        artifacts = ArtifactRegistry()
+        for name, artifact in (("preprocessor", preprocessor), ("clusterer", clusterer), ("model", model)):
+            artifacts.set(name, artifact)
+        previous = views.bundles.current()
+        views.bundles.set(ModelBundle(f"benchmark-{n}", artifacts,
+                                      compile_model=views.artifact_config.get("COMPILED_MODEL", False)))
+        forms = [form_data(listing) for listing in raw.iloc[:self.view_requests].to_dict("records")]
+        local = threading.local()
+
+        def post(data):
+            client = getattr(local, "client", None)
+            if client is None:
+                client = local.client = Client()
+            started = time.perf_counter()
+            response = client.post(reverse("polls:predict"), data)
+            if response.status_code != 200:
+                raise RuntimeError(f"predict_view returned {response.status_code}")
+            return time.perf_counter() - started
+
+        try:
+            post(forms[0])
+            fresh_text_cache()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(self.view_clients) as pool:
+                latencies = list(pool.map(post, forms))
+            elapsed = time.perf_counter() - started
+        finally:
+            views.bundles.set(previous)
+        result = dict(latency_stats(latencies), requests_per_second=len(forms) / elapsed,
+                      clients=self.view_clients)
+        self.results[f"predict_view@{n}"] = result
+        self.log(f"predict_view@{n}: {format_result(result)}")
+        return result
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def format_result(result):
+    parts = []
+    for key, value in result.items():
+        if key.endswith("_bytes"):
+            parts.append(f"{key[:-6]}={value / 2 ** 20:.1f}MiB")
+        elif isinstance(value, float):
+            parts.append(f"{key}={value:.4g}")
+        else:
+            parts.append(f"{key}={value}")
+    return " ".join(parts)
+
+
+# Metrics where a larger value is a regression; throughputs regress when they shrink
+LOWER_IS_BETTER = ("seconds", "p50_ms", "p95_ms", "p99_ms", "peak_bytes")
+HIGHER_IS_BETTER = ("rows_per_second", "requests_per_second")
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Regressions of ``results`` against ``baseline`` results beyond ``tolerance`` (0.25 = 25%).
+
+    Returns a list of ``(benchmark, metric, baseline value, current value,
+    ratio)``, with the ratio oriented so that above ``1 + tolerance`` is worse.
+    Benchmarks or metrics missing from either side are skipped.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if metric not in current or not previous.get(metric):
+                continue
+            if metric in LOWER_IS_BETTER:
+                ratio = current[metric] / previous[metric]
+            else:
+                ratio = previous[metric] / current[metric] if current[metric] else float("inf")
+            if ratio > 1 + tolerance:
+                regressions.append((name, metric, previous[metric], current[metric], ratio))
+    return regressions
+
+
+def save_baseline(path, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
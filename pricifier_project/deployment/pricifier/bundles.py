@@ -0,0 +1,236 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+import joblib
+import sklearn
+
+from .artifacts import ArtifactRegistry
+from .compiled import compile_model_per_cluster
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_NAMES = ("preprocessor", "clusterer", "model")
+# Saved only when given, e.g. the ComparablesIndex of similar training listings
+OPTIONAL_ARTIFACT_NAMES = ("comparables",)
+CURRENT_POINTER = "CURRENT"
+MANIFEST = "manifest.json"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BundleError(Exception):
+    pass
+
+
+class ModelBundle:
+    """One training run's preprocessor, clusterer and per-cluster models, served together.
+
+    With ``compile_model`` the per-cluster models are served through
+    ``CompiledModelPerCluster``, built once on first use, which predicts small
+    batches from numpy arrays and hands large ones to sklearn.
+    """
+
+    def __init__(self, version, artifacts, manifest=None, compile_model=False):
+        self.version = version
+        self.artifacts = artifacts
+        self.manifest = manifest or {}
+        self.compile_model = compile_model
+        self._compiled_model = None
+
+    @property
+    def preprocessor(self):
+        return self.artifacts.get("preprocessor")
+
+    @property
+    def clusterer(self):
+        return self.artifacts.get("clusterer")
+
+    @property
+    def model(self):
+        if not self.compile_model:
+            return self.artifacts.get("model")
+        if self._compiled_model is None:
+            self._compiled_model = compile_model_per_cluster(self.artifacts.get("model"))
+        return self._compiled_model
+
+    @property
+    def comparables(self):
+        if not self.artifacts.is_registered("comparables"):
+            return None
+        return self.artifacts.get("comparables")
+
+
+def save_bundle(root, preprocessor, clusterer, model, metadata=None, version=None, comparables=None):
+    """Write a new bundle directory under ``root`` and point ``CURRENT`` at it.
+
+    The bundle is assembled in a temporary directory and renamed into place, and
+    the pointer is swapped with ``os.replace``, so readers never see a partial
+    bundle. Existing versions are never rewritten, which keeps memory-mapped
+    arrays of running workers valid.
+    """
+    version = version or datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    os.makedirs(root, exist_ok=True)
+    final_dir = os.path.join(root, version)
+    if os.path.exists(final_dir):
+        raise BundleError(f"Bundle version '{version}' already exists in {root}")
+
+    tmp_dir = os.path.join(root, f".tmp-{version}-{os.getpid()}")
+    os.makedirs(tmp_dir)
+    try:
+        checksums = {}
+        artifacts = dict(zip(ARTIFACT_NAMES, (preprocessor, clusterer, model)))
+        if comparables is not None:
+            artifacts["comparables"] = comparables
+        for name, artifact in artifacts.items():
+            path = os.path.join(tmp_dir, f"{name}.pkl")
+            joblib.dump(artifact, path)
+            checksums[f"{name}.pkl"] = file_sha256(path)
+
+        manifest = {
+            "version": version,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "sklearn_version": sklearn.__version__,
+            "feature_names": list(getattr(model, "features", [])),
+            "cluster_features": list(getattr(clusterer, "cluster_features", [])),
+            "n_clusters": getattr(clusterer, "n_clusters", None),
+            "checksums": checksums,
+            "metadata": metadata or {},
+        }
+        with open(os.path.join(tmp_dir, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2, default=str)
+        os.rename(tmp_dir, final_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    pointer_tmp = os.path.join(root, f".{CURRENT_POINTER}-{os.getpid()}")
+    with open(pointer_tmp, "w") as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(root, CURRENT_POINTER))
+    return final_dir
+
+
+def read_current_version(root):
+    try:
+        with open(os.path.join(root, CURRENT_POINTER)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_bundle(path, mmap_mode=None, verify=True, compile_model=False):
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    artifacts = ArtifactRegistry()
+    optional = [name for name in OPTIONAL_ARTIFACT_NAMES if f"{name}.pkl" in manifest["checksums"]]
+    for name in ARTIFACT_NAMES + tuple(optional):
+        artifact_path = os.path.join(path, f"{name}.pkl")
+        if verify:
+            expected = manifest["checksums"].get(f"{name}.pkl")
+            if expected != file_sha256(artifact_path):
+                raise BundleError(f"Checksum mismatch for {artifact_path}")
+        artifacts.register(name, artifact_path, mmap_mode=mmap_mode)
+    artifacts.preload()
+    bundle = ModelBundle(manifest["version"], artifacts, manifest, compile_model=compile_model)
+    bundle.model
+    return bundle
+
+
+class BundleRegistry:
+    """Serves the current bundle and hot-swaps in new ones without a restart.
+
+    ``current()`` checks the ``CURRENT`` pointer at most every
+    ``poll_seconds``. When it names a new version, that bundle is loaded and
+    verified on a background thread while requests keep using the old one; the
+    swap is a single reference assignment, so a request that already holds a
+    bundle finishes on it. If no bundle has been published, ``fallback`` (a
+    callable returning a ``ModelBundle``) is served instead.
+    """
+
+    def __init__(self, root, mmap_mode=None, poll_seconds=30, fallback=None, compile_model=False):
+        self.root = str(root)
+        self.mmap_mode = mmap_mode
+        self.compile_model = compile_model
+        self.poll_seconds = poll_seconds
+        self.fallback = fallback
+        self._bundle = None
+        self._lock = threading.Lock()
+        self._loader = None
+        self._last_poll = time.monotonic()
+        self.swaps = 0
+        self.last_error = None
+
+    def current(self):
+        if self._bundle is None:
+            with self._lock:
+                if self._bundle is None:
+                    self._bundle = self._initial_bundle()
+        elif self.poll_seconds is not None and time.monotonic() - self._last_poll >= self.poll_seconds:
+            self._last_poll = time.monotonic()
+            version = read_current_version(self.root)
+            if version is not None and version != self._bundle.version:
+                self.reload(version)
+        return self._bundle
+
+    def _initial_bundle(self):
+        self._last_poll = time.monotonic()
+        version = read_current_version(self.root)
+        if version is not None:
+            return load_bundle(os.path.join(self.root, version), mmap_mode=self.mmap_mode,
+                               compile_model=self.compile_model)
+        if self.fallback is None:
+            raise BundleError(f"No bundle published in {self.root}")
+        return self.fallback()
+
+    def set(self, bundle):
+        self._bundle = bundle
+
+    def reload(self, version=None, wait=False):
+        """Load ``version`` (default: the ``CURRENT`` pointer) in the background and swap it in."""
+        with self._lock:
+            if self._loader is not None and self._loader.is_alive():
+                loader = self._loader
+            else:
+                loader = threading.Thread(target=self._load_and_swap, args=(version,),
+                                          name="pricifier-bundle-loader", daemon=True)
+                self._loader = loader
+                loader.start()
+        if wait:
+            loader.join()
+        return loader
+
+    def _load_and_swap(self, version):
+        version = version or read_current_version(self.root)
+        try:
+            bundle = load_bundle(os.path.join(self.root, version), mmap_mode=self.mmap_mode,
+                               compile_model=self.compile_model)
+        except Exception as exc:
+            self.last_error = f"{version}: {exc}"
+            logger.exception("Failed to load model bundle %s", version)
+            return
+        self._bundle = bundle
+        self.swaps += 1
+        self.last_error = None
+        logger.info("Swapped in model bundle %s", version)
+
+    def stats(self):
+        bundle = self._bundle
+        return {
+            "version": bundle.version if bundle is not None else None,
+            "swaps": self.swaps,
+            "loading": self._loader is not None and self._loader.is_alive(),
+            "last_error": self.last_error,
+            "artifacts": bundle.artifacts.stats() if bundle is not None else {},
+        }
@@ -0,0 +1,121 @@
+import copy
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+from .geo import EARTH_RADIUS_KM
+
+# Listing fields returned with each comparable, when the indexed frame has them
+ATTRIBUTES = ("id", "room_type", "city", "accommodates", "bedrooms", "beds", "bathrooms")
+
+
+def unit_sphere(latitude, longitude):
+    """Latitude/longitude in degrees as points on the unit sphere."""
+    lat, lon = np.radians(latitude), np.radians(longitude)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+class ComparablesIndex:
+    """KD-tree of training listings for "similar listings" lookups.
+
+    Each listing is a point made of its ``cluster_features`` standardized
+    with the ``ClusterFit`` scaler, plus its location on a sphere scaled so
+    that ``geo_scale_km`` of separation weighs as much as one standard
+    deviation of a cluster feature. Queries return the ``k`` nearest training
+    listings with their prices.
+
+    Everything is held in numpy arrays (the tree's own node arrays, prices and
+    categorical codes), so a pickle loaded with ``joblib.load(...,
+    mmap_mode="r")`` is memory-mapped and shared by pre-forked workers.
+    """
+
+    def __init__(self, geo_scale_km=2.0, leaf_size=40):
+        self.geo_scale_km = geo_scale_km
+        self.leaf_size = leaf_size
+        self.scaler = None
+        self.cluster_features = None
+        self.tree = None
+        self.log_prices = None
+        self.attributes = {}
+        self.categories = {}
+        self.fill = None
+
+    def vectors(self, X):
+        """Search-space points for processed listings ``X``; missing values sit at the training mean."""
+        # StandardScaler.transform, without sklearn's per-call validation overhead
+        features = (X[self.cluster_features].to_numpy(dtype=float) - self.scaler.mean_) / self.scaler.scale_
+        geo = unit_sphere(X['latitude'].to_numpy(dtype=float), X['longitude'].to_numpy(dtype=float))
+        points = np.hstack([features, geo * (EARTH_RADIUS_KM / self.geo_scale_km)])
+        if self.fill is not None:
+            missing = np.isnan(points)
+            points[missing] = np.broadcast_to(self.fill, points.shape)[missing]
+        return points
+
+    def fit(self, clusterer, X, log_price, listings=None):
+        """Index processed listings ``X`` with the scaler of the fitted ``clusterer``.
+
+        ``listings`` is the raw frame ``X`` was transformed from; fields in
+        ``ATTRIBUTES`` are taken from it when present, else from ``X``.
+        """
+        # A copy, so refreshing an IncrementalClusterFit later cannot shift the indexed points
+        self.scaler = copy.deepcopy(clusterer.scaler)
+        self.cluster_features = list(clusterer.cluster_features)
+        self.fill = None
+        points = self.vectors(X)
+        log_price = np.asarray(log_price, dtype=float)
+        known = ~np.isnan(points).any(axis=1) & ~np.isnan(log_price)
+        self.fill = points[known].mean(axis=0)
+        self.tree = KDTree(points[known], leaf_size=self.leaf_size)
+        self.log_prices = log_price[known]
+
+        source = listings if listings is not None else X
+        self.attributes, self.categories = {}, {}
+        for name in ATTRIBUTES:
+            if name not in source.columns:
+                continue
+            values = source[name].to_numpy()[known]
+            if values.dtype == object:
+                codes, uniques = pd.factorize(values)
+                self.attributes[name] = codes.astype(np.int32)
+                self.categories[name] = list(uniques)
+            else:
+                self.attributes[name] = values
+        return self
+
+    def query(self, X, k=5):
+        """The ``k`` most similar training listings for each row of processed ``X``.
+
+        Returns one list per row of dicts holding the listing ``ATTRIBUTES``,
+        its ``price``, the ``similarity_distance`` in the search space and the
+        great-circle ``distance_km``.
+        """
+        if len(X) == 0 or k <= 0:
+            return [[] for _ in range(len(X))]
+        k = min(k, len(self.log_prices))
+        points = self.vectors(X)
+        distances, indices = self.tree.query(points, k=k)
+
+        # Only the k neighbours' rows of the (possibly memory-mapped) tree data are read
+        geo = slice(len(self.cluster_features), None)
+        neighbours = self.tree.get_arrays()[0][indices.ravel(), geo].reshape(*indices.shape, -1)
+        chord = np.linalg.norm(neighbours - points[:, None, geo], axis=2) * (self.geo_scale_km / EARTH_RADIUS_KM)
+        distance_km = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+        prices = np.round(np.exp(self.log_prices[indices]), 2)
+
+        columns = {}
+        for name, values in self.attributes.items():
+            picked = values[indices]
+            if name in self.categories:
+                picked = np.asarray(self.categories[name], dtype=object)[picked]
+            columns[name] = picked.tolist()
+        results = []
+        for row in range(len(points)):
+            results.append([
+                dict({name: values[row][j] for name, values in columns.items()},
+                     price=float(prices[row, j]),
+                     similarity_distance=float(distances[row, j]),
+                     distance_km=float(distance_km[row, j]))
+                for j in range(k)
+            ])
+        return results
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .profiling import profiler
+
+
+class ExecutorFull(Exception):
+    """Raised by ``BoundedExecutor.submit`` when every worker and queue slot is taken."""
+
+
+class BoundedExecutor:
+    """Thread pool for CPU-bound inference with a hard cap on queued work.
+
+    At most ``max_workers`` calls run at once and at most ``max_queue`` more
+    wait for a worker; ``submit`` raises ``ExecutorFull`` instead of queueing
+    beyond that, so callers can shed load rather than let latency grow without
+    bound. ``run`` awaits a call from async code without blocking the event
+    loop. Stage timings of each call are credited to the profiler trace of
+    the submitting request.
+
+    Threads rather than processes: each worker shares the process's loaded
+    bundle and hot swaps, and the heavy numpy, sklearn and pandas work
+    releases the GIL for much of its time.
+    """
+
+    def __init__(self, max_workers=4, max_queue=64):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="pricifier-inference")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.running = 0
+        self.max_queue_depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorFull(f"{self.in_flight} inference calls in flight")
+            self.in_flight += 1
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.in_flight - self.running)
+        trace = profiler.current()
+        enqueued = time.perf_counter()
+        try:
+            future = self._pool.submit(self._call, trace, enqueued, fn, args, kwargs)
+        except BaseException:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _call(self, trace, enqueued, fn, args, kwargs):
+        waited = time.perf_counter() - enqueued
+        with self._lock:
+            self.running += 1
+            self.total_queue_wait += waited
+            self.max_queue_wait = max(self.max_queue_wait, waited)
+        try:
+            with profiler.trace("inference") as timings:
+                return fn(*args, **kwargs)
+        finally:
+            profiler.merge(trace, dict(timings, executor_wait=waited))
+            with self._lock:
+                self.running -= 1
+
+    def _done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def stats(self):
+        with self._lock:
+            started = self.submitted - self.in_flight + self.running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queue_depth": self.in_flight - self.running,
+                "max_queue_depth": self.max_queue_depth,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "mean_queue_wait_ms": 1000 * self.total_queue_wait / started if started else 0.0,
+                "max_queue_wait_ms": 1000 * self.max_queue_wait,
+            }
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# Bump when DataPreprocessor.transform changes what it computes, so stored
+# features from the old code are never served for a new preprocessor.
+STORE_VERSION = 1
+
+FEATURES = "features.npy"
+ROW_HASHES = "row_hashes.npy"
+MANIFEST = "manifest.json"
+
+
+def preprocessor_key(preprocessor):
+    """Stable hash of a fitted preprocessor's class, params and fitted state."""
+    state = {name: value for name, value in vars(preprocessor).items() if name not in ("analyzer", "_single_plan")}
+    cls = type(preprocessor)
+    return joblib.hash((STORE_VERSION, cls.__module__, cls.__qualname__, state))[:16]
+
+
+def row_hashes(X):
+    """One uint64 per row of raw inputs; equal rows hash equal whatever the column order."""
+    return pd.util.hash_pandas_object(X[sorted(X.columns)], index=False).to_numpy()
+
+
+def data_fingerprint(hashes):
+    return hashlib.blake2b(np.ascontiguousarray(hashes).tobytes(), digest_size=16).hexdigest()
+
+
+class FeatureStore:
+    """Transformed feature matrices on disk, memory-mapped back without copying.
+
+    Entries live under ``root/<preprocessor key>/<data fingerprint>/`` as a
+    float64 ``features.npy``, the raw-row hashes it was computed from, and a
+    manifest with the column names. ``transform`` serves an existing entry
+    straight from the page cache; for new data it reuses the rows of the
+    newest entry with the same preprocessor whose raw inputs are unchanged and
+    only runs ``preprocessor.transform`` on the rest. That is valid because
+    ``transform`` computes each row independently of the rest of the batch.
+    """
+
+    def __init__(self, root):
+        self.root = str(root)
+
+    def transform(self, preprocessor, X):
+        hashes = row_hashes(X)
+        entry_root = os.path.join(self.root, preprocessor_key(preprocessor))
+        path = os.path.join(entry_root, data_fingerprint(hashes))
+        if not os.path.exists(path):
+            features, columns, recomputed = self._compute(preprocessor, X, hashes, self._latest(entry_root))
+            self._write(path, features, columns, hashes, recomputed)
+        return self.load(path, index=X.index)
+
+    def load(self, path, index=None):
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        features = np.load(os.path.join(path, FEATURES), mmap_mode="r")
+        return pd.DataFrame(features, columns=manifest["columns"], index=index, copy=False)
+
+    def _latest(self, entry_root):
+        if not os.path.isdir(entry_root):
+            return None
+        entries = [os.path.join(entry_root, name) for name in os.listdir(entry_root) if not name.startswith(".")]
+        return max(entries, key=os.path.getmtime, default=None)
+
+    def _compute(self, preprocessor, X, hashes, previous):
+        """Feature rows for ``X``, copied from ``previous`` where the raw row is unchanged."""
+        missing = np.ones(len(X), dtype=bool)
+        features = columns = None
+
+        old_hashes = np.load(os.path.join(previous, ROW_HASHES)) if previous is not None else np.empty(0, np.uint64)
+        if len(old_hashes):
+            order = np.argsort(old_hashes, kind="stable")
+            found = np.minimum(np.searchsorted(old_hashes, hashes, sorter=order), len(order) - 1)
+            matched = old_hashes[order[found]] == hashes
+            if matched.any():
+                old = self.load(previous)
+                columns = old.columns.tolist()
+                features = np.empty((len(X), len(columns)))
+                features[matched] = old.to_numpy()[order[found[matched]]]
+                missing = ~matched
+
+        if missing.any():
+            fresh = preprocessor.transform(X[missing])
+            if columns is None:
+                columns = fresh.columns.tolist()
+                features = np.empty((len(X), len(columns)))
+            features[missing] = fresh[columns].to_numpy(dtype=np.float64)
+        if features is None:
+            features, columns = np.empty((0, 0)), []
+        return features, columns, int(missing.sum())
+
+    def _write(self, path, features, columns, hashes, recomputed):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_dir = os.path.join(os.path.dirname(path), f".tmp-{os.path.basename(path)}-{os.getpid()}")
+        os.makedirs(tmp_dir)
+        try:
+            np.save(os.path.join(tmp_dir, FEATURES), features)
+            np.save(os.path.join(tmp_dir, ROW_HASHES), hashes)
+            with open(os.path.join(tmp_dir, MANIFEST), "w") as f:
+                json.dump({
+                    "columns": columns,
+                    "n_rows": int(len(hashes)),
+                    "recomputed_rows": recomputed,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                }, f, indent=2)
+            os.rename(tmp_dir, path)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            # Another process may have written the same entry first
+            if not os.path.exists(path):
+                raise
@@ -0,0 +1,106 @@
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+EARTH_RADIUS_KM = 6371.0
+# Points closer than this to a query count as the query listing itself
+SAME_LOCATION_KM = 1e-6
+
+
+def masked_median(values, mask, fallback):
+    """Row medians of ``values`` where ``mask`` holds, ``fallback`` for rows with none."""
+    n = mask.sum(axis=1)
+    ordered = np.sort(np.where(mask, values, np.inf), axis=1)
+    rows = np.arange(len(values))
+    lower = ordered[rows, np.maximum(n - 1, 0) // 2]
+    upper = ordered[rows, n // 2]
+    return np.where(n > 0, (lower + upper) / 2, fallback)
+
+
+class GeoIndex:
+    """Haversine ``BallTree`` over training listing coordinates and their log prices.
+
+    ``features`` answers per listing, so the values never depend on what else
+    is in the batch. A training listing is never its own neighbour: points
+    within ``SAME_LOCATION_KM`` of the query are left out, which keeps the kNN
+    price from leaking a row's own target when the training set is
+    transformed, even after coordinates went through a CSV round trip.
+
+    Pickles hold the indexed points rather than the tree: ``BallTree`` bumps
+    internal counters on every query, which would make ``transform`` change
+    the pickled preprocessor. The tree is rebuilt when unpickled.
+    """
+
+    def __init__(self, radius_km=1.0, k=10):
+        self.radius_km = radius_km
+        self.k = k
+        self.points = None
+        self.tree = None
+        self.log_prices = None
+        self.global_median = np.nan
+
+    def fit(self, latitude, longitude, log_price=None):
+        coords = np.column_stack([np.asarray(latitude, dtype=float), np.asarray(longitude, dtype=float)])
+        known = ~np.isnan(coords).any(axis=1)
+        if log_price is not None:
+            log_price = np.asarray(log_price, dtype=float)
+            known &= ~np.isnan(log_price)
+            self.log_prices = log_price[known]
+            self.global_median = float(np.median(self.log_prices)) if known.any() else np.nan
+        self.points = np.radians(coords[known])
+        self.tree = BallTree(self.points, metric="haversine")
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["tree"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.tree = BallTree(self.points, metric="haversine")
+
+    def features(self, latitude, longitude):
+        """Per-listing neighbourhood features from the fitted index, as a DataFrame.
+
+        ``neighbors_within_radius`` counts training listings within
+        ``radius_km``, ``knn_mean_distance_km`` is the mean distance to the
+        ``k`` nearest and, when prices were indexed, ``knn_median_log_price``
+        is the median log price of those nearest that fall within the radius
+        (the training median if none do). Missing coordinates get 0, -1 and
+        the training median.
+        """
+        return pd.DataFrame(self.feature_arrays(latitude, longitude))
+
+    def feature_arrays(self, latitude, longitude):
+        """``features`` as a dict of column name to array, without building a DataFrame."""
+        coords = np.radians(np.column_stack([np.asarray(latitude, dtype=float), np.asarray(longitude, dtype=float)]))
+        n = len(coords)
+        count = np.zeros(n)
+        median_price = np.full(n, self.global_median)
+        mean_distance = np.full(n, -1.0)
+        known = ~np.isnan(coords).any(axis=1)
+        n_points = len(self.points)
+        if known.any() and n_points:
+            query = coords[known]
+            radius = self.radius_km / EARTH_RADIUS_KM
+            # Listings sharing the query's coordinates (rounded scraped data) are all left
+            # out, so ask for that many extra neighbours to still keep the k nearest others
+            same_count = self.tree.query_radius(query, r=SAME_LOCATION_KM / EARTH_RADIUS_KM, count_only=True)
+            distances, indices = self.tree.query(query, k=min(self.k + int(same_count.max()), n_points))
+            same = distances * EARTH_RADIUS_KM <= SAME_LOCATION_KM
+            keep = ~same & (np.cumsum(~same, axis=1) <= self.k)
+            count[known] = self.tree.query_radius(query, r=radius, count_only=True) - same_count
+            # nanmean/nanmedian by hand: numpy's masked-array path costs ~0.3 ms per call on small inputs
+            kept = keep.sum(axis=1)
+            local_distance = np.where(keep, distances * EARTH_RADIUS_KM, 0.0).sum(axis=1)
+            mean_distance[known] = np.where(kept > 0, local_distance / np.maximum(kept, 1), -1.0)
+            if self.log_prices is not None:
+                in_radius = keep & (distances <= radius)
+                median_price[known] = masked_median(self.log_prices[indices], in_radius, self.global_median)
+
+        features = {"neighbors_within_radius": count, "knn_mean_distance_km": mean_distance}
+        if self.log_prices is not None:
+            features["knn_median_log_price"] = median_price
+        return features
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+TARGET = "log_price"
+
+# Raw Airbnb_Data.csv columns read for training, with explicit dtypes so every
+# chunk parses the same way. cleaning_fee is left to pandas, which reads the
+# True/False column as bool; name and property_type are never used.
+LISTING_DTYPES = {
+    "id": "int64",
+    "room_type": "object",
+    "amenities": "object",
+    "accommodates": "int64",
+    "bathrooms": "float64",
+    "bed_type": "object",
+    "cancellation_policy": "object",
+    "city": "object",
+    "description": "object",
+    "first_review": "object",
+    "host_has_profile_pic": "object",
+    "host_identity_verified": "object",
+    "host_response_rate": "object",
+    "host_since": "object",
+    "instant_bookable": "object",
+    "last_review": "object",
+    "latitude": "float64",
+    "longitude": "float64",
+    "neighbourhood": "object",
+    "number_of_reviews": "int64",
+    "review_scores_rating": "float64",
+    "thumbnail_url": "object",
+    "zipcode": "object",
+    "bedrooms": "float64",
+    "beds": "float64",
+}
+
+LISTING_COLUMNS = list(LISTING_DTYPES) + ["cleaning_fee"]
+
+
+class ChunkedCsv:
+    """Re-iterable, chunked reader for a raw listings CSV.
+
+    Each iteration re-opens the file and yields DataFrames of at most
+    ``chunksize`` rows holding only ``columns``, so memory is bounded by the
+    chunk size rather than the file size. Multi-pass consumers such as
+    ``DataPreprocessor.fit_chunks`` can iterate it more than once.
+    """
+
+    def __init__(self, path, columns=None, chunksize=50000, dtypes=None):
+        self.path = str(path)
+        self.columns = list(columns) if columns is not None else list(LISTING_COLUMNS)
+        self.chunksize = chunksize
+        self.dtypes = dict(LISTING_DTYPES, **{TARGET: "float64"}, **(dtypes or {}))
+
+    def chunks(self, columns=None, start=0):
+        """Chunks of ``columns``, beginning after the first ``start`` data rows."""
+        columns = list(columns) if columns is not None else self.columns
+        return pd.read_csv(
+            self.path,
+            usecols=columns,
+            dtype={col: dtype for col, dtype in self.dtypes.items() if col in columns},
+            chunksize=self.chunksize,
+            skiprows=range(1, start + 1) if start else None,
+        )
+
+    def __iter__(self):
+        return iter(self.chunks())
+
+
+def iter_chunks(chunks, columns):
+    """Iterate ``chunks`` restricted to ``columns``, letting a ``ChunkedCsv`` skip parsing the rest."""
+    if hasattr(chunks, "chunks"):
+        return iter(chunks.chunks(columns))
+    return (chunk[columns] for chunk in chunks)
+
+
+def reservoir_sample(chunks, k, seed=42):
+    """Uniform random sample of ``k`` rows from a stream of DataFrames, in O(k + chunk) memory.
+
+    Algorithm R, vectorized per chunk: row ``i`` of the stream replaces a
+    random reservoir slot with probability ``k / (i + 1)``.
+    """
+    rng = np.random.default_rng(seed)
+    reservoir = None
+    seen = 0
+    for chunk in chunks:
+        chunk = chunk.reset_index(drop=True)
+        if reservoir is None:
+            reservoir = chunk.iloc[:0]
+        fill = min(k - len(reservoir), len(chunk))
+        if fill > 0:
+            reservoir = pd.concat([reservoir, chunk.iloc[:fill]], ignore_index=True)
+
+        rest = chunk.iloc[fill:]
+        positions = np.arange(seen + fill, seen + len(chunk))
+        seen += len(chunk)
+        if len(rest) == 0:
+            continue
+        slots = rng.integers(0, positions + 1)
+        replacing = np.flatnonzero(slots < k)
+        if len(replacing) == 0:
+            continue
+        # When several rows of a chunk land on one slot, the last one wins, as in the sequential algorithm
+        slots = slots[replacing]
+        _, last = np.unique(slots[::-1], return_index=True)
+        keep = replacing[len(replacing) - 1 - last]
+        order = np.arange(len(reservoir))
+        order[slots[len(replacing) - 1 - last]] = len(reservoir) + np.arange(len(keep))
+        reservoir = pd.concat([reservoir, rest.iloc[keep]], ignore_index=True).iloc[order].reset_index(drop=True)
+
+    if reservoir is None:
+        return pd.DataFrame()
+    return reservoir
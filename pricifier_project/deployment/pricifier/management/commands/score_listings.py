@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pricifier.bundles import BundleError, load_bundle
+from pricifier.scoring import FORMATS, BulkScorer, ScoringError
+
+
+class Command(BaseCommand):
+    help = (
+        "Price every listing of a raw listings CSV with the current model bundle and write the prices to "
+        "CSV or Parquet. Runs resume from their checkpoint after a crash, and listings whose raw row and "
+        "bundle version are unchanged since the previous output keep their previous price."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="raw listings CSV, with the columns of Airbnb_Data.csv")
+        parser.add_argument("output", help="scores file to write, .csv or .parquet")
+        parser.add_argument("--format", choices=FORMATS, help="output format when the extension does not say")
+        parser.add_argument("--chunksize", type=int, default=50000, help="input rows scored per chunk")
+        parser.add_argument("--previous", help="earlier scores to reuse, by default the existing output")
+        parser.add_argument("--bundle", help="bundle directory to score with instead of the served bundle")
+        parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and start over")
+        parser.add_argument("--full", action="store_true", help="rescore every listing, reusing nothing")
+
+    def handle(self, *args, **options):
+        if options["chunksize"] < 1:
+            raise CommandError("--chunksize must be positive.")
+        try:
+            if options["bundle"]:
+                bundle = load_bundle(options["bundle"])
+            else:
+                from pricifier.views import bundles
+                bundle = bundles.current()
+            scorer = BulkScorer(bundle, options["input"], options["output"], fmt=options["format"],
+                                chunksize=options["chunksize"], previous=options["previous"],
+                                log=self.stdout.write)
+            summary = scorer.run(restart=options["restart"], full=options["full"])
+        except (BundleError, ScoringError, FileNotFoundError) as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {summary['rows']} prices to {options['output']} with bundle {summary['model_version']}: "
+            f"{summary['scored']} scored, {summary['reused']} unchanged"))
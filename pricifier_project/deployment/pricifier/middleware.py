@@ -0,0 +1,40 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .profiling import profiler, server_timing
+
+
+class StageTimingMiddleware:
+    """Traces each request's pipeline stages and reports them in a ``Server-Timing`` header.
+
+    Works in both the sync and async handler chains, so async views under
+    ASGI are not pushed onto a thread by a sync-only middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not profiler.enabled:
+            return self.get_response(request)
+        with profiler.trace(request.path) as trace:
+            with profiler.stage("request"):
+                response = self.get_response(request)
+        response["Server-Timing"] = server_timing(trace)
+        return response
+
+    async def __acall__(self, request):
+        if not profiler.enabled:
+            return await self.get_response(request)
+        # Inference runs on executor threads, which sample cProfile themselves
+        with profiler.trace(request.path, sample=False) as trace:
+            with profiler.stage("request"):
+                response = await self.get_response(request)
+        response["Server-Timing"] = server_timing(trace)
+        return response
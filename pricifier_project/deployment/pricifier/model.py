@@ -1,5 +1,5 @@
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.linear_model import Ridge
 from sklearn.linear_model import Lasso, ElasticNet
@@ -7,8 +7,10 @@ from sklearn.ensemble import ExtraTreesRegressor, HistGradientBoostingRegressor
 from sklearn.svm import SVR
 from sklearn.neighbors import KNeighborsRegressor
 from sklearn.neural_network import MLPRegressor
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.model_selection import KFold, cross_val_score, cross_val_predict
 from sklearn.metrics import mean_squared_error, make_scorer
+import os
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 import optuna 
@@ -47,15 +49,268 @@ class ClusterFit:
     def fit_predict(self, X):
         self.fit(X)
         return self.kmeans.predict(self.scaler.transform(X[self.cluster_features]))
-    
+
+
+class IncrementalClusterFit(ClusterFit):
+    """``ClusterFit`` that can be refreshed from new listings without refitting on the full history.
+
+    The scaler keeps running mean and variance (``StandardScaler.partial_fit``)
+    and clustering is ``MiniBatchKMeans`` with random reassignment turned off,
+    so a cluster keeps its id across updates and the per-cluster models stay
+    attached to the same segment. ``partial_fit`` moves each centroid towards
+    the new rows assigned to it, weighted by the number of rows it already
+    holds (``counts``), and returns a drift report for the chunk. The update
+    is done here on ``cluster_centers_`` rather than through
+    ``MiniBatchKMeans.partial_fit``, whose row counts are private.
+    """
+
+    def __init__(self, cluster_features, n_clusters=3, batch_size=1024):
+        super().__init__(cluster_features, n_clusters)
+        self.kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, batch_size=batch_size,
+                                      n_init=3, reassignment_ratio=0.0)
+        self.counts = np.zeros(n_clusters)
+        self.n_seen = 0
+        self.drift_history = []
+
+    def fit(self, X):
+        super().fit(X)
+        labels = self.kmeans.predict(self.scaler.transform(X[self.cluster_features]))
+        self.counts = np.bincount(labels, minlength=self.n_clusters).astype(np.float64)
+        self.n_seen = len(X)
+        self.drift_history = []
+
+    def partial_fit(self, X):
+        if not self.fitted:
+            self.fit(X)
+            return None
+
+        X_raw = X[self.cluster_features]
+        before = self.kmeans.predict(self.scaler.transform(X_raw))
+        centers_raw = self.kmeans.cluster_centers_ * self.scaler.scale_ + self.scaler.mean_
+
+        # Re-express the centroids in the updated standardization before moving them
+        self.scaler.partial_fit(X_raw)
+        previous = (centers_raw - self.scaler.mean_) / self.scaler.scale_
+        X_cluster = self.scaler.transform(X_raw)
+        self.kmeans.cluster_centers_ = previous.copy(order="C")
+        assigned = self.kmeans.predict(X_cluster)
+
+        # Each centroid becomes the mean of the rows it held and the new rows assigned to it
+        added = np.bincount(assigned, minlength=self.n_clusters).astype(np.float64)
+        sums = np.zeros_like(previous)
+        np.add.at(sums, assigned, X_cluster)
+        moved = added > 0
+        centers = previous.copy(order="C")
+        centers[moved] = (previous[moved] * self.counts[moved, None] + sums[moved]) / \
+            (self.counts[moved] + added[moved])[:, None]
+        self.kmeans.cluster_centers_ = centers
+        self.counts = self.counts + added
+        after = self.kmeans.predict(X_cluster)
+        self.n_seen += len(X)
+
+        # Shifts are in standardized units of the updated scaler
+        shift = np.linalg.norm(self.kmeans.cluster_centers_ - previous, axis=1)
+        report = {
+            "n_rows": len(X),
+            "n_seen": self.n_seen,
+            "centroid_shift": shift.tolist(),
+            "max_centroid_shift": float(shift.max()),
+            "relabeled_share": float(np.mean(before != after)),
+            "cluster_shares": (np.bincount(after, minlength=self.n_clusters) / len(X)).tolist(),
+        }
+        self.drift_history.append(report)
+        return report
+
+    def fit_chunks(self, chunks):
+        for chunk in chunks:
+            self.partial_fit(chunk)
+        return self
+
+
+def report_score(trial, value, step):
+    if trial is None:
+        return
+    trial.report(value, step)
+    if trial.should_prune():
+        raise optuna.TrialPruned()
+
+
+def growth_stages(n_estimators, n_stages):
+    return sorted({max(1, round(n_estimators * (i + 1) / n_stages)) for i in range(n_stages)})
+
+
+def seeded(model_class, params, seed):
+    """``params`` with ``random_state=seed`` when ``model_class`` takes one and it is not already set."""
+    if seed is None or "random_state" in params or "random_state" not in model_class().get_params():
+        return params
+    return dict(params, random_state=seed)
+
+
+def cross_val_rmse(model_class, params, X, y, trial=None, cv=3, n_stages=4, seed=None):
+    """K-fold RMSE of ``model_class(**params)``, reported to ``trial`` as it is computed.
+
+    Ensembles that support ``warm_start`` are grown on every fold together in
+    ``n_stages`` steps of ``n_estimators``; growth stops as soon as a step
+    fails to improve the mean fold RMSE. The running mean is reported after
+    every fold fit, so the pruner can stop a hopeless trial after a single
+    fold of its smallest ensemble. Raises ``optuna.TrialPruned`` when the
+    trial's pruner gives up on it.
+
+    Estimators that take a ``random_state`` are built with ``seed``, so a
+    trial scores the same every time it is run.
+
+    Returns ``(rmse, params, oof)``, with ``n_estimators`` in ``params`` set
+    to the size that scored best and ``oof`` the out-of-fold predictions of
+    that size.
+    """
+    folds = cv_folds(X, cv)
+    n_estimators = params.get("n_estimators")
+    oof = np.zeros(len(X))
+
+    if n_estimators is None or "warm_start" not in model_class().get_params():
+        scores = []
+        for step, (train, val) in enumerate(folds):
+            model = model_class(**seeded(model_class, params, seed)).fit(X.iloc[train], y.iloc[train])
+            oof[val] = model.predict(X.iloc[val])
+            scores.append(np.sqrt(mean_squared_error(y.iloc[val], oof[val])))
+            report_score(trial, float(np.mean(scores)), step)
+        return float(np.mean(scores)), params, oof
+
+    models = [model_class(**seeded(model_class, dict(params, warm_start=True), seed)) for _ in folds]
+    best_rmse, best_n_estimators, best_oof = float('inf'), n_estimators, oof
+    for stage_index, stage in enumerate(growth_stages(n_estimators, n_stages)):
+        scores = []
+        stage_oof = np.zeros(len(X))
+        for fold_index, (model, (train, val)) in enumerate(zip(models, folds)):
+            model.set_params(n_estimators=stage).fit(X.iloc[train], y.iloc[train])
+            stage_oof[val] = model.predict(X.iloc[val])
+            scores.append(np.sqrt(mean_squared_error(y.iloc[val], stage_oof[val])))
+            report_score(trial, float(np.mean(scores)), stage_index * len(folds) + fold_index)
+        rmse = float(np.mean(scores))
+        if rmse >= best_rmse:
+            break
+        best_rmse, best_n_estimators, best_oof = rmse, stage, stage_oof
+    return best_rmse, dict(params, n_estimators=best_n_estimators), best_oof
+
+
+def cv_folds(X, cv):
+    """The k-fold split shared by tuning, stacking and their scores."""
+    return list(KFold(n_splits=cv, shuffle=True, random_state=42).split(X))
+
+
+def tuned_params(study):
+    """Best trial's params, including any ``n_estimators`` cut short by early stopping."""
+    return dict(study.best_params, **study.best_trial.user_attrs.get("params", {}))
+
+
+def tune_model(model_class, param_space, X_cluster, y_cluster, n_trials, timeout, seed=42, cv=3):
+    """Run one pruned Optuna study for ``model_class`` on a single cluster's data.
+
+    ``seed`` seeds both the sampler and every estimator the trials fit, so a
+    study is reproducible. Returns ``(study, oof)`` where ``oof`` holds the
+    best trial's out-of-fold predictions, so stacking can reuse them instead
+    of refitting.
+    """
+    best = {}
+
+    def theobjective(trial):
+        params = param_space(trial)
+        rmse, fitted_params, oof = cross_val_rmse(model_class, params, X_cluster, y_cluster, trial=trial, cv=cv,
+                                                  seed=seed)
+        if fitted_params.get("n_estimators") != params.get("n_estimators"):
+            trial.set_user_attr("params", {"n_estimators": int(fitted_params["n_estimators"])})
+        if rmse < best.get("rmse", float('inf')):
+            best.update(rmse=rmse, number=trial.number, oof=oof)
+        return rmse
+
+    study = optuna.create_study(direction="minimize", sampler=optuna.samplers.TPESampler(seed=seed),
+                                pruner=optuna.pruners.SuccessiveHalvingPruner())
+    study.optimize(theobjective, n_trials=n_trials, timeout=timeout)
+    oof = best["oof"] if best.get("number") == study.best_trial.number else None
+    return study, oof
+
+
+def run_studies(tasks, n_jobs=1):
+    """Run ``tune_model`` for every ``(key, args)`` task and return ``{key: (study, oof)}``.
+
+    Each study has its own seeded sampler and runs its trials in order, so
+    spreading studies across a process pool gives the same best params as
+    running them one after another. ``n_jobs`` is the total worker budget;
+    ``-1`` uses every CPU.
+    """
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    if not n_jobs or n_jobs == 1 or len(tasks) < 2:
+        return {key: tune_model(*args) for key, args in tasks}
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks))) as pool:
+        futures = {key: pool.submit(tune_model, *args) for key, args in tasks}
+        return {key: future.result() for key, future in futures.items()}
+
+
+class FitCache:
+    """Fitted estimators and out-of-fold predictions keyed by ``(cluster, model, params)``.
+
+    Lets the selected single model and the stacking base models share one
+    full-cluster fit, and lets stacking reuse the out-of-fold predictions
+    already produced while tuning. Estimators are seeded like the studies.
+    """
+
+    def __init__(self, cv=3, seed=42):
+        self.cv = cv
+        self.seed = seed
+        self.fits = {}
+        self.oofs = {}
+
+    @staticmethod
+    def key(cluster_id, name, params):
+        return (cluster_id, name, tuple(sorted(params.items())))
+
+    def fit(self, cluster_id, name, model_class, params, X, y):
+        key = self.key(cluster_id, name, params)
+        if key not in self.fits:
+            self.fits[key] = model_class(**seeded(model_class, params, self.seed)).fit(X, y)
+        return self.fits[key]
+
+    def put_oof(self, cluster_id, name, params, oof):
+        if oof is not None:
+            self.oofs[self.key(cluster_id, name, params)] = oof
+
+    def oof(self, cluster_id, name, model_class, params, X, y):
+        key = self.key(cluster_id, name, params)
+        if key not in self.oofs:
+            self.oofs[key] = cross_val_predict(model_class(**seeded(model_class, params, self.seed)), X, y,
+                                               cv=cv_folds(X, self.cv))
+        return self.oofs[key]
+
+
+def stack_prefit(base_models, oof, X, y, seed=42):
+    """A fitted ``StackingRegressor`` from already fitted base models and their out-of-fold predictions.
+
+    This is what ``StackingRegressor.fit`` builds with a k-fold ``cv``: base
+    models fitted on all rows and a final Ridge fitted on their out-of-fold
+    predictions, without training the base models again.
+    """
+    stacked_model = StackingRegressor(estimators=base_models, final_estimator=Ridge(random_state=seed), cv="prefit")
+    stacked_model.fit(X, y)
+    stacked_model.final_estimator_ = Ridge(random_state=seed).fit(oof, y)
+    return stacked_model
+
 
 class ModelPerCluster:
-    def __init__(self, features, model_types, cluster_labels, n_trials=30, timeout=300):
+    # Defaults for models pickled before these options existed
+    n_jobs = 1
+    cv = 3
+    seed = 42
+
+    def __init__(self, features, model_types, cluster_labels, n_trials=30, timeout=300, n_jobs=1, cv=3, seed=42):
         self.features = features
         self.n_clusters = 3
         self.model_types = model_types
         self.n_trials = n_trials
         self.timeout = timeout
+        self.n_jobs = n_jobs
+        self.cv = cv
+        self.seed = seed
         self.cluster_labels = cluster_labels
 
         self.scalar = StandardScaler()
@@ -65,6 +320,17 @@ class ModelPerCluster:
         self.cluster_model_types = {}
 
     def fit_cluster_models(self, X, y, cluster_labels):
+        tasks = []
+        for cluster_id in range(self.n_clusters):
+            mask = cluster_labels == cluster_id
+            for name, (model_class, param_space) in self.model_types.items():
+                if name == "Stacking":
+                    continue
+                tasks.append(((cluster_id, name),
+                              (model_class, param_space, X[mask], y[mask], self.n_trials, self.timeout, self.seed, self.cv)))
+        studies = run_studies(tasks, n_jobs=self.n_jobs)
+        cache = FitCache(cv=self.cv, seed=self.seed)
+
         for cluster_id in range(self.n_clusters):
             print(f"\n>>> Tuning cluster {cluster_id}")
 
@@ -83,41 +349,33 @@ class ModelPerCluster:
                 if name == "Stacking":
                     continue
 
-                def theobjective(trial):
-                    params = param_space(trial)
-                    X_train, X_val, y_train, y_val = train_test_split(X_cluster, y_cluster, test_size=0.2, random_state=42)
-                    model = model_class(**params)
-                    model.fit(X_train, y_train)
-                    preds = model.predict(X_val)
-                    rmse = np.sqrt(mean_squared_error(y_val, preds))
-                    return rmse
-                
-                study = optuna.create_study(direction="minimize", sampler=optuna.samplers.TPESampler(seed=42))
-                study.optimize(theobjective, n_trials=self.n_trials, timeout=self.timeout)
+                study, oof = studies[(cluster_id, name)]
+                optuna_params[name] = tuned_params(study)
+                cache.put_oof(cluster_id, name, optuna_params[name], oof)
 
                 if study.best_value < best_rmse:
                     best_rmse = study.best_value
                     best_study = study
                     best_model_type = name
-                    best_model = model_class(**study.best_params)
-                    best_model.fit(X_cluster, y_cluster)
-                
-                optuna_params[name] = study.best_params
+                    best_model = cache.fit(cluster_id, name, model_class, optuna_params[name], X_cluster, y_cluster)
 
             if cluster_id in [0, 1, 2]:
                 base_models = []
+                base_oofs = []
                 for base_name in ["RandomForest", "GradientBoosting", "Ridge"]:
                     if base_name in self.model_types:
                         model_class, param_space = self.model_types[base_name]
                         params = optuna_params.get(base_name, {})
-                        base_model = model_class(**params)
-                        base_model.fit(X_cluster, y_cluster)
-                        base_models.append((base_name, base_model))
-
-                stacked_model = StackingRegressor(estimators=base_models, final_estimator=Ridge())
-                stacked_model.fit(X_cluster, y_cluster)
-                stacked_preds = stacked_model.predict(X_cluster)
-                stacked_rmse = np.sqrt(mean_squared_error(y_cluster, stacked_preds))
+                        base_models.append((base_name, cache.fit(cluster_id, base_name, model_class, params, X_cluster, y_cluster)))
+                        base_oofs.append(cache.oof(cluster_id, base_name, model_class, params, X_cluster, y_cluster))
+
+                base_oofs = np.column_stack(base_oofs)
+                stacked_model = stack_prefit(base_models, base_oofs, X_cluster, y_cluster, seed=self.seed)
+                # Score the final Ridge out-of-fold too, so it competes fairly with the tuned CV scores
+                folds = cv_folds(X_cluster, self.cv)
+                stacked_preds = cross_val_predict(Ridge(), base_oofs, y_cluster, cv=folds)
+                stacked_rmse = np.mean([np.sqrt(mean_squared_error(y_cluster.iloc[val], stacked_preds[val]))
+                                        for _, val in folds])
 
                 if stacked_rmse < best_rmse:
                     best_rmse = stacked_rmse
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import threading
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from .text_cache import normalize_text
+from .utils import format_amenities_from_string
+
+KEY_VERSION = 1
+
+
+def canonical_listing(data):
+    """Cleaned form data in a form where equivalent submissions compare equal.
+
+    Amenities go through ``format_amenities_from_string`` and are sorted,
+    since every amenity feature is order-free; descriptions are
+    whitespace-normalized as the text scores already are. Everything else is
+    kept as cleaned by ``PredictForm``.
+    """
+    canonical = dict(data)
+    amenities = canonical.get('amenities') or ''
+    if amenities.startswith('{'):
+        amenities = amenities.strip('{}').replace('"', '')
+    items = format_amenities_from_string(amenities).strip('{}')
+    canonical['amenities'] = '{' + ','.join(sorted(items.split(','))) + '}' if items else '{}'
+    if isinstance(canonical.get('description'), str):
+        canonical['description'] = normalize_text(canonical['description'])
+    return canonical
+
+
+def listing_key(data, version, k=0):
+    payload = json.dumps([KEY_VERSION, version, k, canonical_listing(data)], sort_keys=True, default=str)
+    return "prediction:" + hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class PredictionCache:
+    """Pipeline outputs per listing, stored in a Django cache.
+
+    Entries are keyed by a hash of the canonical listing, the number of
+    comparables asked for and the model bundle version, so publishing a new
+    bundle makes every old entry unreachable; they then age out through the
+    backend's ``TIMEOUT`` and ``MAX_ENTRIES`` culling. A shared backend
+    (file-based, memcached, Redis) serves the same entries to every worker.
+
+    ``predict`` answers what it can from the cache and runs ``predict_fn``
+    once on the distinct listings that missed.
+    """
+
+    def __init__(self, cache, timeout=DEFAULT_TIMEOUT):
+        self.cache = cache
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _missing(self, keys, rows, found):
+        """The distinct listings among ``rows`` that ``found`` does not hold, by key."""
+        missing = {}
+        for key, row in zip(keys, rows):
+            if key not in found:
+                missing.setdefault(key, row)
+        hits = sum(key in found for key in keys)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return missing
+
+    @staticmethod
+    def _entries(missing, outputs):
+        prices, cluster_labels, comparables = outputs
+        return {
+            key: (float(price), int(cluster), similar)
+            for key, price, cluster, similar in zip(missing, prices, cluster_labels, comparables)
+        }
+
+    @staticmethod
+    def _assemble(keys, found):
+        values = [found[key] for key in keys]
+        return [v[0] for v in values], [v[1] for v in values], [v[2] for v in values]
+
+    def predict(self, rows, version, k, predict_fn):
+        """``(prices, cluster_labels, comparables)`` for cleaned ``rows``, computing only cache misses."""
+        keys = [listing_key(row, version, k) for row in rows]
+        found = self.cache.get_many(keys)
+        missing = self._missing(keys, rows, found)
+        if missing:
+            computed = self._entries(missing, predict_fn(list(missing.values())))
+            self.cache.set_many(computed, timeout=self.timeout)
+            found.update(computed)
+        return self._assemble(keys, found)
+
+    async def apredict(self, rows, version, k, predict_fn):
+        """``predict`` for async views; ``predict_fn`` is awaited."""
+        keys = [listing_key(row, version, k) for row in rows]
+        found = await self.cache.aget_many(keys)
+        missing = self._missing(keys, rows, found)
+        if missing:
+            computed = self._entries(missing, await predict_fn(list(missing.values())))
+            await self.cache.aset_many(computed, timeout=self.timeout)
+            found.update(computed)
+        return self._assemble(keys, found)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
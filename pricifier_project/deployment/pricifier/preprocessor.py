@@ -1,6 +1,11 @@
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from textblob import TextBlob
 from datetime import datetime
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import math
+import os
 import numpy as np
 import pandas as pd
 from sklearn.base import BaseEstimator, TransformerMixin
@@ -8,21 +13,120 @@ from sklearn.preprocessing import OrdinalEncoder
 from sklearn.impute import SimpleImputer
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import MinMaxScaler, StandardScaler
+from .geo import GeoIndex
+from .ingest import iter_chunks
+from .profiling import profiler
+from .text_cache import get_text_cache
 
 def comma_tokenizer(x):
     return x.split(',')
 
+def compute_sentiment(text, analyzer):
+    if not isinstance(text, str) or text.strip() == "":
+        return 0
+    return analyzer.polarity_scores(text)['compound']
+
+def compute_objectivity(text):
+    if not isinstance(text, str): return 0
+    return 1 - TextBlob(text).sentiment.subjectivity
+
+def sentiment_chunk(texts):
+    analyzer = SentimentIntensityAnalyzer()
+    return [compute_sentiment(text, analyzer) for text in texts]
+
+def objectivity_chunk(texts):
+    return [compute_objectivity(text) for text in texts]
+
+def warm_up_text_models():
+    # TextBlob fills its sentiment lexicon lazily on first use; load it up front
+    # so concurrent transforms never read a half-populated dictionary.
+    TextBlob("warm up").sentiment
+
+def map_in_chunks(func, texts, n_jobs=1, chunk_size=2000, parallel_threshold=5000):
+    """Apply a chunk function over ``texts``, in a process pool for large inputs.
+
+    Output order always follows ``texts``. Inputs shorter than
+    ``parallel_threshold`` (or ``n_jobs == 1``) run serially, since pool
+    startup would cost more than it saves.
+    """
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    if not n_jobs or n_jobs == 1 or len(texts) < max(parallel_threshold, 2):
+        return func(texts)
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(chunks))) as pool:
+        return [value for chunk in pool.map(func, chunks) for value in chunk]
+
+PET_AMENITIES = [
+    "Pets live on this property", "Pets allowed", "Dog(s)", "Cat(s)", "Other pet(s)"
+]
+AMENITIES_MAP = {
+    "Wireless Internet": "Internet",
+    "Dryer": "Dryer/Washer",
+    "Washer": "Dryer/Washer",
+    "Dishwasher": "Dryer/Washer",
+    "Central Heating": "Heating",
+    **{p: "Pet-Friendly" for p in PET_AMENITIES}
+}
+
+def map_amenities(amenity_list):
+    return [AMENITIES_MAP.get(a.strip().strip('"'), a.strip().strip('"')) for a in amenity_list]
+
+def is_missing(value):
+    """What ``SimpleImputer`` treats as missing in a single raw value."""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+@lru_cache(maxsize=4096)
+def parse_date(value):
+    return pd.to_datetime(value, errors="coerce")
+
+# Identifier and date columns never passed to the models
+DROP_COLUMNS = ['id', 'name', 'thumbnail_url', 'neighbourhood',
+                'first_review', 'host_since', 'last_review', 'zipcode', 'missing_review_dates']
+LUXURY_POLICIES = ('super_strict_30', 'super_strict_60')
+MOST_RECENT_REVIEW = "2017-10-04"
+
+def median_from_counts(counts):
+    """Median of the values behind a ``value_counts`` Series, as ``np.median`` would give it."""
+    if counts.sum() == 0:
+        return np.nan
+    counts = counts.sort_index()
+    cumulative = counts.cumsum().to_numpy()
+    total = cumulative[-1]
+    values = counts.index.to_numpy(dtype=float)
+    lower = values[np.searchsorted(cumulative, (total - 1) // 2 + 1)]
+    upper = values[np.searchsorted(cumulative, total // 2 + 1)]
+    return (lower + upper) / 2
+
 class DataPreprocessor(BaseEstimator, TransformerMixin):
-    def __init__(self, impute_strategy="mean", encode_type="onehot"):
+    # Defaults for preprocessors pickled before these options existed
+    n_jobs = 1
+    chunk_size = 2000
+    parallel_threshold = 5000
+    geo_radius_km = 1.0
+    geo_k = 10
+    geo_index = None
+    # Lookup tables of ``listing_vector``, rebuilt on first use and never pickled
+    _single_plan = None
+
+    def __init__(self, impute_strategy="mean", encode_type="onehot", n_jobs=1, chunk_size=2000, parallel_threshold=5000,
+                 geo_radius_km=1.0, geo_k=10):
         self.impute_strategy = impute_strategy
         self.encode_type = encode_type
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.parallel_threshold = parallel_threshold
+        self.geo_radius_km = geo_radius_km
+        self.geo_k = geo_k
+        self.geo_index = None
         self.analyzer = SentimentIntensityAnalyzer()
+        warm_up_text_models()
         self.tfidf_top_features = None
+        self.tfidf_top_indices = None
         self.fitted = False 
         self.scaler = MinMaxScaler()
         self.tfidf_scaler = StandardScaler()
         self.amenity_scaler = StandardScaler()
-        self.tfidf_matrix = None
         self.vectorizer = TfidfVectorizer(tokenizer=comma_tokenizer, lowercase=False)
         self.final_feature_names = []
         self.cluster_features = [
@@ -104,19 +208,33 @@ class DataPreprocessor(BaseEstimator, TransformerMixin):
             'Boston': (42.3555, -71.0565)
         }
 
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop('_single_plan', None)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if getattr(self, 'tfidf_top_indices', None) is None and self.tfidf_top_features is not None:
+            self.tfidf_top_indices = self._top_feature_indices()
+        warm_up_text_models()
+
+    def _map_text_chunks(self, func, texts):
+        return map_in_chunks(func, texts, n_jobs=self.n_jobs, chunk_size=self.chunk_size,
+                             parallel_threshold=self.parallel_threshold)
+
     def sentiment_score(self, X):
-        def compute_sentiment(text):
-            if not isinstance(text, str) or text.strip() == "":
-                return 0
-            return self.analyzer.polarity_scores(text)['compound']
-        X['sentiment'] = X['description'].apply(compute_sentiment)
+        X['sentiment'] = pd.Series(get_text_cache().map(
+            'sentiment', X['description'].tolist(),
+            lambda text: compute_sentiment(text, self.analyzer),
+            lambda texts: self._map_text_chunks(sentiment_chunk, texts)), index=X.index)
         return X
 
     def objectivity_score(self, X):
-        def compute_obj(text):
-            if not isinstance(text, str): return 0
-            return 1 - TextBlob(text).sentiment.subjectivity
-        X['objectivity'] = X['description'].apply(compute_obj)
+        X['objectivity'] = pd.Series(get_text_cache().map(
+            'objectivity', X['description'].tolist(),
+            compute_objectivity,
+            lambda texts: self._map_text_chunks(objectivity_chunk, texts)), index=X.index)
         return X
 
     def combine_sentiment_subjectivity(self, sentiment, objectivity, sentiment_weight=0.7, objectivity_weight=0.3):
@@ -128,22 +246,35 @@ class DataPreprocessor(BaseEstimator, TransformerMixin):
         end = pd.to_datetime(end, errors="coerce")
         return (end - start).days if pd.notnull(start) and pd.notnull(end) else -1
 
-    def _compute_amenity_score(self, X, top_k=30):
-        pet_map = [
-            "Pets live on this property", "Pets allowed", "Dog(s)", "Cat(s)", "Other pet(s)"
-        ]
-        amenities_map = {
-            "Wireless Internet": "Internet",
-            "Dryer": "Dryer/Washer",
-            "Washer": "Dryer/Washer",
-            "Dishwasher": "Dryer/Washer",
-            "Central Heating": "Heating",
-            **{p: "Pet-Friendly" for p in pet_map}
-        }
+    def days_between(self, start, end):
+        start = pd.to_datetime(start, errors="coerce")
+        end = pd.to_datetime(end, errors="coerce")
+        return (end - start).dt.days.fillna(-1).astype(int)
+
+    def add_review_date_features(self, X, most_recent_possible=MOST_RECENT_REVIEW):
+        X['days_between_reviews'] = self.days_between(X['first_review'], X['last_review'])
+
+        host_since = pd.to_datetime(X['host_since'], errors="coerce")
+        last_review = pd.to_datetime(X['last_review'], errors="coerce")
+        tenure_end = last_review.where(last_review >= host_since, pd.to_datetime(most_recent_possible))
+        X['host_tenure'] = self.days_between(host_since, tenure_end)
+        return X
+
+    def _top_feature_indices(self):
+        return np.array([self.vectorizer.vocabulary_[name] for name in self.tfidf_top_features], dtype=np.intp)
+
+    def _top_tfidf_frame(self, tfidf, index):
+        # Slice the retained columns out of the sparse matrix by vocabulary index
+        # instead of densifying the whole vocabulary.
+        top = tfidf[:, self.tfidf_top_indices].toarray()
+        return pd.DataFrame(top, columns=self.tfidf_top_features, index=index)
 
-        def map_amenities(amenity_list):
-            return [amenities_map.get(a.strip().strip('"'), a.strip().strip('"')) for a in amenity_list]
+    def _select_top_features(self, mean_tfidf, top_k):
+        mean_tfidf = pd.Series(mean_tfidf, index=self.vectorizer.get_feature_names_out())
+        self.tfidf_top_features = mean_tfidf.sort_values(ascending=False).head(top_k).index.tolist()
+        self.tfidf_top_indices = self._top_feature_indices()
 
+    def _amenity_strings(self, X):
         X = X.copy()
 
         # Ensure amenities are in string format
@@ -157,31 +288,27 @@ class DataPreprocessor(BaseEstimator, TransformerMixin):
         if 'amenities_str' not in X.columns:
             X['standard_amenities'] = X['split_amenities'].apply(map_amenities)
             X['amenities_str'] = X['standard_amenities'].apply(lambda x: ','.join(x))
+        return X
+
+    def _compute_amenity_score(self, X, top_k=30, fit=False):
+        X = self._amenity_strings(X)
 
-        if not self.fitted:
+        if fit:
             assert 'amenities_str' in X.columns, "Missing 'amenities_str' column in input data"
             tfidf = self.vectorizer.fit_transform(X['amenities_str'])
-            tfidf_df = pd.DataFrame(tfidf.toarray(), columns=self.vectorizer.get_feature_names_out(), index=X.index)
 
             # Store top features only ONCE
-            top_amenities = tfidf_df.mean().sort_values(ascending=False).head(top_k).index.tolist()
-            self.tfidf_top_features = top_amenities
-            tfidf_top_df = tfidf_df[top_amenities]
+            self._select_top_features(np.asarray(tfidf.mean(axis=0)).ravel(), top_k)
+            tfidf_top_df = self._top_tfidf_frame(tfidf, X.index)
             self.scaler.fit(tfidf_top_df)
-            self.fitted = True
         else:
             tfidf = self.vectorizer.transform(X['amenities_str'])
-            tfidf_df = pd.DataFrame(
-                tfidf.toarray(),
-                columns=self.vectorizer.get_feature_names_out(),
-                index=X.index
-            )
-            tfidf_top_df = tfidf_df[self.tfidf_top_features]
-
-            self.tfidf_matrix = tfidf_top_df
+            tfidf_top_df = self._top_tfidf_frame(tfidf, X.index)
 
         X['amenity_score'] = tfidf_top_df.sum(axis=1)
-        X['amenity_score_normalized'] = self.amenity_scaler.fit_transform(X[['amenity_score']])
+        if fit:
+            self.amenity_scaler.fit(X[['amenity_score']])
+        X['amenity_score_normalized'] = self.amenity_scaler.transform(X[['amenity_score']])
 
         return pd.concat([X, tfidf_top_df], axis=1)
 
@@ -194,25 +321,113 @@ class DataPreprocessor(BaseEstimator, TransformerMixin):
         return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
 
     def add_distance_to_city_center(self, X, city_col='city', lat_col='latitude', lon_col='longitude'):
-        def compute_distance(row):
-            city = row[city_col]
-            if city in self.city_centers:
-                center_lat, center_lon = self.city_centers[city]
-                return self.haversine(row[lat_col], row[lon_col], center_lat, center_lon)
-            else:
-                return np.nan
         X = X.copy()
-        X['distance_to_city_center'] = X.apply(compute_distance, axis=1)
+        center_lat = X[city_col].map({city: lat for city, (lat, _) in self.city_centers.items()})
+        center_lon = X[city_col].map({city: lon for city, (_, lon) in self.city_centers.items()})
+        X['distance_to_city_center'] = self.haversine(
+            X[lat_col].astype(float).to_numpy(), X[lon_col].astype(float).to_numpy(),
+            center_lat.astype(float).to_numpy(), center_lon.astype(float).to_numpy())
+        return X
+
+    def add_neighborhood_features(self, X):
+        """Location features from the index of training listings fitted in ``fit``."""
+        if self.geo_index is None:
+            return X
+        X = X.copy()
+        features = self.geo_index.features(X['latitude'], X['longitude'])
+        for col in features.columns:
+            X[col] = features[col].to_numpy()
         return X
 
     def fit(self, X, y=None):
+        """Fit on raw listings. With ``y`` (log prices) the neighbourhood index
+        also learns local prices, adding ``knn_median_log_price``."""
         X = X.copy()
         for col, imputer in self.imputers.items():
             imputer.fit(X[[col]])
             X[col] = imputer.transform(X[[col]]).ravel()
 
+        self.geo_index = GeoIndex(self.geo_radius_km, self.geo_k).fit(X['latitude'], X['longitude'], y)
+        X = self._compute_amenity_score(X, fit=True)
+        return self._fit_columns(X)
+
+    def fit_chunks(self, chunks, top_k=30, schema_rows=200, target=None):
+        """Fit on raw listings streamed as DataFrame chunks, in bounded memory.
+
+        ``chunks`` must be re-iterable (a list of frames or an
+        ``ingest.ChunkedCsv``); it is read three times:
+
+        1. value counts for the median imputers, TF-IDF document frequencies,
+           coordinates (and the ``target`` column, if named) for the
+           neighbourhood index, and the first ``schema_rows`` rows, which fix
+           the output columns;
+        2. the mean TF-IDF of every amenity, to pick the ``top_k`` kept;
+        3. ``partial_fit`` of the min-max and amenity score scalers.
+
+        Passes 2 and 3 only parse the ``amenities`` column. The result matches
+        ``fit`` on the concatenated chunks up to floating point summation order.
+        """
+        median_cols = [col for col, imputer in self.imputers.items() if imputer.strategy == "median"]
+        counts = {col: pd.Series(dtype=float) for col in median_cols}
+        document_frequency = Counter()
+        analyzer = self.vectorizer.build_analyzer()
+        n_docs = 0
+        head = None
+        coords, prices = [], []
+
+        for chunk in chunks:
+            if target is not None:
+                prices.append(chunk[target].to_numpy(dtype=float))
+                chunk = chunk.drop(columns=[target])
+            coords.append(chunk[['latitude', 'longitude']].to_numpy(dtype=float))
+            if head is None:
+                head = chunk.head(schema_rows).copy()
+            for col in median_cols:
+                counts[col] = counts[col].add(chunk[col].value_counts(), fill_value=0)
+            for doc in self._amenity_strings(chunk[['amenities']])['amenities_str']:
+                document_frequency.update(set(analyzer(doc)))
+            n_docs += len(chunk)
+
+        for col, imputer in self.imputers.items():
+            if col in counts:
+                imputer.fit(pd.DataFrame({col: [median_from_counts(counts[col])]}))
+            else:
+                imputer.fit(head[[col]])
+
+        coords = np.concatenate(coords)
+        self.geo_index = GeoIndex(self.geo_radius_km, self.geo_k).fit(
+            coords[:, 0], coords[:, 1], np.concatenate(prices) if target is not None else None)
+
+        vocabulary = sorted(document_frequency)
+        self.vectorizer.vocabulary_ = {token: i for i, token in enumerate(vocabulary)}
+        self.vectorizer.fixed_vocabulary_ = False
+        # Same smoothed idf as TfidfTransformer.fit
+        df = np.array([document_frequency[token] for token in vocabulary], dtype=np.float64)
+        self.vectorizer.idf_ = np.log((n_docs + 1) / (df + 1)) + 1
+
+        mean_tfidf = np.zeros(len(vocabulary))
+        for chunk in iter_chunks(chunks, ['amenities']):
+            tfidf = self.vectorizer.transform(self._amenity_strings(chunk)['amenities_str'])
+            mean_tfidf += np.asarray((tfidf * (1.0 / n_docs)).sum(axis=0)).ravel()
+        self._select_top_features(mean_tfidf, top_k)
+
+        self.scaler = MinMaxScaler()
+        self.amenity_scaler = StandardScaler()
+        for chunk in iter_chunks(chunks, ['amenities']):
+            X = self._amenity_strings(chunk)
+            tfidf_top_df = self._top_tfidf_frame(self.vectorizer.transform(X['amenities_str']), X.index)
+            self.scaler.partial_fit(tfidf_top_df)
+            self.amenity_scaler.partial_fit(tfidf_top_df.sum(axis=1).to_frame('amenity_score'))
+
+        X = head
+        for col, imputer in self.imputers.items():
+            X[col] = imputer.transform(X[[col]]).ravel()
         X = self._compute_amenity_score(X)
+        return self._fit_columns(X)
+
+    def _fit_columns(self, X):
         X = self.add_distance_to_city_center(X)
+        X = self.add_neighborhood_features(X)
         X = self.objectivity_score(X)
         X = self.sentiment_score(X)
         X['n_amenities'] = X['amenities'].apply(lambda x: len(x.split(',')) if isinstance(x, str) else 0)
@@ -231,6 +446,7 @@ class DataPreprocessor(BaseEstimator, TransformerMixin):
         other_cols = X.select_dtypes(include=[np.number]).columns.tolist()
 
         self.final_feature_names = list(set(cluster_cols + other_cols))
+        self._single_plan = None
 
         self.fitted = True
         return self
@@ -238,97 +454,199 @@ class DataPreprocessor(BaseEstimator, TransformerMixin):
     def transform(self, X):
         X = X.copy()
 
-        for col, imputer in self.imputers.items():
-            if col not in X.columns:
-                X[col] = imputer.transform([[None]])[0][0]
+        with profiler.stage("imputation"):
+            for col, imputer in self.imputers.items():
+                if col not in X.columns:
+                    X[col] = imputer.transform([[None]])[0][0]
+                else:
+                    X[col] = imputer.transform(X[[col]]).ravel()
+
+        with profiler.stage("date_features"):
+            X['first_review'] = pd.to_datetime(X['first_review'], errors="coerce")
+            X['last_review'] = pd.to_datetime(X['last_review'], errors="coerce")
+            X['missing_review_dates'] = X['first_review'].isna() | X['last_review'].isna()
+
+            mask = X['first_review'].notna() & X['last_review'].notna()
+            X['review_gap_days'] = np.nan
+            X.loc[mask, 'review_gap_days'] = (X.loc[mask, 'last_review'] - X.loc[mask, 'first_review']).dt.days
+            X['review_gap_days'] = X['review_gap_days'].fillna(-1)
+            X = self.add_review_date_features(X)
+
+        with profiler.stage("encoding"):
+            X['host_response_rate'] = (
+                X['host_response_rate']
+                .replace("None", "0")  
+                .fillna("0")           
+                .astype(str)
+                .str.rstrip('%')
+                .astype(float)
+                )
+
+            if 'cleaning_fee' in X.columns:
+                X['cleaning_fee'] = X['cleaning_fee'].fillna(0).astype(int)
             else:
-                X[col] = imputer.transform(X[[col]]).ravel()
-
-        X['first_review'] = pd.to_datetime(X['first_review'], errors="coerce")
-        X['last_review'] = pd.to_datetime(X['last_review'], errors="coerce")
-        X['missing_review_dates'] = X['first_review'].isna() | X['last_review'].isna()
-
-        mask = X['first_review'].notna() & X['last_review'].notna()
-        X['review_gap_days'] = np.nan
-        X.loc[mask, 'review_gap_days'] = (X.loc[mask, 'last_review'] - X.loc[mask, 'first_review']).dt.days
-        X['review_gap_days'] = X['review_gap_days'].fillna(-1)
-
-        X['host_response_rate'] = (
-            X['host_response_rate']
-            .replace("None", "0")  
-            .fillna("0")           
-            .astype(str)
-            .str.rstrip('%')
-            .astype(float)
-            )
-
-        if 'cleaning_fee' in X.columns:
-            X['cleaning_fee'] = X['cleaning_fee'].fillna(0).astype(int)
-        else:
-            X['cleaning_fee'] = 0
+                X['cleaning_fee'] = 0
 
-        for col in self.bool_cols:
-            if col not in X.columns:
-                X[col] = "f"
-            X[col] = self.bool_encoders[col].transform(X[[col]]).ravel()
-
-        for col, mapping in self.encoders["mapping"].items():
-            if col in X.columns:
-                X[col] = X[col].map(mapping)
+            for col in self.bool_cols:
+                if col not in X.columns:
+                    X[col] = "f"
+                X[col] = self.bool_encoders[col].transform(X[[col]]).ravel()
 
-        if 'latitude' in X.columns:
-            X['lat_bin'] = pd.cut(X['latitude'], bins=10)
-        if 'longitude' in X.columns:
-            X['long_bin'] = pd.cut(X['longitude'], bins=10)
+            for col, mapping in self.encoders["mapping"].items():
+                if col in X.columns:
+                    X[col] = X[col].map(mapping)
 
-        if 'amenities' in X.columns:
-            X['split_amenities'] = X['amenities'].fillna('').apply(lambda x: str(x).strip("{}").split(','))
-            X['n_amenities'] = X['amenities'].fillna('').apply(lambda x: len(str(x).strip("{}").split(',')))
+            if 'amenities' not in X.columns:
+                X['amenities'] = ''
+            X['split_amenities'] = X['amenities'].fillna('').astype(str).str.strip("{}").str.split(',')
+            X['n_amenities'] = X['split_amenities'].str.len()
 
-        X = self.sentiment_score(X)
-        X = self.objectivity_score(X)
-        X['description_score'] = X.apply(
-            lambda row: self.combine_sentiment_subjectivity(row['sentiment'], row['objectivity']), axis=1)
+        with profiler.stage("vader"):
+            X = self.sentiment_score(X)
+        with profiler.stage("textblob"):
+            X = self.objectivity_score(X)
+        X['description_score'] = self.combine_sentiment_subjectivity(X['sentiment'], X['objectivity'])
 
         if 'cancellation_policy' in X.columns:
-            X['luxury_policy_flag'] = X['cancellation_policy'].isin(['super_strict_30', 'super_strict_60']).astype(int)
+            X['luxury_policy_flag'] = X['cancellation_policy'].isin(LUXURY_POLICIES).astype(int)
         else:
             X['luxury_policy_flag'] = 0
 
         X['city_value_score'] = X['city'].map(self.city_sentiment)
         X['city_expense_score'] = X['city'].map(self.city_expense_worth)
 
-        X['days_between_reviews'] = X.apply(
-            lambda row: self.day_since(row['first_review'], row['last_review']), axis=1)
-        
-        most_recent_possible = pd.to_datetime("2017-10-04")
-
-        X['host_tenure'] = X.apply(
-            lambda row: self.day_since(row['host_since'], row['last_review'])
-            if pd.notnull(row['last_review']) and 
-                pd.to_datetime(row['last_review']) >= pd.to_datetime(row['host_since'])
-            else self.day_since(row['host_since'], most_recent_possible),
-            axis=1
-        )
-        X = self.add_distance_to_city_center(X)
+        with profiler.stage("haversine"):
+            X = self.add_distance_to_city_center(X)
+        with profiler.stage("neighbourhood"):
+            X = self.add_neighborhood_features(X)
 
-        if 'split_amenities' in X.columns:
+        with profiler.stage("tfidf"):
             X = self._compute_amenity_score(X)
-        
-        X['amenity_score'] = self.tfidf_matrix.sum(axis=1)
-        X['amenity_score_normalized'] = self.amenity_scaler.transform(X[['amenity_score']])
 
         for col in self.final_feature_names:
             if col not in X.columns:
                 X[col] = 0
         X = X[self.final_feature_names]
-
-        drop_cols = ['id', 'name', 'thumbnail_url', 'neighbourhood',
-                     'first_review', 'host_since', 'last_review', 'zipcode', 'missing_review_dates']
-        X = X.drop(columns=drop_cols, errors='ignore')
+        X = X.drop(columns=DROP_COLUMNS, errors='ignore')
 
         # Final return: numeric-only DataFrame for safety in pipelines
         return X.select_dtypes(include=[np.number])
 
+    def output_features(self):
+        """Columns returned by ``transform``, in order."""
+        return [col for col in self.final_feature_names if col not in DROP_COLUMNS]
+
+    def _single_listing_plan(self):
+        plan = self._single_plan
+        if plan is None:
+            vocabulary = self.vectorizer.vocabulary_
+            plan = self._single_plan = {
+                'columns': self.output_features(),
+                'fills': {col: imputer.statistics_[0] for col, imputer in self.imputers.items()},
+                'bool_codes': {col: {value: code for code, value in enumerate(enc.categories_[0])}
+                               for col, enc in self.bool_encoders.items()},
+                'idf': dict(zip(vocabulary, self.vectorizer.idf_[list(vocabulary.values())].tolist())),
+                'top_features': list(self.tfidf_top_features),
+                'amenity_mean': float(self.amenity_scaler.mean_[0]),
+                'amenity_scale': float(self.amenity_scaler.scale_[0]),
+                'dates': bool({'review_gap_days', 'days_between_reviews', 'host_tenure'}
+                              & set(self.final_feature_names)),
+            }
+        return plan
+
+    def listing_vector(self, listing):
+        """``transform`` of one listing given as a dict of raw fields, without pandas.
+
+        Returns the row ``transform`` would give as a float64 vector ordered as
+        ``output_features()``. Imputer fill values, encoder maps, TF-IDF
+        weights and scaler parameters are looked up in tables built once per
+        fitted preprocessor; text scores come from the same cache. Values agree
+        with ``transform`` up to floating point summation order. Fields missing
+        from ``listing`` are imputed where ``transform`` imputes them and 0
+        otherwise.
+        """
+        plan = self._single_listing_plan()
+        values = dict(listing)
+
+        with profiler.stage("imputation"):
+            for col, fill in plan['fills'].items():
+                if is_missing(values.get(col)):
+                    values[col] = fill
+
+        if plan['dates']:
+            with profiler.stage("date_features"):
+                first, last = parse_date(values['first_review']), parse_date(values['last_review'])
+                gap = (last - first).days if not (pd.isna(first) or pd.isna(last)) else -1
+                values['review_gap_days'] = values['days_between_reviews'] = gap
+                host_since = parse_date(values['host_since'])
+                tenure_end = last if not pd.isna(last) and last >= host_since else parse_date(MOST_RECENT_REVIEW)
+                values['host_tenure'] = (tenure_end - host_since).days if not pd.isna(host_since) else -1
+
+        with profiler.stage("encoding"):
+            rate = values['host_response_rate']
+            values['host_response_rate'] = float(str("0" if rate == "None" else rate).rstrip('%'))
+            fee = values.get('cleaning_fee')
+            values['cleaning_fee'] = 0 if is_missing(fee) else int(fee)
+            for col, codes in plan['bool_codes'].items():
+                value = values.get(col, "f")
+                values[col] = np.nan if is_missing(value) else codes.get(value, -1)
+            for col, mapping in self.encoders["mapping"].items():
+                if col in values:
+                    values[col] = mapping.get(values[col], np.nan)
+
+        description = values.get('description')
+        with profiler.stage("vader"):
+            sentiment = get_text_cache().map(
+                'sentiment', [description], lambda text: compute_sentiment(text, self.analyzer))[0]
+        with profiler.stage("textblob"):
+            objectivity = get_text_cache().map('objectivity', [description], compute_objectivity)[0]
+        values['sentiment'], values['objectivity'] = sentiment, objectivity
+        values['description_score'] = self.combine_sentiment_subjectivity(sentiment, objectivity)
+        values['luxury_policy_flag'] = int(values.get('cancellation_policy') in LUXURY_POLICIES)
+
+        city = values.get('city')
+        values['city_value_score'] = self.city_sentiment.get(city, np.nan)
+        values['city_expense_score'] = self.city_expense_worth.get(city, np.nan)
+        latitude, longitude = values.get('latitude'), values.get('longitude')
+        location = self.location_features(city, [np.nan if latitude is None else float(latitude)],
+                                          [np.nan if longitude is None else float(longitude)])
+        values.update({col: column[0] for col, column in location.items()})
+        values.update(self.amenity_features(values.get('amenities')))
+
+        return np.array([np.nan if values.get(col, 0) is None else values.get(col, 0) for col in plan['columns']],
+                        dtype=np.float64)
+
+    def location_features(self, city, latitude, longitude):
+        """Distance to the centre of ``city`` and neighbourhood features for coordinate arrays."""
+        latitude, longitude = np.asarray(latitude, dtype=float), np.asarray(longitude, dtype=float)
+        with profiler.stage("haversine"):
+            center_lat, center_lon = self.city_centers.get(city, (np.nan, np.nan))
+            features = {'distance_to_city_center': self.haversine(latitude, longitude, center_lat, center_lon)}
+        if self.geo_index is not None:
+            with profiler.stage("neighbourhood"):
+                features.update(self.geo_index.feature_arrays(latitude, longitude))
+        return features
+
+    def amenity_features(self, amenities):
+        """``n_amenities``, the kept TF-IDF weights and the amenity scores of one raw amenities value."""
+        plan = self._single_listing_plan()
+        with profiler.stage("tfidf"):
+            amenities = '' if is_missing(amenities) else str(amenities)
+            split_amenities = amenities.strip("{}").split(',')
+            idf = plan['idf']
+            counts = Counter(map_amenities(split_amenities))
+            weights = {token: count * idf[token] for token, count in counts.items() if token in idf}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+            top = [weights.get(name, 0.0) / norm for name in plan['top_features']]
+            features = dict(zip(plan['top_features'], top))
+            features['n_amenities'] = len(split_amenities)
+            features['amenity_score'] = sum(top)
+            features['amenity_score_normalized'] = (features['amenity_score'] - plan['amenity_mean']) / plan['amenity_scale']
+        return features
+
+    def transform_one(self, listing):
+        """``listing_vector`` as the one-row DataFrame ``transform`` would return."""
+        return pd.DataFrame(self.listing_vector(listing)[None, :], columns=self._single_listing_plan()['columns'])
+
     def fit_transform(self, X, y=None):
         return self.fit(X, y).transform(X)
\ No newline at end of file
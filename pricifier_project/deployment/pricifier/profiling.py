@@ -0,0 +1,153 @@
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+
+class StageProfiler:
+    """Per-stage wall-clock timings for the prediction pipeline, aggregated in process.
+
+    Code wraps a stage in ``with profiler.stage("tfidf"):``. Every timing is
+    added to a rolling window of the last ``window`` samples per stage, from
+    which ``stats`` reports percentiles. While a request ``trace`` is open in
+    the current context (thread, or asyncio task under ASGI), its stages are
+    also summed into that trace, which ``StageTimingMiddleware`` returns as a
+    ``Server-Timing`` header. Work done for a request on another thread (the
+    micro-batcher, the async inference executor) is credited with ``merge``.
+
+    ``sample_rate`` is the share of traced requests also run under
+    ``cProfile``; the ``keep`` most recent profiles are kept as text.
+    """
+
+    def __init__(self, enabled=True, window=10000, sample_rate=0.0, keep=20):
+        self.enabled = enabled
+        self.window = window
+        self.sample_rate = sample_rate
+        self.profiles = deque(maxlen=keep)
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._trace = ContextVar(f"pricifier_trace_{id(self)}", default=None)
+        self._profile = ContextVar(f"pricifier_profile_{id(self)}", default=None)
+
+    def configure(self, enabled=None, window=None, sample_rate=None, keep=None):
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if window is not None:
+                self.window = window
+                self._samples = {name: deque(samples, maxlen=window) for name, samples in self._samples.items()}
+            if sample_rate is not None:
+                self.sample_rate = sample_rate
+            if keep is not None:
+                self.profiles = deque(self.profiles, maxlen=keep)
+
+    def record(self, name, seconds):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self._counts[name] = self._counts.get(name, 0) + 1
+        trace = self.current()
+        if trace is not None:
+            trace[name] = trace.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def current(self):
+        """The open trace of this context (stage name to seconds), or None."""
+        return self._trace.get()
+
+    def profiling(self):
+        return self._profile.get() is not None
+
+    @contextmanager
+    def trace(self, label="", sample=True):
+        """Collect this context's stage timings, sampling ``cProfile`` at ``sample_rate``.
+
+        Pass ``sample=False`` on an event loop thread, where a profile would
+        mix every request the loop is serving.
+        """
+        trace = {}
+        trace_token = self._trace.set(trace)
+        profile = profile_token = None
+        if sample and self.enabled and self.sample_rate and random.random() < self.sample_rate:
+            profile = cProfile.Profile()
+            profile_token = self._profile.set(profile)
+            profile.enable()
+        try:
+            yield trace
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._profile.reset(profile_token)
+                self._keep_profile(profile, label, trace)
+            self._trace.reset(trace_token)
+
+    def merge(self, trace, timings):
+        """Credit ``timings`` measured on another thread to ``trace``."""
+        if trace is None:
+            return
+        for name, seconds in timings.items():
+            trace[name] = trace.get(name, 0.0) + seconds
+
+    def _keep_profile(self, profile, label, trace):
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(25)
+        self.profiles.append({
+            "label": label,
+            "captured_at": datetime.now(timezone.utc).isoformat(),
+            "stages_ms": {name: 1000 * seconds for name, seconds in trace.items()},
+            "stats": out.getvalue(),
+        })
+
+    def stats(self):
+        with self._lock:
+            samples = {name: np.array(values) for name, values in self._samples.items()}
+            counts = dict(self._counts)
+        stats = {}
+        for name, values in samples.items():
+            if not len(values):
+                continue
+            ms = 1000 * values
+            stats[name] = {
+                "count": counts[name],
+                "mean_ms": float(ms.mean()),
+                **{f"p{q}_ms": float(value) for q, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES))},
+                "max_ms": float(ms.max()),
+            }
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self.profiles.clear()
+
+
+def server_timing(trace):
+    """A ``Server-Timing`` header value for a request trace."""
+    return ", ".join(f"{name};dur={1000 * seconds:.3f}" for name, seconds in trace.items())
+
+
+profiler = StageProfiler()
@@ -0,0 +1,251 @@
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from .feature_store import row_hashes
+from .ingest import LISTING_COLUMNS, ChunkedCsv
+
+FORMATS = ("csv", "parquet")
+# Columns of every output row after the optional listing id
+SCORE_COLUMNS = ["row", "price", "cluster", "row_hash", "model_version"]
+SCORE_DTYPES = {"row": "int64", "price": "float64", "cluster": "int64", "row_hash": "uint64",
+                "model_version": "object"}
+
+
+class ScoringError(Exception):
+    """Raised when a bulk scoring run cannot start or continue."""
+
+
+def output_format(path, fmt=None):
+    """``fmt``, or the format named by the extension of ``path``."""
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ScoringError(f"Cannot tell the output format of {path}; pass one of {list(FORMATS)}.")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ScoringError("Parquet output needs pyarrow installed; write a .csv output instead.")
+    return fmt
+
+
+def read_scores(path, fmt, columns, chunksize=500000):
+    """Chunks of ``columns`` of a scores file written by ``BulkScorer``."""
+    if fmt == "csv":
+        yield from pd.read_csv(path, usecols=columns, dtype={col: SCORE_DTYPES[col] for col in columns},
+                               chunksize=chunksize)
+        return
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+        yield batch.to_pandas()
+
+
+class PreviousScores:
+    """Prices of an earlier run for one model version, looked up by raw input-row hash.
+
+    Only three arrays are kept (hashes, prices, clusters), about 20 bytes
+    per listing, however wide the input was.
+    """
+
+    def __init__(self, hashes=None, prices=None, clusters=None):
+        hashes = np.empty(0, np.uint64) if hashes is None else np.asarray(hashes, dtype=np.uint64)
+        order = np.argsort(hashes, kind="stable")
+        self.hashes = hashes[order]
+        self.prices = np.empty(0) if prices is None else np.asarray(prices, dtype=float)[order]
+        self.clusters = np.empty(0, np.int64) if clusters is None else np.asarray(clusters, dtype=np.int64)[order]
+
+    @classmethod
+    def load(cls, path, fmt, model_version):
+        """The rows of a previous output scored by ``model_version``; empty when there is none."""
+        if path is None or not os.path.exists(path):
+            return cls()
+        hashes, prices, clusters = [], [], []
+        for chunk in read_scores(path, fmt, ["price", "cluster", "row_hash", "model_version"]):
+            same = (chunk["model_version"].astype(str) == model_version).to_numpy()
+            hashes.append(chunk["row_hash"].to_numpy(dtype=np.uint64)[same])
+            prices.append(chunk["price"].to_numpy(dtype=float)[same])
+            clusters.append(chunk["cluster"].to_numpy(dtype=np.int64)[same])
+        if not hashes:
+            return cls()
+        return cls(np.concatenate(hashes), np.concatenate(prices), np.concatenate(clusters))
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def lookup(self, hashes):
+        """``(found, prices, clusters)`` for ``hashes``; prices and clusters are only set where found."""
+        found = np.zeros(len(hashes), dtype=bool)
+        prices, clusters = np.full(len(hashes), np.nan), np.full(len(hashes), -1, dtype=np.int64)
+        if len(self.hashes):
+            at = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+            found = self.hashes[at] == hashes
+            prices[found], clusters[found] = self.prices[at[found]], self.clusters[at[found]]
+        return found, prices, clusters
+
+
+class BulkScorer:
+    """Price every listing of a raw listings CSV with one model bundle, in bounded memory.
+
+    The input is streamed in chunks of ``chunksize`` rows. A listing whose
+    raw row hashes the same as a row of the ``previous`` output scored by the
+    same bundle version reuses that price; the rest go through the
+    preprocessor, clusterer and per-cluster models.
+
+    Each chunk's scores are written as a part file next to ``output``, then
+    a checkpoint records the input rows done. A run that stops part way
+    resumes from the last checkpoint as long as the input file, bundle
+    version, chunk size and format are unchanged. When every chunk is done
+    the parts are joined into ``output``, which is replaced atomically.
+    """
+
+    def __init__(self, bundle, input_path, output_path, fmt=None, chunksize=50000, previous=None, log=print):
+        self.bundle = bundle
+        self.input_path = str(input_path)
+        self.output_path = str(output_path)
+        self.fmt = output_format(self.output_path, fmt)
+        self.chunksize = chunksize
+        self.previous = self.output_path if previous is None else str(previous)
+        self.previous_fmt = self.fmt if self.previous == self.output_path else output_format(self.previous)
+        self.log = log
+        self.checkpoint_path = self.output_path + ".checkpoint.json"
+        self.parts_dir = self.output_path + ".parts"
+
+    def _run_key(self):
+        stat = os.stat(self.input_path)
+        return {
+            "input": os.path.abspath(self.input_path),
+            "input_size": stat.st_size,
+            "input_mtime_ns": stat.st_mtime_ns,
+            "model_version": self.bundle.version,
+            "chunksize": self.chunksize,
+            "format": self.fmt,
+        }
+
+    def _load_checkpoint(self, key, restart):
+        if not restart and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if checkpoint["key"] != key:
+                self.log("Checkpoint is for another input, bundle or chunk size; starting over")
+            elif not all(os.path.exists(self._part_path(number)) for number in range(checkpoint["parts"])):
+                self.log("Checkpoint lists part files that are gone; starting over")
+            else:
+                self.log(f"Resuming after {checkpoint['rows_done']} rows ({checkpoint['parts']} parts)")
+                return checkpoint
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        os.makedirs(self.parts_dir)
+        checkpoint = {"key": key, "rows_done": 0, "parts": 0, "scored": 0, "reused": 0}
+        self._save_checkpoint(checkpoint)
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint):
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(tmp, self.checkpoint_path)
+
+    def _part_path(self, number):
+        return os.path.join(self.parts_dir, f"part-{number:06d}.{self.fmt}")
+
+    def _write_part(self, number, scores):
+        path = self._part_path(number)
+        tmp = path + ".tmp"
+        if self.fmt == "csv":
+            scores.to_csv(tmp, index=False, header=False)
+        else:
+            scores.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+    def _input_columns(self):
+        header = pd.read_csv(self.input_path, nrows=0).columns
+        columns = [col for col in LISTING_COLUMNS if col in header]
+        if not columns:
+            raise ScoringError(f"{self.input_path} has none of the listing columns.")
+        return columns
+
+    def score_chunk(self, chunk, first_row, previous):
+        """Scores of one input chunk, and how many listings were reused from ``previous``."""
+        hashes = row_hashes(chunk)
+        found, prices, clusters = previous.lookup(hashes)
+        todo = ~found
+        if todo.any():
+            X = self.bundle.preprocessor.transform(chunk[todo])
+            cluster_labels = self.bundle.clusterer.predict(X)
+            prices[todo] = np.round(np.exp(self.bundle.model.predicts(X, cluster_labels)), 2)
+            clusters[todo] = cluster_labels
+        scores = {"id": chunk["id"].to_numpy()} if "id" in chunk.columns else {}
+        scores.update({
+            "row": np.arange(first_row, first_row + len(chunk)),
+            "price": prices,
+            "cluster": clusters,
+            "row_hash": hashes,
+            "model_version": self.bundle.version,
+        })
+        return pd.DataFrame(scores), int(found.sum())
+
+    def _assemble(self, parts, columns):
+        tmp = self.output_path + ".tmp"
+        if self.fmt == "csv":
+            with open(tmp, "w", newline="") as out:
+                out.write(",".join(columns) + "\n")
+                for number in range(parts):
+                    with open(self._part_path(number)) as part:
+                        shutil.copyfileobj(part, out)
+        else:
+            import pyarrow.parquet as pq
+            writer = None
+            try:
+                for number in range(parts):
+                    table = pq.read_table(self._part_path(number))
+                    if writer is None:
+                        writer = pq.ParquetWriter(tmp, table.schema)
+                    writer.write_table(table)
+            finally:
+                if writer is not None:
+                    writer.close()
+            if writer is None:
+                pd.DataFrame({col: pd.Series(dtype=SCORE_DTYPES.get(col, "int64")) for col in columns}).to_parquet(
+                    tmp, index=False)
+        os.replace(tmp, self.output_path)
+
+    def run(self, restart=False, full=False):
+        """Score the input, resuming a checkpointed run unless ``restart``.
+
+        ``full`` rescores every listing instead of reusing previous prices.
+        Returns counts of the listings scored and reused.
+        """
+        key = self._run_key()
+        checkpoint = self._load_checkpoint(key, restart)
+        columns = self._input_columns()
+        output_columns = (["id"] if "id" in columns else []) + SCORE_COLUMNS
+        previous = PreviousScores() if full else PreviousScores.load(
+            self.previous, self.previous_fmt, self.bundle.version)
+        self.log(f"{len(previous)} previous prices of bundle {self.bundle.version} available for reuse")
+
+        source = ChunkedCsv(self.input_path, columns=columns, chunksize=self.chunksize)
+        for chunk in source.chunks(start=checkpoint["rows_done"]):
+            scores, reused = self.score_chunk(chunk.reset_index(drop=True), checkpoint["rows_done"], previous)
+            self._write_part(checkpoint["parts"], scores[output_columns])
+            checkpoint["parts"] += 1
+            checkpoint["rows_done"] += len(chunk)
+            checkpoint["reused"] += reused
+            checkpoint["scored"] += len(chunk) - reused
+            self._save_checkpoint(checkpoint)
+            self.log(f"{checkpoint['rows_done']} rows done: {checkpoint['scored']} scored, "
+                     f"{checkpoint['reused']} unchanged")
+
+        self._assemble(checkpoint["parts"], output_columns)
+        # The checkpoint goes first: one left behind must still have its parts to resume from
+        os.remove(self.checkpoint_path)
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        return {
+            "rows": checkpoint["rows_done"],
+            "scored": checkpoint["scored"],
+            "reused": checkpoint["reused"],
+            "model_version": self.bundle.version,
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        }
@@ -1,3 +1,1510 @@
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.test import AsyncClient, SimpleTestCase
+from django.urls import reverse
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+import asyncio
+import importlib.util
+import io
+import threading
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from unittest import mock
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor, StackingRegressor
+from sklearn.linear_model import Ridge
+from sklearn.svm import SVR
+
+from .artifacts import ArtifactRegistry
+from .batching import MicroBatcher
+from .benchmarks import Benchmark, compare, form_data, load_baseline, raw_listings, save_baseline
+from .bundles import BundleError, BundleRegistry, ModelBundle, load_bundle, save_bundle
+from .comparables import ComparablesIndex
+from .executor import BoundedExecutor, ExecutorFull
+from .feature_store import FeatureStore, preprocessor_key
+from .geo import GeoIndex
+from .ingest import ChunkedCsv, reservoir_sample
+from .compiled import (
+    CompiledModelPerCluster, EstimatorPredictor, LinearPredictor, StackingPredictor,
+    TreeEnsemblePredictor, compile_estimator,
+)
+from .model import (
+    ClusterFit, FitCache, IncrementalClusterFit, ModelPerCluster, cluster_features, cross_val_rmse, gbr_space, rf_space,
+    ridge_space, run_studies, stack_prefit, tune_model, tuned_params,
+)
+from .preprocessor import DataPreprocessor
+from .prediction_cache import PredictionCache, canonical_listing, listing_key
+from .profiling import StageProfiler, profiler, server_timing
+from .scoring import BulkScorer
+from .text_cache import TextFeatureCache
+from .utils import format_amenities_from_string
+from .whatif import GridError, edit_amenities, offset_coordinates, price_grid, validate_grid
+from . import text_cache
 
 # Create your tests here.
+
+AMENITIES = [
+    "TV", "Wireless Internet", "Kitchen", "Heating", "Essentials", "Smoke detector",
+    "Air conditioning", "Washer", "Dryer", "Hangers", "Iron", "Shampoo", "Cable TV",
+    "Pets allowed", "Elevator", "Hair dryer", "First aid kit", "Laptop friendly workspace",
+]
+
+DESCRIPTIONS = [
+    "Cozy studio in downtown with great lighting and fast WiFi",
+    "Beautiful brownstone apartment, steps from the subway. Amazing views!",
+    "Small room, shared bathroom. Noisy street at night.",
+    "Spacious family home with a big garden and free parking",
+    "",
+    None,
+]
+
+CITY_BOUNDS = {
+    "NYC": (40.70, 40.80, -74.02, -73.93),
+    "LA": (33.95, 34.10, -118.45, -118.20),
+    "SF": (37.74, 37.80, -122.45, -122.39),
+    "DC": (38.88, 38.95, -77.07, -77.00),
+    "Chicago": (41.85, 41.95, -87.70, -87.60),
+    "Boston": (42.33, 42.37, -71.10, -71.04),
+}
+
+
+def make_listings(n=60, seed=0):
+    """Build a raw listings frame shaped like Airbnb_Data.csv for tests."""
+    rng = np.random.default_rng(seed)
+    cities = rng.choice(list(CITY_BOUNDS), size=n)
+    rows = []
+    for i, city in enumerate(cities):
+        lat_lo, lat_hi, lon_lo, lon_hi = CITY_BOUNDS[city]
+        picked = rng.choice(AMENITIES, size=rng.integers(1, 10), replace=False)
+        host_since = pd.Timestamp("2010-01-01") + pd.Timedelta(days=int(rng.integers(0, 2500)))
+        first_review = host_since + pd.Timedelta(days=int(rng.integers(-100, 400)))
+        last_review = first_review + pd.Timedelta(days=int(rng.integers(0, 900)))
+        rows.append({
+            "id": i,
+            "room_type": rng.choice(["Entire home/apt", "Private room", "Shared room"]),
+            "amenities": "{" + ",".join(f'"{a}"' for a in picked) + "}",
+            "accommodates": int(rng.integers(1, 10)),
+            "bathrooms": float(rng.integers(1, 4)) if i % 7 else np.nan,
+            "bed_type": rng.choice(["Real Bed", "Futon", "Pull-out Sofa", "Airbed", "Couch"]),
+            "cancellation_policy": rng.choice(["flexible", "moderate", "strict", "super_strict_30"]),
+            "cleaning_fee": bool(rng.integers(0, 2)),
+            "city": city,
+            "description": DESCRIPTIONS[i % len(DESCRIPTIONS)],
+            "first_review": first_review.strftime("%Y-%m-%d") if i % 5 else np.nan,
+            "host_has_profile_pic": "t" if i % 9 else np.nan,
+            "host_identity_verified": rng.choice(["t", "f"]),
+            "host_response_rate": f"{int(rng.integers(50, 101))}%" if i % 4 else np.nan,
+            "host_since": host_since.strftime("%Y-%m-%d"),
+            "instant_bookable": rng.choice(["t", "f"]),
+            "last_review": last_review.strftime("%Y-%m-%d") if i % 6 else np.nan,
+            "latitude": rng.uniform(lat_lo, lat_hi),
+            "longitude": rng.uniform(lon_lo, lon_hi),
+            "name": f"Listing {i}",
+            "neighbourhood": "Somewhere" if i % 3 else np.nan,
+            "number_of_reviews": int(rng.integers(0, 200)),
+            "review_scores_rating": float(rng.integers(60, 101)) if i % 8 else np.nan,
+            "thumbnail_url": f"https://example.com/{i}.jpg" if i % 2 else np.nan,
+            "zipcode": "10001",
+            "bedrooms": float(rng.integers(0, 4)),
+            "beds": float(rng.integers(1, 5)) if i % 10 else np.nan,
+        })
+    return pd.DataFrame(rows)
+
+
+def make_bundle(preprocessor, clusterer, model, version="test", compile_model=False, comparables=None):
+    artifacts = ArtifactRegistry()
+    artifacts.set("preprocessor", preprocessor)
+    artifacts.set("clusterer", clusterer)
+    artifacts.set("model", model)
+    if comparables is not None:
+        artifacts.set("comparables", comparables)
+    return ModelBundle(version, artifacts, compile_model=compile_model)
+
+
+def make_pipeline(n=120, seed=0):
+    """Fit a small preprocessor / clusterer / per-cluster Ridge model on synthetic listings."""
+    X = make_listings(n=n, seed=seed)
+    y = np.log(40 + 25 * X['accommodates'] + np.random.default_rng(seed).normal(0, 5, len(X)))
+    preprocessor = DataPreprocessor().fit(X)
+    X_processed = preprocessor.transform(X)
+    clusterer = ClusterFit(cluster_features=cluster_features, n_clusters=3)
+    labels = clusterer.fit_predict(X_processed)
+    model = ModelPerCluster(X_processed.columns.tolist(), {}, labels)
+    for cluster_id in range(model.n_clusters):
+        mask = labels == cluster_id
+        model.cluster_models[cluster_id] = Ridge().fit(X_processed[mask], y[mask])
+    return preprocessor, clusterer, model
+
+
+LISTING = {
+    'room_type': 'Entire home/apt', 'accommodates': 3, 'beds': 2, 'latitude': 40.75,
+    'longitude': -73.99, 'city': 'NYC', 'description': 'Cozy studio with great light',
+    'amenities': 'Wireless Internet, Kitchen, TV',
+}
+
+
+class VectorizedTransformParityTests(SimpleTestCase):
+    """The columnar feature helpers must match the old row-wise ``apply`` code."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.X = make_listings()
+        # Unknown city, unparsable and out-of-order dates exercise the NaN / -1 branches.
+        cls.X.loc[0, "city"] = "Atlantis"
+        cls.X.loc[1, "first_review"] = "not a date"
+        cls.X.loc[2, "last_review"] = "2005-01-01"
+        cls.preprocessor = DataPreprocessor().fit(cls.X)
+
+    def test_distance_to_city_center(self):
+        p = self.preprocessor
+
+        def compute_distance(row):
+            if row['city'] in p.city_centers:
+                center_lat, center_lon = p.city_centers[row['city']]
+                return p.haversine(row['latitude'], row['longitude'], center_lat, center_lon)
+            return np.nan
+
+        expected = self.X.apply(compute_distance, axis=1)
+        result = p.add_distance_to_city_center(self.X)['distance_to_city_center']
+        # numpy's vectorized square may round the last ulp differently from scalar pow().
+        np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-12)
+        self.assertTrue(np.isnan(result.iloc[0]))
+
+    def test_review_date_features(self):
+        p = self.preprocessor
+        X = self.X.copy()
+        X['first_review'] = pd.to_datetime(X['first_review'], errors="coerce")
+        X['last_review'] = pd.to_datetime(X['last_review'], errors="coerce")
+        most_recent_possible = pd.to_datetime("2017-10-04")
+
+        expected_gap = X.apply(lambda row: p.day_since(row['first_review'], row['last_review']), axis=1)
+        expected_tenure = X.apply(
+            lambda row: p.day_since(row['host_since'], row['last_review'])
+            if pd.notnull(row['last_review']) and
+                pd.to_datetime(row['last_review']) >= pd.to_datetime(row['host_since'])
+            else p.day_since(row['host_since'], most_recent_possible),
+            axis=1
+        )
+
+        result = p.add_review_date_features(X.copy())
+        pd.testing.assert_series_equal(result['days_between_reviews'], expected_gap, check_names=False)
+        pd.testing.assert_series_equal(result['host_tenure'], expected_tenure, check_names=False)
+
+    def test_description_score(self):
+        p = self.preprocessor
+        X = p.objectivity_score(p.sentiment_score(self.X.copy()))
+        expected = X.apply(
+            lambda row: p.combine_sentiment_subjectivity(row['sentiment'], row['objectivity']), axis=1)
+        result = p.combine_sentiment_subjectivity(X['sentiment'], X['objectivity'])
+        pd.testing.assert_series_equal(result, expected, check_names=False)
+
+    def test_sparse_top_amenities_match_dense_selection(self):
+        p = self.preprocessor
+        X = p._compute_amenity_score(self.X)
+        tfidf = p.vectorizer.transform(X['amenities_str'])
+        dense = pd.DataFrame(tfidf.toarray(), columns=p.vectorizer.get_feature_names_out(), index=X.index)
+        expected = dense[p.tfidf_top_features]
+        pd.testing.assert_frame_equal(X[p.tfidf_top_features], expected)
+        pd.testing.assert_series_equal(X['amenity_score'], expected.sum(axis=1), check_names=False)
+
+    def test_amenity_counts(self):
+        expected = self.X['amenities'].fillna('').apply(lambda x: len(str(x).strip("{}").split(',')))
+        result = self.preprocessor.transform(self.X)['n_amenities']
+        pd.testing.assert_series_equal(result, expected, check_names=False)
+
+
+class SingleListingFastPathTests(SimpleTestCase):
+    """``transform_one`` must give the row ``transform`` gives, without pandas."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        raw = raw_listings(300, seed=1)
+        cls.preprocessor = DataPreprocessor().fit(raw.drop(columns=['log_price']), raw['log_price'])
+
+    def assert_rows_match(self, X):
+        expected = self.preprocessor.transform(X)
+        self.assertEqual(expected.columns.tolist(), self.preprocessor.output_features())
+        for i, listing in enumerate(X.to_dict('records')):
+            np.testing.assert_allclose(self.preprocessor.listing_vector(listing),
+                                       expected.iloc[i].to_numpy(dtype=float), rtol=1e-12, atol=1e-12,
+                                       equal_nan=True, err_msg=f"row {i}")
+
+    def test_matches_transform_on_sample_listings(self):
+        self.assert_rows_match(raw_listings(80, seed=2).drop(columns=['log_price']))
+
+    def test_matches_transform_with_missing_fields(self):
+        # make_listings has missing dates, ratings, descriptions and imputed columns
+        X = make_listings(n=60, seed=3)
+        X.loc[0, "city"] = "Atlantis"
+        X.loc[1, "first_review"] = "not a date"
+        X.loc[2, "amenities"] = "{}"
+        self.assert_rows_match(X)
+
+    def test_form_fields(self):
+        for listing in raw_listings(10, seed=4).to_dict('records'):
+            data = form_data(listing)
+            data['amenities'] = format_amenities_from_string(data['amenities'])
+            expected = self.preprocessor.transform(pd.DataFrame([data]))
+            result = self.preprocessor.transform_one(data)
+            self.assertEqual(result.columns.tolist(), expected.columns.tolist())
+            np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(dtype=float), rtol=1e-12, atol=1e-12)
+
+    def test_lookup_tables_stay_out_of_pickles_and_store_keys(self):
+        listing = raw_listings(1, seed=5).drop(columns=['log_price']).iloc[0].to_dict()
+        key = preprocessor_key(self.preprocessor)
+        vector = self.preprocessor.listing_vector(listing)
+        self.assertEqual(preprocessor_key(self.preprocessor), key)
+        restored = pickle.loads(pickle.dumps(self.preprocessor))
+        self.assertIsNone(restored._single_plan)
+        np.testing.assert_array_equal(restored.listing_vector(listing), vector)
+
+
+class BulkScoringTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.preprocessor, cls.clusterer, cls.model = make_pipeline()
+        cls.listings = make_listings(n=90, seed=7)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.input = os.path.join(self.tmp.name, "listings.csv")
+        self.output = os.path.join(self.tmp.name, "scores.csv")
+        self.listings.to_csv(self.input, index=False)
+
+    def scorer(self, version="v1", output=None, **kwargs):
+        bundle = make_bundle(self.preprocessor, self.clusterer, self.model, version=version)
+        return BulkScorer(bundle, self.input, output or self.output, chunksize=25, log=lambda line: None, **kwargs)
+
+    def expected_prices(self):
+        # From the CSV as written, where empty descriptions read back as NaN
+        X = self.preprocessor.transform(pd.read_csv(self.input))
+        return np.round(np.exp(self.model.predicts(X, self.clusterer.predict(X))), 2)
+
+    def test_only_changed_listings_are_rescored(self):
+        summary = self.scorer().run()
+        self.assertEqual((summary['rows'], summary['scored'], summary['reused']), (90, 90, 0))
+        scores = pd.read_csv(self.output)
+        self.assertEqual(scores['id'].tolist(), self.listings['id'].tolist())
+        np.testing.assert_allclose(scores['price'], self.expected_prices(), rtol=1e-9)
+
+        changed = self.listings.copy()
+        changed.loc[[3, 40, 77], 'accommodates'] += 2
+        changed.to_csv(self.input, index=False)
+        summary = self.scorer().run()
+        self.assertEqual((summary['scored'], summary['reused']), (3, 87))
+        np.testing.assert_allclose(pd.read_csv(self.output)['price'], self.expected_prices(), rtol=1e-9)
+
+        self.assertEqual(self.scorer(version="v2").run()['scored'], 90)
+        self.assertEqual(self.scorer(version="v2").run(full=True)['scored'], 90)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['listings.csv', 'scores.csv'])
+
+    def test_crashed_run_resumes_from_its_checkpoint(self):
+        scorer = self.scorer()
+        write_part = scorer._write_part
+
+        def crash_on_third_part(number, scores):
+            if number == 2:
+                raise OSError("disk full")
+            write_part(number, scores)
+
+        with mock.patch.object(scorer, '_write_part', crash_on_third_part):
+            with self.assertRaises(OSError):
+                scorer.run()
+        self.assertFalse(os.path.exists(self.output))
+
+        with mock.patch.object(self.preprocessor, 'transform', wraps=self.preprocessor.transform) as transform:
+            summary = self.scorer().run()
+        self.assertEqual(sum(len(call.args[0]) for call in transform.call_args_list), 40)
+        self.assertEqual((summary['rows'], summary['scored']), (90, 90))
+        scores = pd.read_csv(self.output)
+        self.assertEqual(scores['row'].tolist(), list(range(90)))
+        np.testing.assert_allclose(scores['price'], self.expected_prices(), rtol=1e-9)
+
+    def test_crash_while_cleaning_up_does_not_strand_the_job(self):
+        for target in ('os.remove', 'shutil.rmtree'):
+            scorer = self.scorer()
+            assemble, real = scorer._assemble, {'os.remove': os.remove, 'shutil.rmtree': shutil.rmtree}[target]
+            assembled = []
+
+            def assemble_once(*args):
+                assemble(*args)
+                assembled.append(True)
+
+            def crash_after_assembly(path, *args, **kwargs):
+                if assembled:
+                    raise KeyboardInterrupt
+                return real(path, *args, **kwargs)
+
+            with mock.patch.object(scorer, '_assemble', assemble_once), \
+                    mock.patch(f'pricifier.scoring.{target}', side_effect=crash_after_assembly):
+                with self.assertRaises(KeyboardInterrupt):
+                    scorer.run(restart=True)
+            self.assertEqual(self.scorer().run()['rows'], 90, msg=target)
+            np.testing.assert_allclose(pd.read_csv(self.output)['price'], self.expected_prices(), rtol=1e-9)
+
+        # A checkpoint whose parts are gone, as the old cleanup order could leave, starts over
+        with open(scorer.checkpoint_path, 'w') as f:
+            json.dump({"key": scorer._run_key(), "rows_done": 90, "parts": 4, "scored": 90, "reused": 0}, f)
+        summary = self.scorer().run(full=True)
+        self.assertEqual((summary['rows'], summary['scored']), (90, 90))
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['listings.csv', 'scores.csv'])
+
+    def test_management_command(self):
+        save_bundle(os.path.join(self.tmp.name, "bundles"), self.preprocessor, self.clusterer, self.model,
+                    version="nightly")
+        bundle = os.path.join(self.tmp.name, "bundles", "nightly")
+        out = io.StringIO()
+        call_command('score_listings', self.input, self.output, '--bundle', bundle, '--chunksize', '40', stdout=out)
+        self.assertIn('Wrote 90 prices', out.getvalue())
+        self.assertEqual(set(pd.read_csv(self.output)['model_version']), {'nightly'})
+
+        parquet = os.path.join(self.tmp.name, "scores.parquet")
+        if importlib.util.find_spec("pyarrow") is None:
+            with self.assertRaises(CommandError):
+                call_command('score_listings', self.input, parquet, '--bundle', bundle, stdout=io.StringIO())
+        else:
+            call_command('score_listings', self.input, parquet, '--bundle', bundle, stdout=io.StringIO())
+            pd.testing.assert_frame_equal(pd.read_parquet(parquet), pd.read_csv(self.output), check_dtype=False)
+
+
+def vary(listing, point):
+    """``listing`` with the variation of one what-if grid ``point`` (dimension to value) applied."""
+    varied = dict(listing)
+    for name, value in point.items():
+        if name == "amenities":
+            varied["amenities"] = edit_amenities(listing.get("amenities"), value.get("add", ()), value.get("remove", ()))
+        elif name == "offset_km":
+            varied["latitude"], varied["longitude"] = (
+                float(v) for v in offset_coordinates(listing["latitude"], listing["longitude"], *value))
+        else:
+            varied[name] = value
+    return varied
+
+
+class PriceGridTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.preprocessor, cls.clusterer, cls.model = make_pipeline()
+        cls.room_types = cls.preprocessor.encoders["mapping"]["room_type"]
+        cls.listing = dict(LISTING, amenities=format_amenities_from_string(LISTING['amenities']))
+
+    def predict_one(self, listing):
+        X = self.preprocessor.transform_one(listing)
+        return np.round(np.exp(self.model.predicts(X, self.clusterer.predict(X))), 2)[0]
+
+    def test_edit_amenities(self):
+        self.assertEqual(edit_amenities('{"TV","Kitchen"}', add=["Pool", "TV"], remove=["Kitchen"]), '{"TV","Pool"}')
+        self.assertEqual(edit_amenities('{}', remove=["TV"]), '{}')
+
+    def test_every_point_matches_a_single_prediction(self):
+        grid = {
+            'accommodates': [1, 4], 'beds': [1, 3], 'room_type': ['Private room', 'Entire home/apt'],
+            'amenities': [{}, {'add': ['Pool', 'Elevator']}, {'remove': ['TV']}],
+            'offset_km': [[0, 0], [0.8, -0.5]],
+        }
+        dimensions = validate_grid(grid, self.room_types, 1000)
+        result = price_grid(self.preprocessor, self.clusterer, self.model, self.listing, dimensions)
+        self.assertEqual(result['shape'], [2, 2, 2, 3, 2])
+        prices = np.array(result['prices'])
+        for index in np.ndindex(*result['shape']):
+            point = {name: values[i] for (name, values), i in zip(dimensions, index)}
+            np.testing.assert_allclose(prices[index], self.predict_one(vary(self.listing, point)), rtol=1e-9,
+                                       err_msg=str(point))
+        self.assertEqual(result['base']['price'], self.predict_one(self.listing))
+        self.assertNotEqual(prices[0, 0, 0, 0, 0], prices[1, 0, 0, 0, 0])
+
+    def test_invalid_grids(self):
+        for grid in ({}, {'bedrooms': [1]}, {'beds': []}, {'beds': [-1]}, {'room_type': ['Castle']},
+                     {'amenities': [{'add': 'Pool'}]}, {'offset_km': [[1]]}, {'accommodates': list(range(1, 12))}):
+            with self.assertRaises(GridError, msg=grid):
+                validate_grid(grid, self.room_types, 10)
+
+    def test_thousands_of_points_in_one_call(self):
+        dimensions = validate_grid({
+            'accommodates': list(range(1, 11)), 'room_type': list(self.room_types),
+            'offset_km': [[north, east] for north in np.linspace(-2, 2, 12) for east in np.linspace(-2, 2, 12)],
+        }, self.room_types, 10000)
+        with mock.patch.object(self.clusterer, 'predict', wraps=self.clusterer.predict) as cluster_predict:
+            result = price_grid(self.preprocessor, self.clusterer, self.model, self.listing, dimensions)
+        cluster_predict.assert_called_once()
+        prices = np.array(result['prices'])
+        self.assertEqual(prices.shape, (10, len(self.room_types), 144))
+        self.assertTrue(np.isfinite(prices).all())
+
+
+class StreamingFitTests(SimpleTestCase):
+    """``fit_chunks`` must reach the same state as ``fit`` on all rows at once."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.X = make_listings(n=300, seed=1)
+        cls.batch = DataPreprocessor().fit(cls.X)
+
+    def assert_same_fit(self, streamed):
+        batch = self.batch
+        self.assertEqual(streamed.vectorizer.vocabulary_, batch.vectorizer.vocabulary_)
+        np.testing.assert_array_equal(streamed.vectorizer.idf_, batch.vectorizer.idf_)
+        self.assertEqual(streamed.tfidf_top_features, batch.tfidf_top_features)
+        for col, imputer in batch.imputers.items():
+            np.testing.assert_array_equal(streamed.imputers[col].statistics_, imputer.statistics_)
+        np.testing.assert_allclose(streamed.scaler.data_min_, batch.scaler.data_min_)
+        np.testing.assert_allclose(streamed.scaler.data_max_, batch.scaler.data_max_)
+        np.testing.assert_allclose(streamed.amenity_scaler.mean_, batch.amenity_scaler.mean_)
+        np.testing.assert_allclose(streamed.amenity_scaler.var_, batch.amenity_scaler.var_)
+        self.assertEqual(sorted(streamed.final_feature_names), sorted(batch.final_feature_names))
+
+        streamed.final_feature_names = batch.final_feature_names
+        pd.testing.assert_frame_equal(streamed.transform(self.X), batch.transform(self.X), rtol=1e-12)
+
+    def test_fit_chunks_matches_fit(self):
+        chunks = [self.X.iloc[start:start + 70] for start in range(0, len(self.X), 70)]
+        self.assert_same_fit(DataPreprocessor().fit_chunks(chunks))
+
+    def test_fit_from_chunked_csv(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "listings.csv")
+            self.X.to_csv(path, index=False)
+            source = ChunkedCsv(path, chunksize=64)
+            self.assertEqual(max(len(chunk) for chunk in source), 64)
+            self.assert_same_fit(DataPreprocessor().fit_chunks(source))
+
+    def test_reservoir_sample_is_uniform(self):
+        frame = pd.DataFrame({"row": np.arange(50)})
+        chunks = [frame.iloc[start:start + 7] for start in range(0, 50, 7)]
+        hits = np.zeros(50)
+        for seed in range(400):
+            sample = reservoir_sample(chunks, 10, seed=seed)
+            self.assertEqual(len(sample), 10)
+            self.assertEqual(sample["row"].nunique(), 10)
+            hits[sample["row"]] += 1
+        # Each row is kept with probability 10 / 50, so about 80 times in 400 draws
+        self.assertLess(np.abs(hits - 80).max(), 35)
+        self.assertEqual(len(reservoir_sample(chunks, 100)), 50)
+
+
+class GeoIndexTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = np.random.default_rng(6)
+        cls.lat = rng.uniform(40.70, 40.80, 400)
+        cls.lon = rng.uniform(-74.02, -73.93, 400)
+        cls.log_price = rng.normal(4.5, 0.5, 400)
+        cls.index = GeoIndex(radius_km=1.0, k=8).fit(cls.lat, cls.lon, cls.log_price)
+
+    def brute_force(self, lat, lon):
+        lat1, lon1, lat2, lon2 = map(np.radians, [lat, lon, self.lat, self.lon])
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        distances = 6371.0 * 2 * np.arcsin(np.sqrt(a))
+        others = distances > 1e-6
+        nearest = np.argsort(np.where(others, distances, np.inf))[:8]
+        in_radius = nearest[distances[nearest] <= 1.0]
+        median = np.median(self.log_price[in_radius]) if len(in_radius) else np.median(self.log_price)
+        return (others & (distances <= 1.0)).sum(), distances[nearest].mean(), median
+
+    def test_matches_brute_force_and_excludes_self(self):
+        queries_lat = np.concatenate([self.lat[:20], [40.75, 40.71]])
+        queries_lon = np.concatenate([self.lon[:20], [-73.99, -74.01]])
+        features = self.index.features(queries_lat, queries_lon)
+        for i, (lat, lon) in enumerate(zip(queries_lat, queries_lon)):
+            count, distance, median = self.brute_force(lat, lon)
+            self.assertEqual(features['neighbors_within_radius'][i], count)
+            self.assertAlmostEqual(features['knn_mean_distance_km'][i], distance, places=9)
+            self.assertAlmostEqual(features['knn_median_log_price'][i], median)
+
+    def test_duplicate_coordinates_still_give_k_neighbours(self):
+        # Six training listings share one rounded coordinate with the query
+        lat = np.concatenate([self.lat, np.full(6, 40.75)])
+        lon = np.concatenate([self.lon, np.full(6, -73.99)])
+        log_price = np.concatenate([self.log_price, np.full(6, 9.0)])
+        index = GeoIndex(radius_km=1.0, k=8).fit(lat, lon, log_price)
+        features = index.features([40.75, self.lat[0]], [-73.99, self.lon[0]])
+        for i, (query_lat, query_lon) in enumerate([(40.75, -73.99), (self.lat[0], self.lon[0])]):
+            count, distance, median = self.brute_force(query_lat, query_lon)
+            self.assertEqual(features['neighbors_within_radius'][i], count)
+            self.assertAlmostEqual(features['knn_mean_distance_km'][i], distance, places=9)
+            self.assertAlmostEqual(features['knn_median_log_price'][i], median)
+
+    def test_features_do_not_depend_on_the_batch(self):
+        batch = self.index.features(self.lat[:50], self.lon[:50])
+        single = self.index.features(self.lat[7:8], self.lon[7:8])
+        pd.testing.assert_frame_equal(single, batch.iloc[[7]].reset_index(drop=True))
+
+    def test_missing_coordinates_and_pickle(self):
+        features = self.index.features([np.nan], [-73.99])
+        self.assertEqual(features.iloc[0].tolist(), [0.0, -1.0, np.median(self.log_price)])
+        restored = pickle.loads(pickle.dumps(self.index))
+        pd.testing.assert_frame_equal(restored.features(self.lat, self.lon), self.index.features(self.lat, self.lon))
+
+
+class ComparablesIndexTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.listings = make_listings(n=150, seed=8)
+        cls.log_price = np.log(40 + 25 * cls.listings['accommodates'].to_numpy())
+        cls.preprocessor = DataPreprocessor().fit(cls.listings)
+        cls.X = cls.preprocessor.transform(cls.listings)
+        cls.clusterer = ClusterFit(cluster_features=cluster_features, n_clusters=3)
+        cls.clusterer.fit(cls.X)
+        cls.index = ComparablesIndex(geo_scale_km=2.0).fit(cls.clusterer, cls.X, cls.log_price, listings=cls.listings)
+
+    def test_matches_brute_force(self):
+        queries = self.preprocessor.transform(make_listings(n=10, seed=9))
+        results = self.index.query(queries, k=4)
+        points = self.index.vectors(self.X)
+        for query, found in zip(self.index.vectors(queries), results):
+            distances = np.linalg.norm(points - query, axis=1)
+            nearest = np.argsort(distances)[:4]
+            self.assertEqual([c['id'] for c in found], self.listings['id'].iloc[nearest].tolist())
+            np.testing.assert_allclose([c['similarity_distance'] for c in found], distances[nearest])
+            np.testing.assert_allclose([c['price'] for c in found],
+                                       np.round(np.exp(self.log_price[nearest]), 2))
+            self.assertIn(found[0]['city'], CITY_BOUNDS)
+
+    def test_training_listing_finds_itself_first(self):
+        found = self.index.query(self.X.iloc[[5]], k=3)[0]
+        self.assertEqual(found[0]['id'], self.listings['id'].iloc[5])
+        self.assertAlmostEqual(found[0]['similarity_distance'], 0.0)
+        self.assertAlmostEqual(found[0]['distance_km'], 0.0)
+        self.assertEqual(found[0]['room_type'], self.listings['room_type'].iloc[5])
+
+    def test_geography_pulls_in_nearby_listings(self):
+        query = self.X.iloc[[0]].copy()
+        far = ComparablesIndex(geo_scale_km=1e6).fit(self.clusterer, self.X, self.log_price, listings=self.listings)
+        near = ComparablesIndex(geo_scale_km=0.01).fit(self.clusterer, self.X, self.log_price, listings=self.listings)
+        far_km = np.mean([c['distance_km'] for c in far.query(query, k=5)[0]])
+        near_km = np.mean([c['distance_km'] for c in near.query(query, k=5)[0]])
+        self.assertLess(near_km, far_km)
+
+    def test_memory_mapped_through_a_bundle(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = save_bundle(tmp, self.preprocessor, self.clusterer, {"m": 1}, version="v1",
+                               comparables=self.index)
+            bundle = load_bundle(path, mmap_mode="r")
+            self.assertIsInstance(bundle.comparables.tree.get_arrays()[0], np.memmap)
+            # Compared as JSON since missing bathrooms are NaN
+            self.assertEqual(json.dumps(bundle.comparables.query(self.X.iloc[:3])),
+                             json.dumps(self.index.query(self.X.iloc[:3])))
+            self.assertIsNone(load_bundle(save_bundle(tmp, 1, 2, 3, version="v2")).comparables)
+
+
+class FeatureStoreTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.X = make_listings(n=120, seed=4)
+        cls.preprocessor = DataPreprocessor().fit(cls.X)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = FeatureStore(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def transform_spy(self):
+        return mock.patch.object(DataPreprocessor, "transform", autospec=True, side_effect=DataPreprocessor.transform)
+
+    def test_round_trip_is_memory_mapped(self):
+        with self.transform_spy() as spy:
+            first = self.store.transform(self.preprocessor, self.X)
+            second = self.store.transform(self.preprocessor, self.X)
+        self.assertEqual(spy.call_count, 1)
+        expected = self.preprocessor.transform(self.X)
+        self.assertEqual(first.columns.tolist(), expected.columns.tolist())
+        np.testing.assert_array_equal(second.to_numpy(), expected.to_numpy(dtype=float))
+        self.assertFalse(second.to_numpy().flags.writeable)
+
+    def test_only_changed_rows_are_recomputed(self):
+        self.store.transform(self.preprocessor, self.X)
+        changed = self.X.copy()
+        changed.loc[[3, 50], 'accommodates'] += 2
+        changed.loc[7, 'description'] = "Brand new loft with a rooftop terrace"
+        with self.transform_spy() as spy:
+            features = self.store.transform(self.preprocessor, changed)
+        self.assertEqual(len(spy.call_args.args[1]), 3)
+        np.testing.assert_array_equal(features.to_numpy(), self.preprocessor.transform(changed).to_numpy(dtype=float))
+
+    def test_refit_preprocessor_gets_its_own_entry(self):
+        refit = DataPreprocessor().fit(make_listings(n=120, seed=5))
+        self.assertNotEqual(preprocessor_key(refit), preprocessor_key(self.preprocessor))
+        self.assertEqual(preprocessor_key(pickle.loads(pickle.dumps(self.preprocessor))),
+                         preprocessor_key(self.preprocessor))
+
+
+class TextFeatureCacheTests(SimpleTestCase):
+    def test_counts_hits_and_misses(self):
+        cache = TextFeatureCache(maxsize=10)
+        calls = []
+
+        def compute(text):
+            calls.append(text)
+            return len(text)
+
+        self.assertEqual(cache.map("f", ["a b", "a  b ", None, "c"], lambda t: compute(t) if t else 0), [3, 3, 0, 1])
+        self.assertEqual(cache.map("f", ["c"], compute), [1])
+        self.assertEqual(calls, ["a b", "c"])
+        self.assertEqual(cache.stats()["misses"], 2)
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_lru_is_bounded(self):
+        cache = TextFeatureCache(maxsize=2)
+        cache.map("f", ["a", "b", "c"], len)
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_disk_store_survives_new_instance(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.sqlite3")
+            TextFeatureCache(path=path).map("f", ["hello world"], len)
+            cache = TextFeatureCache(path=path)
+            self.assertEqual(cache.map("f", ["hello world"], lambda t: -1), [11])
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+
+    def test_disk_store_is_bounded_without_counting_every_write(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = TextFeatureCache(maxsize=1, path=os.path.join(tmp, "cache.sqlite3"), max_disk_entries=50)
+            cache.prune_headroom = 0.2
+            statements = []
+            cache._connection().set_trace_callback(statements.append)
+            for i in range(120):
+                cache.map("f", [f"text {i}"], len)
+            counts = [sql for sql in statements if "COUNT(*)" in sql]
+            rows = cache._connection().execute("SELECT COUNT(*) FROM text_features").fetchone()[0]
+            self.assertLessEqual(rows, 50)
+            self.assertLessEqual(len(counts), 10)
+            self.assertEqual(cache.map("f", ["text 119"], lambda t: -1), [len("text 119")])
+
+    def test_threads_share_a_disk_backed_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = TextFeatureCache(maxsize=8, path=os.path.join(tmp, "cache.sqlite3"), max_disk_entries=40)
+
+            def work(n):
+                texts = [f"text {(n + i) % 60}" for i in range(12)]
+                return texts, cache.map("f", texts, len)
+
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(work, range(200)))
+
+            for texts, values in results:
+                self.assertEqual(values, [len(text) for text in texts])
+            rows = cache._connection().execute("SELECT COUNT(*) FROM text_features").fetchone()[0]
+            self.assertLessEqual(rows, 40)
+
+    def test_cached_transform_matches_cold_transform(self):
+        X = make_listings()
+        preprocessor = DataPreprocessor().fit(X)
+        previous = text_cache.get_text_cache()
+        try:
+            text_cache.configure_text_cache()
+            first = preprocessor.transform(X)
+            second = preprocessor.transform(X)
+            self.assertGreater(text_cache.get_text_cache().stats()["hits"], 0)
+        finally:
+            text_cache.text_cache = previous
+        pd.testing.assert_frame_equal(first, second)
+
+
+class ParallelTextFeatureTests(SimpleTestCase):
+    def test_process_pool_matches_serial(self):
+        X = make_listings(n=40)
+        X['description'] = [f"{text} #{i}" if isinstance(text, str) else text
+                            for i, text in enumerate(X['description'])]
+        serial = DataPreprocessor()
+        parallel = DataPreprocessor(n_jobs=2, chunk_size=7, parallel_threshold=0)
+        previous = text_cache.get_text_cache()
+        try:
+            text_cache.configure_text_cache()
+            expected = serial.objectivity_score(serial.sentiment_score(X.copy()))
+            text_cache.configure_text_cache()
+            result = parallel.objectivity_score(parallel.sentiment_score(X.copy()))
+        finally:
+            text_cache.text_cache = previous
+        pd.testing.assert_series_equal(result['sentiment'], expected['sentiment'])
+        pd.testing.assert_series_equal(result['objectivity'], expected['objectivity'])
+
+
+class ConcurrentTransformTests(SimpleTestCase):
+    """``transform`` must not mutate the fitted preprocessor, so threads can share it."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.X = make_listings(n=80, seed=3)
+        cls.preprocessor = DataPreprocessor().fit(cls.X)
+
+    def test_transform_has_no_side_effects(self):
+        before = pickle.dumps(self.preprocessor.__getstate__())
+        self.preprocessor.transform(self.X.iloc[:1])
+        self.preprocessor.transform(self.X.iloc[5:40])
+        self.assertEqual(pickle.dumps(self.preprocessor.__getstate__()), before)
+
+    def test_single_row_matches_batch(self):
+        batch = self.preprocessor.transform(self.X)
+        row = self.preprocessor.transform(self.X.iloc[[7]])
+        pd.testing.assert_frame_equal(row, batch.iloc[[7]])
+
+    def test_parallel_predictions_match_serial(self):
+        rows = [self.X.iloc[[i]] for i in range(0, len(self.X), 2)] * 2
+        batches = [self.X.iloc[i:i + 9] for i in range(0, len(self.X), 9)]
+        requests = rows + batches
+        expected = [self.preprocessor.transform(X) for X in requests]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(self.preprocessor.transform, requests))
+        for result, serial in zip(results, expected):
+            pd.testing.assert_frame_equal(result, serial)
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def test_concurrent_requests_are_coalesced(self):
+        batch_sizes = []
+
+        def predict_fn(df):
+            batch_sizes.append(len(df))
+            time.sleep(0.01)  # let requests queue up behind a running batch
+            return (df['x'] * 2).to_numpy(), (df['x'] % 3).to_numpy()
+
+        batcher = MicroBatcher(predict_fn, max_batch_size=8, max_wait_ms=50)
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda x: batcher.predict({'x': x}, timeout=5), range(40)))
+
+        self.assertEqual(results, [(2 * x, x % 3) for x in range(40)])
+        self.assertEqual(sum(batch_sizes), 40)
+        self.assertLessEqual(max(batch_sizes), 8)
+        self.assertGreater(max(batch_sizes), 1)
+        self.assertEqual(batcher.stats()['requests'], 40)
+
+    def test_lone_request_does_not_wait(self):
+        batcher = MicroBatcher(lambda df: ((df['x'] * 2).to_numpy(),), max_wait_ms=60000)
+        self.assertEqual(batcher.predict({'x': 1}, timeout=5), (2,))
+        self.assertEqual(batcher.predict({'x': 2}, timeout=5), (4,))
+        self.assertEqual(batcher.stats()['batches'], 2)
+
+    def test_requests_queued_together_share_a_batch(self):
+        started, release = threading.Event(), threading.Event()
+        batch_sizes = []
+
+        def predict_fn(df):
+            batch_sizes.append(len(df))
+            started.set()
+            release.wait(5)
+            return (df['x'] * 2).to_numpy(),
+
+        batcher = MicroBatcher(predict_fn, max_batch_size=8, max_wait_ms=1)
+        first = batcher.submit({'x': 0})
+        started.wait(5)
+        rest = [batcher.submit({'x': x}) for x in range(1, 6)]
+        release.set()
+        self.assertEqual([f.result(5) for f in [first, *rest]], [(2 * x,) for x in range(6)])
+        self.assertEqual(batch_sizes, [1, 5])
+
+    def test_errors_reach_every_caller(self):
+        def predict_fn(df):
+            raise ValueError("boom")
+
+        batcher = MicroBatcher(predict_fn, max_wait_ms=1)
+        with self.assertRaises(ValueError):
+            batcher.predict({'x': 1}, timeout=5)
+
+    def test_misshaped_output_fails_every_caller_and_keeps_serving(self):
+        started, release = threading.Event(), threading.Event()
+
+        def predict_fn(df):
+            started.set()
+            release.wait(5)
+            if df['x'].iloc[0] < 0:
+                return (df['x'] * 2).to_numpy(),
+            return (df['x'] * 2).to_numpy()[:1],
+
+        batcher = MicroBatcher(predict_fn, max_batch_size=8, max_wait_ms=1)
+        blocker = batcher.submit({'x': -1})
+        started.wait(5)
+        futures = [batcher.submit({'x': x}) for x in range(4)]
+        release.set()
+        self.assertEqual(blocker.result(5), (-2,))
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(5)
+        self.assertEqual(batcher.predict({'x': 3}, timeout=5), (6,))
+        self.assertTrue(batcher._worker.is_alive())
+
+    def test_predict_has_a_default_timeout(self):
+        release = threading.Event()
+
+        def predict_fn(df):
+            release.wait(5)
+            return (df['x'] * 2).to_numpy(),
+
+        batcher = MicroBatcher(predict_fn, timeout_seconds=0.05)
+        with self.assertRaises(FuturesTimeoutError):
+            batcher.predict({'x': 1})
+        release.set()
+
+
+class PredictionCacheTests(SimpleTestCase):
+    def setUp(self):
+        from django.core.cache.backends.locmem import LocMemCache
+        self.cache = PredictionCache(LocMemCache("prediction-cache-tests", {}))
+        self.cache.cache.clear()
+        self.calls = []
+
+    def predict_fn(self, rows):
+        self.calls.append(rows)
+        return [float(row['accommodates']) for row in rows], [0] * len(rows), [[]] * len(rows)
+
+    def test_equivalent_listings_share_a_key(self):
+        listing = dict(LISTING, amenities='{"TV","Kitchen"}', description='Sunny  flat\n')
+        same = dict(LISTING, amenities='Kitchen, TV', description=' Sunny flat')
+        self.assertEqual(canonical_listing(listing)['amenities'], '{"Kitchen","TV"}')
+        self.assertEqual(listing_key(listing, "v1", 5), listing_key(same, "v1", 5))
+        self.assertNotEqual(listing_key(listing, "v1", 5), listing_key(listing, "v2", 5))
+        self.assertNotEqual(listing_key(listing, "v1", 5), listing_key(listing, "v1", 2))
+        self.assertNotEqual(listing_key(listing, "v1", 5), listing_key(dict(listing, bedrooms=2), "v1", 5))
+
+    def test_only_distinct_misses_are_computed(self):
+        rows = [dict(LISTING, accommodates=2), dict(LISTING, accommodates=3), dict(LISTING, accommodates=2)]
+        prices, _, _ = self.cache.predict(rows, "v1", 5, self.predict_fn)
+        self.assertEqual(prices, [2.0, 3.0, 2.0])
+        self.assertEqual([len(rows) for rows in self.calls], [2])
+
+        prices, _, _ = self.cache.predict(rows + [dict(LISTING, accommodates=4)], "v1", 5, self.predict_fn)
+        self.assertEqual(prices, [2.0, 3.0, 2.0, 4.0])
+        self.assertEqual([len(rows) for rows in self.calls], [2, 1])
+        self.assertEqual(self.cache.stats()["hits"], 3)
+
+    def test_new_model_version_misses(self):
+        self.cache.predict([LISTING], "v1", 5, self.predict_fn)
+        self.cache.predict([LISTING], "v2", 5, self.predict_fn)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_async_lookups_share_entries(self):
+        async def predict_fn(rows):
+            return self.predict_fn(rows)
+
+        self.cache.predict([LISTING], "v1", 5, self.predict_fn)
+        prices, _, _ = asyncio.run(self.cache.apredict([LISTING, dict(LISTING, accommodates=6)], "v1", 5, predict_fn))
+        self.assertEqual(prices, [float(LISTING['accommodates']), 6.0])
+        self.assertEqual([len(rows) for rows in self.calls], [1, 1])
+
+    def test_legacy_fingerprint_follows_the_files(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "model.pkl")
+            joblib.dump([1], path)
+            registry = ArtifactRegistry()
+            registry.register("model", path)
+            before = registry.fingerprint()
+            self.assertEqual(registry.fingerprint(), before)
+            joblib.dump([1, 2], path)
+            self.assertNotEqual(registry.fingerprint(), before)
+
+
+class StageProfilerTests(SimpleTestCase):
+    def test_percentiles_over_the_window(self):
+        stages = StageProfiler(window=100)
+        for ms in range(1, 201):
+            stages.record("tfidf", ms / 1000)
+        stats = stages.stats()["tfidf"]
+        self.assertEqual(stats["count"], 200)
+        self.assertAlmostEqual(stats["p50_ms"], 150.5)
+        self.assertAlmostEqual(stats["max_ms"], 200.0)
+        self.assertAlmostEqual(stats["p99_ms"], np.percentile(np.arange(101, 201), 99))
+
+    def test_trace_collects_this_threads_stages_and_merged_work(self):
+        stages = StageProfiler()
+        with stages.stage("outside"):
+            pass
+        with stages.trace() as trace:
+            with stages.stage("vader"):
+                pass
+            with stages.stage("vader"):
+                pass
+            stages.merge(stages.current(), {"tfidf": 0.002})
+        self.assertEqual(set(trace), {"vader", "tfidf"})
+        self.assertEqual(stages.stats()["vader"]["count"], 2)
+        self.assertIsNone(stages.current())
+        self.assertEqual(server_timing({"tfidf": 0.002}), "tfidf;dur=2.000")
+
+    def test_sampled_traces_keep_a_cprofile_report(self):
+        stages = StageProfiler(sample_rate=1.0, keep=2)
+        for _ in range(3):
+            with stages.trace("/predict/"):
+                self.assertTrue(stages.profiling())
+                with stages.stage("haversine"):
+                    sum(range(1000))
+        self.assertEqual(len(stages.profiles), 2)
+        self.assertIn("haversine", stages.profiles[-1]["stages_ms"])
+        self.assertIn("function calls", stages.profiles[-1]["stats"])
+        self.assertFalse(stages.profiling())
+
+    def test_disabled_profiler_records_nothing(self):
+        stages = StageProfiler(enabled=False)
+        with stages.stage("vader"):
+            pass
+        self.assertEqual(stages.stats(), {})
+
+    def test_batcher_credits_batch_stages_to_each_caller(self):
+        def predict_fn(df):
+            with profiler.stage("cluster_predict"):
+                return df['x'].to_numpy(), df['x'].to_numpy()
+
+        batcher = MicroBatcher(predict_fn, max_wait_ms=1)
+        with profiler.trace() as trace:
+            batcher.predict({'x': 1}, timeout=5)
+        self.assertEqual(set(trace), {"cluster_predict", "batch_wait"})
+
+
+class BoundedExecutorTests(SimpleTestCase):
+    def test_rejects_beyond_workers_plus_queue(self):
+        executor = BoundedExecutor(max_workers=1, max_queue=2)
+        started, release = threading.Event(), threading.Event()
+
+        def blocker():
+            started.set()
+            return release.wait(5)
+
+        futures = [executor.submit(blocker)]
+        started.wait(5)
+        futures += [executor.submit(blocker) for _ in range(2)]
+        with self.assertRaises(ExecutorFull):
+            executor.submit(blocker)
+        stats = executor.stats()
+        self.assertEqual((stats["running"], stats["queue_depth"], stats["rejected"]), (1, 2, 1))
+
+        release.set()
+        for future in futures:
+            self.assertTrue(future.result(timeout=5))
+        self.assertEqual(executor.submit(abs, -1).result(timeout=5), 1)
+        executor.shutdown()
+        stats = executor.stats()
+        self.assertEqual((stats["completed"], stats["queue_depth"], stats["max_queue_depth"]), (4, 0, 2))
+
+    def test_async_callers_share_the_workers_and_get_their_own_timings(self):
+        executor = BoundedExecutor(max_workers=2, max_queue=8)
+
+        def work(x):
+            with profiler.stage("cluster_predict"):
+                return x * 2
+
+        async def request(x):
+            with profiler.trace(sample=False) as trace:
+                result = await executor.run(work, x)
+            return result, trace
+
+        async def main():
+            return await asyncio.gather(*(request(x) for x in range(6)))
+
+        results = asyncio.run(main())
+        self.assertEqual([result for result, _ in results], [0, 2, 4, 6, 8, 10])
+        for _, trace in results:
+            self.assertEqual(set(trace), {"cluster_predict", "executor_wait"})
+        executor.shutdown()
+
+
+class ArtifactRegistryTests(SimpleTestCase):
+    def test_loads_lazily_with_mmap(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "artifact.pkl")
+            joblib.dump({"weights": np.arange(10000.0)}, path)
+            artifacts = ArtifactRegistry()
+            artifacts.register("thing", path, mmap_mode="r")
+            self.assertFalse(artifacts.is_loaded("thing"))
+
+            weights = artifacts.get("thing")["weights"]
+            self.assertIsInstance(weights, np.memmap)
+            self.assertIs(artifacts.get("thing")["weights"], weights)
+            self.assertEqual(artifacts.stats()["thing"]["file_bytes"], os.path.getsize(path))
+            self.assertGreaterEqual(artifacts.stats()["thing"]["load_seconds"], 0)
+            del weights
+
+    def test_forest_artifact_is_copied_on_load(self):
+        X = np.random.default_rng(0).normal(size=(200, 4))
+        forest = RandomForestRegressor(n_estimators=5, random_state=0).fit(X, X[:, 0])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "forest.pkl")
+            joblib.dump(forest, path)
+            artifacts = ArtifactRegistry()
+            artifacts.register("forest", path, mmap_mode="r")
+            loaded = artifacts.get("forest")
+            np.testing.assert_array_equal(loaded.predict(X), forest.predict(X))
+            # Tree.__setstate__ copies the node arrays, so mmap_mode cannot share them across workers
+            values = loaded.estimators_[0].tree_.value
+            self.assertFalse(isinstance(values, np.memmap) or isinstance(values.base, np.memmap))
+            self.assertEqual(artifacts.stats()["forest"]["mmap_mode"], "r")
+
+    def test_unknown_artifact(self):
+        with self.assertRaises(KeyError):
+            ArtifactRegistry().get("missing")
+
+
+class ModelBundleTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def publish(self, version, value):
+        return save_bundle(self.root, {"p": value}, {"c": value}, {"m": value},
+                           metadata={"n_rows": value}, version=version)
+
+    def test_round_trip_with_manifest(self):
+        path = self.publish("v1", 1)
+        bundle = load_bundle(path)
+        self.assertEqual(bundle.version, "v1")
+        self.assertEqual(bundle.model, {"m": 1})
+        self.assertEqual(bundle.manifest["metadata"], {"n_rows": 1})
+        self.assertEqual(set(bundle.manifest["checksums"]), {"preprocessor.pkl", "clusterer.pkl", "model.pkl"})
+        with self.assertRaises(BundleError):
+            self.publish("v1", 2)
+
+    def test_checksum_mismatch_is_rejected(self):
+        path = self.publish("v1", 1)
+        joblib.dump({"m": "tampered"}, os.path.join(path, "model.pkl"))
+        with self.assertRaises(BundleError):
+            load_bundle(path)
+
+    def test_hot_swap_keeps_old_bundle_until_new_one_is_loaded(self):
+        self.publish("v1", 1)
+        bundles = BundleRegistry(self.root, poll_seconds=0)
+        in_flight = bundles.current()
+        self.assertEqual(in_flight.version, "v1")
+
+        self.publish("v2", 2)
+        bundles.current()
+        bundles.reload(wait=True)
+        self.assertEqual(bundles.current().version, "v2")
+        self.assertEqual(bundles.current().model, {"m": 2})
+        self.assertEqual(in_flight.model, {"m": 1})
+        self.assertEqual(bundles.stats()["swaps"], 1)
+
+    def test_failed_load_keeps_serving(self):
+        self.publish("v1", 1)
+        bundles = BundleRegistry(self.root, poll_seconds=None)
+        bundles.current()
+        path = self.publish("v2", 2)
+        os.remove(os.path.join(path, "clusterer.pkl"))
+        bundles.reload(wait=True)
+        self.assertEqual(bundles.current().version, "v1")
+        self.assertIn("v2", bundles.stats()["last_error"])
+
+    def test_fallback_without_published_bundle(self):
+        bundles = BundleRegistry(self.root, fallback=lambda: make_bundle(1, 2, 3, version="legacy"))
+        self.assertEqual(bundles.current().version, "legacy")
+
+
+def small_gbr_space(trial):
+    return {
+        "n_estimators": trial.suggest_int("n_estimators", 5, 20),
+        "max_depth": trial.suggest_int("max_depth", 2, 4),
+        "random_state": 0,
+    }
+
+
+def uneven_gbr_space(trial):
+    return {
+        "n_estimators": 40,
+        "learning_rate": trial.suggest_float("learning_rate", 1e-4, 0.5, log=True),
+        "max_depth": 2,
+        "random_state": 0,
+    }
+
+
+class PrunedTuningTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.X = pd.DataFrame(np.random.default_rng(2).normal(size=(120, 3)), columns=list("abc"))
+        cls.y = cls.X["a"] * 3 + cls.X["b"]
+
+    def test_ridge_cv_rmse_is_mean_of_folds(self):
+        from sklearn.model_selection import KFold, cross_val_score
+        rmse, params, oof = cross_val_rmse(Ridge, {"alpha": 1.0}, self.X, self.y, cv=4)
+        expected = -cross_val_score(Ridge(alpha=1.0), self.X, self.y, cv=KFold(4, shuffle=True, random_state=42),
+                                    scoring="neg_root_mean_squared_error").mean()
+        self.assertAlmostEqual(rmse, expected)
+        self.assertEqual(params, {"alpha": 1.0})
+
+    def test_warm_started_growth_matches_cold_fit(self):
+        params = {"n_estimators": 40, "max_depth": 2, "random_state": 0}
+        rmse, fitted, oof = cross_val_rmse(GradientBoostingRegressor, params, self.X, self.y)
+        cold, _, cold_oof = cross_val_rmse(GradientBoostingRegressor, dict(params, n_estimators=fitted["n_estimators"]),
+                                 self.X, self.y, n_stages=1)
+        self.assertAlmostEqual(rmse, cold)
+        np.testing.assert_allclose(oof, cold_oof)
+
+    def test_hopeless_trials_are_pruned(self):
+        import optuna
+        study, oof = tune_model(GradientBoostingRegressor, uneven_gbr_space, self.X, self.y, n_trials=16, timeout=None)
+        states = [trial.state for trial in study.trials]
+        self.assertIn(optuna.trial.TrialState.PRUNED, states)
+        self.assertGreater(tuned_params(study)["learning_rate"], 0.05)
+        params = dict({"n_estimators": 40, "max_depth": 2, "random_state": 0}, **tuned_params(study))
+        best_rmse, _, best_oof = cross_val_rmse(GradientBoostingRegressor, params, self.X, self.y, n_stages=1)
+        self.assertAlmostEqual(best_rmse, study.best_value)
+        np.testing.assert_allclose(oof, best_oof)
+
+    def test_prefit_stacking_matches_stacking_regressor(self):
+        from sklearn.model_selection import KFold
+        bases = [("GradientBoosting", GradientBoostingRegressor, {"n_estimators": 20, "random_state": 0}),
+                 ("Ridge", Ridge, {"alpha": 1.0})]
+        cache = FitCache()
+        base_models = [(name, cache.fit(0, name, cls, params, self.X, self.y)) for name, cls, params in bases]
+        oof = np.column_stack([cache.oof(0, name, cls, params, self.X, self.y) for name, cls, params in bases])
+        self.assertIs(cache.fit(0, "Ridge", Ridge, {"alpha": 1.0}, self.X, self.y), base_models[1][1])
+
+        stacked = stack_prefit(base_models, oof, self.X, self.y)
+        reference = StackingRegressor([(name, cls(**params)) for name, cls, params in bases], final_estimator=Ridge(),
+                                      cv=KFold(3, shuffle=True, random_state=42)).fit(self.X, self.y)
+        np.testing.assert_allclose(stacked.predict(self.X), reference.predict(self.X))
+
+
+class ParallelTuningTests(SimpleTestCase):
+    def test_parallel_search_matches_serial(self):
+        X = pd.DataFrame(np.random.default_rng(0).normal(size=(150, 4)), columns=list("abcd"))
+        y = X["a"] * 2 + X["b"] ** 2
+        model_types = {"Ridge": (Ridge, ridge_space), "GradientBoosting": (GradientBoostingRegressor, small_gbr_space)}
+        tasks = [((cluster_id, name), (model_class, param_space, X[cluster_id::3], y[cluster_id::3], 4, None))
+                 for cluster_id in range(3) for name, (model_class, param_space) in model_types.items()]
+
+        serial, parallel = run_studies(tasks, n_jobs=1), run_studies(tasks, n_jobs=2)
+        self.assertEqual(list(serial), list(parallel))
+        for key, (study, oof) in serial.items():
+            parallel_study, parallel_oof = parallel[key]
+            self.assertEqual([t.params for t in study.trials], [t.params for t in parallel_study.trials])
+            self.assertEqual(study.best_value, parallel_study.best_value)
+            np.testing.assert_array_equal(oof, parallel_oof)
+
+    def test_fixed_seed_reproduces_shipped_spaces(self):
+        X = pd.DataFrame(np.random.default_rng(2).normal(size=(45, 3)), columns=list("abc"))
+        y = X["a"] * 2 + X["b"] ** 2 + np.random.default_rng(3).normal(0, 0.3, 45)
+        # More trials than TPE's 10 random startup trials, so the model-guided ones are covered
+        for model_class, param_space in ((RandomForestRegressor, rf_space), (GradientBoostingRegressor, gbr_space)):
+            first, first_oof = tune_model(model_class, param_space, X, y, 12, None, seed=7)
+            second, second_oof = tune_model(model_class, param_space, X, y, 12, None, seed=7)
+            self.assertEqual([t.params for t in first.trials], [t.params for t in second.trials])
+            self.assertEqual([t.value for t in first.trials], [t.value for t in second.trials])
+            self.assertEqual(tuned_params(first), tuned_params(second))
+            np.testing.assert_array_equal(first_oof, second_oof)
+
+    def test_fit_cluster_models_with_worker_pool(self):
+        X = pd.DataFrame(np.random.default_rng(1).normal(size=(90, 3)), columns=list("abc"))
+        y = X["a"] - X["c"]
+        labels = np.arange(90) % 3
+        model = ModelPerCluster(X.columns.tolist(), {"Ridge": (Ridge, ridge_space)}, labels,
+                                n_trials=3, timeout=None, n_jobs=2)
+        model.fit_cluster_models(X, y, labels)
+        self.assertEqual(set(model.cluster_models), {0, 1, 2})
+        self.assertEqual(model.predicts(X, labels).shape, (90,))
+
+
+def make_segments(n, seed=0, offset=0.0):
+    """Three well separated blobs over ``cluster_features``."""
+    rng = np.random.default_rng(seed)
+    centers = np.array([[0.0] * 10, [6.0] * 10, [-6.0] * 5 + [6.0] * 5]) + offset
+    rows = centers[rng.integers(0, 3, n)] + rng.normal(size=(n, 10))
+    return pd.DataFrame(rows, columns=cluster_features)
+
+
+class IncrementalClusterFitTests(SimpleTestCase):
+    def test_running_scaler_matches_full_fit(self):
+        chunks = [make_segments(200, seed=seed) for seed in range(4)]
+        clusterer = IncrementalClusterFit(cluster_features).fit_chunks(chunks)
+        full = pd.concat(chunks)
+        np.testing.assert_allclose(clusterer.scaler.mean_, full.mean().to_numpy())
+        np.testing.assert_allclose(clusterer.scaler.var_, full.var(ddof=0).to_numpy())
+        self.assertEqual(clusterer.n_seen, 800)
+        self.assertEqual(len(clusterer.drift_history), 3)
+
+    def test_cluster_ids_are_stable_and_drift_is_reported(self):
+        clusterer = IncrementalClusterFit(cluster_features)
+        history = make_segments(600, seed=0)
+        labels = clusterer.fit_predict(history)
+
+        same = clusterer.partial_fit(make_segments(200, seed=1))
+        self.assertLess(same["relabeled_share"], 0.01)
+        self.assertLess(same["max_centroid_shift"], 0.2)
+        np.testing.assert_array_equal(clusterer.predict(history), labels)
+
+        shifted = clusterer.partial_fit(make_segments(600, seed=2, offset=1.5))
+        self.assertGreater(shifted["max_centroid_shift"], 5 * same["max_centroid_shift"])
+        self.assertAlmostEqual(sum(shifted["cluster_shares"]), 1.0)
+
+
+    def test_centroids_move_by_the_count_weighted_mean(self):
+        clusterer = IncrementalClusterFit(cluster_features)
+        clusterer.fit(make_segments(600, seed=0))
+        counts = clusterer.counts.copy()
+        self.assertEqual(counts.sum(), 600)
+        centers_raw = clusterer.kmeans.cluster_centers_ * clusterer.scaler.scale_ + clusterer.scaler.mean_
+
+        chunk = make_segments(300, seed=4, offset=0.5)
+        clusterer.partial_fit(chunk)
+        previous = (centers_raw - clusterer.scaler.mean_) / clusterer.scaler.scale_
+        X_new = clusterer.scaler.transform(chunk)
+        assigned = np.argmin(((X_new[:, None, :] - previous[None, :, :]) ** 2).sum(axis=2), axis=1)
+        for cluster_id in range(3):
+            rows = X_new[assigned == cluster_id]
+            expected = (previous[cluster_id] * counts[cluster_id] + rows.sum(axis=0)) / (counts[cluster_id] + len(rows))
+            np.testing.assert_allclose(clusterer.kmeans.cluster_centers_[cluster_id], expected)
+        np.testing.assert_array_equal(clusterer.counts, counts + np.bincount(assigned, minlength=3))
+
+
+class CompiledModelTests(SimpleTestCase):
+    """The numpy-only predictors must agree with sklearn's ``predict``."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = np.random.default_rng(0)
+        cls.X = rng.normal(size=(300, 6))
+        cls.X[rng.random(cls.X.shape) < 0.05] *= 1e-7
+        cls.y = cls.X[:, 0] * 2 - cls.X[:, 1] ** 2 + np.sin(cls.X[:, 2]) + rng.normal(0, 0.1, 300)
+
+    def assert_parity(self, estimator, compiled_type):
+        estimator.fit(self.X, self.y)
+        compiled = compile_estimator(estimator)
+        self.assertIsInstance(compiled, compiled_type)
+        np.testing.assert_allclose(compiled.predict(self.X), estimator.predict(self.X), rtol=1e-10, atol=1e-12)
+        np.testing.assert_allclose(compiled.predict(self.X[:1]), estimator.predict(self.X[:1]), rtol=1e-10, atol=1e-12)
+
+    def test_ridge(self):
+        self.assert_parity(Ridge(alpha=2.0), LinearPredictor)
+
+    def test_random_forest(self):
+        self.assert_parity(RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0), TreeEnsemblePredictor)
+
+    def test_gradient_boosting(self):
+        self.assert_parity(GradientBoostingRegressor(n_estimators=30, max_depth=3, random_state=0), TreeEnsemblePredictor)
+
+    def test_stacking(self):
+        stacked = StackingRegressor(
+            estimators=[("RandomForest", RandomForestRegressor(n_estimators=10, random_state=0)),
+                        ("GradientBoosting", GradientBoostingRegressor(n_estimators=20, random_state=0)),
+                        ("Ridge", Ridge())],
+            final_estimator=Ridge(),
+        )
+        self.assert_parity(stacked, StackingPredictor)
+
+    def test_unsupported_model_falls_back_to_sklearn(self):
+        self.assert_parity(SVR(), EstimatorPredictor)
+
+    def test_model_per_cluster(self):
+        preprocessor, clusterer, model = make_pipeline()
+        model.cluster_models[1] = RandomForestRegressor(n_estimators=10, random_state=0)
+        X = preprocessor.transform(make_listings(n=120, seed=0))
+        labels = clusterer.predict(X)
+        y = np.log(40 + 25 * X['accommodates'])
+        model.cluster_models[1].fit(X[labels == 1], y[labels == 1])
+
+        X_new = preprocessor.transform(make_listings(n=40, seed=5))
+        labels_new = clusterer.predict(X_new)
+        for max_rows in (None, 0, 32):
+            compiled = CompiledModelPerCluster(model, max_rows=max_rows)
+            np.testing.assert_allclose(compiled.predicts(X_new, labels_new), model.predicts(X_new, labels_new),
+                                       rtol=1e-10, atol=1e-12)
+            np.testing.assert_allclose(compiled.predicts(X_new.to_numpy(), labels_new),
+                                       model.predicts(X_new, labels_new), rtol=1e-10, atol=1e-12)
+
+        bundle = make_bundle(preprocessor, clusterer, model, compile_model=True)
+        self.assertIsInstance(bundle.model, CompiledModelPerCluster)
+        self.assertIs(bundle.model, bundle.model)
+
+    def test_large_cluster_groups_use_sklearn(self):
+        preprocessor, clusterer, model = make_pipeline()
+        X = preprocessor.transform(make_listings(n=40, seed=5))
+        labels = np.zeros(len(X), dtype=int)
+        compiled = CompiledModelPerCluster(model, max_rows=8)
+        with mock.patch.object(LinearPredictor, 'predict', autospec=True,
+                               side_effect=LinearPredictor.predict) as compiled_predict:
+            large = compiled.predicts(X, labels)
+            self.assertEqual(compiled_predict.call_count, 0)
+            small = compiled.predicts(X.iloc[:8], labels[:8])
+            self.assertEqual(compiled_predict.call_count, 1)
+        np.testing.assert_allclose(large[:8], small, rtol=1e-10, atol=1e-12)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_scaled_sample_is_valid_raw_input(self):
+        raw = raw_listings(300, seed=1)
+        self.assertEqual(len(raw), 300)
+        self.assertEqual(raw['description'].nunique(), 300)
+        self.assertTrue(raw['room_type'].isin(['Private room', 'Entire home/apt', 'Shared room']).all())
+        X = DataPreprocessor().fit(raw.drop(columns=['log_price'])).transform(raw.drop(columns=['log_price']))
+        self.assertEqual(len(X), 300)
+        self.assertGreater(X['n_amenities'].mean(), 1)
+
+    def test_run_records_every_stage(self):
+        benchmark = Benchmark(repeats=1, latency_calls=3, view_requests=4, view_clients=2, log=lambda line: None)
+        results = benchmark.run(150)
+        self.assertEqual(set(results), {
+            f"{name}@150" for name in (
+                "preprocessor_fit", "preprocessor_transform", "preprocessor_transform_row",
+                "preprocessor_transform_one", "geo_features_row", "cluster_predict",
+                "cluster_predict_row", "model_predicts", "model_predicts_row", "compiled_predicts",
+                "compiled_predicts_row", "comparables_query_row", "whatif_grid", "predict_view",
+            )
+        })
+        self.assertGreater(results["preprocessor_transform@150"]["peak_bytes"], 0)
+        self.assertGreater(results["predict_view@150"]["requests_per_second"], 0)
+
+    def test_regressions_are_flagged_against_a_saved_baseline(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "baseline.json")
+            save_baseline(path, {"transform@1000": {"seconds": 1.0, "rows_per_second": 1000.0, "peak_bytes": 100}})
+            baseline = load_baseline(path)["results"]
+        current = {"transform@1000": {"seconds": 1.1, "rows_per_second": 700.0, "peak_bytes": 200},
+                   "new@1000": {"seconds": 5.0}}
+        flagged = {(name, metric) for name, metric, *_ in compare(current, baseline, tolerance=0.25)}
+        self.assertEqual(flagged, {("transform@1000", "rows_per_second"), ("transform@1000", "peak_bytes")})
+
+
+class PredictViewTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from . import views
+        cls.views = views
+        cls.preprocessor, cls.clusterer, cls.model = make_pipeline()
+        listings = make_listings(n=120, seed=0)
+        X = cls.preprocessor.transform(listings)
+        cls.comparables = ComparablesIndex().fit(cls.clusterer, X, np.log(40 + 25 * listings['accommodates']),
+                                                 listings=listings)
+        views.bundles.set(make_bundle(cls.preprocessor, cls.clusterer, cls.model, comparables=cls.comparables))
+        views.prediction_cache.cache.clear()
+
+    def test_predict_view(self):
+        response = self.client.post(reverse('polls:predict'), LISTING)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.context['price'], 0)
+        self.assertEqual(len(response.context['comparables']), 5)
+        self.assertContains(response, 'Similar Listings')
+
+    def test_batch_endpoint_returns_comparables(self):
+        response = self.client.post(reverse('polls:predict_batch'),
+                                    json.dumps({'listings': [LISTING, LISTING], 'comparables': 2}),
+                                    content_type='application/json')
+        predictions = response.json()['predictions']
+        self.assertEqual([len(p['comparables']) for p in predictions], [2, 2])
+        self.assertEqual(predictions[0]['comparables'], predictions[1]['comparables'])
+        self.assertEqual(set(predictions[0]['comparables'][0]),
+                         {'id', 'room_type', 'city', 'accommodates', 'bedrooms', 'beds', 'bathrooms',
+                          'price', 'similarity_distance', 'distance_km'})
+
+        response = self.client.post(reverse('polls:predict_batch'),
+                                    json.dumps({'listings': [LISTING], 'comparables': 1000}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_endpoint_matches_single_predictions(self):
+        listings = [dict(LISTING, accommodates=i, city=city)
+                    for i, city in zip(range(1, 7), ['NYC', 'LA', 'SF', 'DC', 'Chicago', 'Boston'])]
+        response = self.client.post(reverse('polls:predict_batch'), json.dumps(listings),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        predictions = response.json()['predictions']
+        self.assertEqual(len(predictions), len(listings))
+        for listing, prediction in zip(listings, predictions):
+            # Uncached, so the single listing goes through transform_one
+            with mock.patch.object(self.views, 'prediction_cache', None):
+                single = self.client.post(reverse('polls:predict'), listing)
+            np.testing.assert_allclose(prediction['price'], float(single.context['price']), rtol=1e-9)
+
+    def test_stage_timings_reach_the_header_and_metrics(self):
+        with mock.patch.object(self.views, 'prediction_cache', None):
+            response = self.client.post(reverse('polls:predict'), LISTING)
+        timed = {entry.split(';')[0] for entry in response['Server-Timing'].split(', ')}
+        # transform_one skips date_features when no date column reaches the models
+        self.assertTrue({'request', 'form_validation', 'imputation', 'encoding', 'vader', 'textblob',
+                         'haversine', 'tfidf', 'clustering', 'cluster_predict', 'template_render'} <= timed)
+
+        metrics = self.client.get(reverse('polls:metrics')).json()
+        self.assertGreaterEqual(metrics['stages']['vader']['count'], 1)
+        self.assertLessEqual(metrics['stages']['tfidf']['p50_ms'], metrics['stages']['tfidf']['p99_ms'])
+        self.assertIn('queue_depth', metrics['batcher'])
+
+    def test_async_views_match_the_sync_views(self):
+        async_client = AsyncClient()
+        response = asyncio.run(async_client.post(reverse('polls:predict_async'), LISTING))
+        self.assertEqual(response.status_code, 200)
+        sync = self.client.post(reverse('polls:predict'), LISTING)
+        self.assertEqual(response.context['price'], sync.context['price'])
+        self.assertIn('tfidf', response['Server-Timing'])
+
+        body = json.dumps({'listings': [LISTING, dict(LISTING, city='LA')], 'comparables': 2})
+        response = asyncio.run(async_client.post(reverse('polls:predict_batch_async'), body,
+                                                 content_type='application/json'))
+        sync = self.client.post(reverse('polls:predict_batch'), body, content_type='application/json')
+        self.assertEqual(response.json(), sync.json())
+
+    def test_async_views_shed_load_when_the_executor_is_full(self):
+        full = BoundedExecutor(max_workers=1, max_queue=0)
+        release = threading.Event()
+        full.submit(release.wait, 5)
+        try:
+            with mock.patch.object(self.views, 'inference', full), \
+                    mock.patch.object(self.views, 'prediction_cache', None):
+                response = asyncio.run(AsyncClient().post(
+                    reverse('polls:predict_batch_async'), json.dumps([LISTING]), content_type='application/json'))
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response['Retry-After'], '1')
+
+                response = asyncio.run(AsyncClient().post(reverse('polls:predict_async'), LISTING))
+                self.assertEqual(response.status_code, 503)
+                self.assertContains(response, 'busy', status_code=503)
+
+                metrics = self.client.get(reverse('polls:metrics')).json()
+                self.assertEqual(metrics['inference_executor']['rejected'], 2)
+        finally:
+            release.set()
+            full.shutdown()
+
+    def test_resubmitted_listing_is_served_from_the_cache(self):
+        listing = dict(LISTING, description='Resubmitted listing, bright loft near the park')
+        first = self.client.post(reverse('polls:predict'), listing)
+        reordered = dict(listing, amenities='TV,Kitchen , Wireless Internet', description='  Resubmitted listing,  bright loft near the park')
+        with mock.patch.object(self.views, 'predict_with_comparables') as pipeline:
+            second = self.client.post(reverse('polls:predict'), reordered)
+            batch = self.client.post(reverse('polls:predict_batch'), json.dumps([listing]),
+                                     content_type='application/json')
+        pipeline.assert_not_called()
+        self.assertEqual(second.context['price'], first.context['price'])
+        self.assertEqual(json.dumps(second.context['comparables']), json.dumps(first.context['comparables']))
+        self.assertEqual(batch.json()['predictions'][0]['price'], float(first.context['price']))
+
+        metrics = self.client.get(reverse('polls:metrics')).json()
+        self.assertGreaterEqual(metrics['prediction_cache']['hits'], 2)
+
+    def test_whatif_endpoint(self):
+        body = {'listing': LISTING, 'grid': {'accommodates': [2, 4, 6], 'offset_km': [[0, 0], [1, 1]]}}
+        response = self.client.post(reverse('polls:whatif'), json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result['shape'], [3, 2])
+        self.assertEqual([d['name'] for d in result['dimensions']], ['accommodates', 'offset_km'])
+        single = self.client.post(reverse('polls:predict'), dict(LISTING, accommodates=4))
+        np.testing.assert_allclose(result['prices'][1][0], float(single.context['price']), rtol=1e-9)
+
+        body['grid'] = {'accommodates': list(range(1, 200)), 'beds': list(range(100))}
+        response = self.client.post(reverse('polls:whatif'), json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('polls:whatif'), json.dumps({'listing': {}, 'grid': {'beds': [1]}}),
+                                    content_type='application/json')
+        self.assertIn('errors', response.json())
+
+    def test_batch_endpoint_reports_invalid_listings(self):
+        response = self.client.post(reverse('polls:predict_batch'), json.dumps([LISTING, {'city': 'NYC'}]),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1', response.json()['errors'])
@@ -0,0 +1,199 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+def text_key(normalized):
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class TextFeatureCache:
+    """LRU cache for per-description NLP scores, optionally backed by SQLite.
+
+    Values are keyed by ``(feature, hash of the whitespace-normalized text)``
+    so that ``sentiment`` and ``objectivity`` share one store. The in-process
+    LRU holds at most ``maxsize`` entries; the on-disk table, when ``path`` is
+    given, keeps at most ``max_disk_entries`` rows and drops the oldest first.
+
+    The table is counted once per connection; after that each process keeps a
+    running upper bound of its rows, so writes only recount the table when that
+    bound passes ``max_disk_entries``. Pruning then leaves ``prune_headroom`` of
+    the limit free, so a full table is not recounted on every write. Threads
+    share one connection per process, so all disk access holds ``_disk_lock``.
+    """
+
+    prune_headroom = 0.01
+
+    def __init__(self, maxsize=50000, path=None, max_disk_entries=1000000):
+        self.maxsize = maxsize
+        self.path = str(path) if path else None
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._disk_rows = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        state["_disk_lock"] = None
+        state["_conn"] = None
+        state["_conn_pid"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+
+    def _connection(self):
+        # SQLite handles must not cross a fork, so reopen in each worker process.
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS text_features ("
+                "feature TEXT NOT NULL, key TEXT NOT NULL, value REAL NOT NULL, "
+                "PRIMARY KEY (feature, key))"
+            )
+            self._conn.commit()
+            self._conn_pid = os.getpid()
+            self._disk_rows = self._conn.execute("SELECT COUNT(*) FROM text_features").fetchone()[0]
+        return self._conn
+
+    def _remember(self, item, value):
+        self._memory[item] = value
+        self._memory.move_to_end(item)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, feature, keys):
+        found = {}
+        keys = list(keys)
+        with self._disk_lock:
+            conn = self._connection()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, value FROM text_features WHERE feature = ? AND key IN ({placeholders})",
+                    [feature, *chunk],
+                )
+                found.update(rows)
+        return found
+
+    def _disk_put(self, feature, values):
+        with self._disk_lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO text_features (feature, key, value) VALUES (?, ?, ?)",
+                    [(feature, key, float(value)) for key, value in values.items()],
+                )
+                # Misses were just looked up on disk, so each insert adds at most one row;
+                # other workers' inserts are picked up by the recount.
+                self._disk_rows += len(values)
+                if self._disk_rows <= self.max_disk_entries:
+                    return
+                rows = conn.execute("SELECT COUNT(*) FROM text_features").fetchone()[0]
+                if rows > self.max_disk_entries:
+                    keep = self.max_disk_entries - int(self.max_disk_entries * self.prune_headroom)
+                    conn.execute(
+                        "DELETE FROM text_features WHERE rowid IN "
+                        "(SELECT rowid FROM text_features ORDER BY rowid LIMIT ?)",
+                        (rows - keep,),
+                    )
+                    rows = keep
+                self._disk_rows = rows
+
+    def map(self, feature, texts, compute, compute_many=None):
+        """Return ``compute(text)`` for every entry of ``texts``, using the cache.
+
+        Non-string entries bypass the cache and go straight to ``compute``.
+        Strings are normalized before hashing and scoring, so equal keys always
+        map to the same score whether they come from memory, disk or a miss.
+        ``compute_many``, if given, scores all misses of the batch in one call
+        and must return their values in order.
+        """
+        results = [None] * len(texts)
+        pending = {}
+
+        with self._lock:
+            for i, text in enumerate(texts):
+                if not isinstance(text, str):
+                    results[i] = compute(text)
+                    continue
+                normalized = normalize_text(text)
+                key = text_key(normalized)
+                if (feature, key) in self._memory:
+                    self._memory.move_to_end((feature, key))
+                    results[i] = self._memory[(feature, key)]
+                    self.hits += 1
+                elif key in pending:
+                    pending[key][1].append(i)
+                    self.hits += 1
+                else:
+                    pending[key] = (normalized, [i])
+
+        if not pending:
+            return results
+
+        from_disk = self._disk_get(feature, pending) if self.path else {}
+        missing = [(key, normalized) for key, (normalized, _) in pending.items() if key not in from_disk]
+        if compute_many is not None:
+            values = compute_many([normalized for _, normalized in missing])
+        else:
+            values = [compute(normalized) for _, normalized in missing]
+        computed = {key: value for (key, _), value in zip(missing, values)}
+        if computed and self.path:
+            self._disk_put(feature, computed)
+
+        with self._lock:
+            for key, (_, positions) in pending.items():
+                value = from_disk[key] if key in from_disk else computed[key]
+                self._remember((feature, key), value)
+                for i in positions:
+                    results[i] = value
+            self.disk_hits += len(from_disk)
+            self.misses += len(computed)
+        return results
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "size": len(self._memory),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+
+text_cache = TextFeatureCache()
+
+
+def configure_text_cache(maxsize=50000, path=None, max_disk_entries=1000000):
+    """Replace the process-wide cache used by ``DataPreprocessor``."""
+    global text_cache
+    text_cache = TextFeatureCache(maxsize=maxsize, path=path, max_disk_entries=max_disk_entries)
+    return text_cache
+
+
+def get_text_cache():
+    return text_cache
@@ -6,4 +6,9 @@ from .views import predict_view
 app_name = "polls"
 urlpatterns = [
     path('', views.predict_view, name='predict'),
+    path('api/predict/', views.predict_batch_view, name='predict_batch'),
+    path('async/', views.predict_view_async, name='predict_async'),
+    path('api/async/predict/', views.predict_batch_view_async, name='predict_batch_async'),
+    path('api/whatif/', views.whatif_view, name='whatif'),
+    path('api/metrics/', views.metrics_view, name='metrics'),
 ]
@@ -1,19 +1,34 @@
 from django.shortcuts import render
 from django.db.models import F
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import HttpResponseRedirect, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 from django.views import generic
 from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from django.shortcuts import render
 from .forms import PredictForm
 from .utils import format_amenities_from_string
+from .text_cache import configure_text_cache
+from .batching import MicroBatcher
+from .prediction_cache import PredictionCache
+from .whatif import GridError, price_grid, validate_grid
+from .executor import BoundedExecutor, ExecutorFull
+from .artifacts import registry
+from .bundles import BundleRegistry, ModelBundle
 from .forms import PredictForm
+from .profiling import profiler
+from .text_cache import get_text_cache
 import pandas as pd
 import numpy as np
-import joblib
+import json
+import logging
 import os
 from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
 
 class IndexView(generic.TemplateView):
     template_name = "index.html"
@@ -23,40 +38,303 @@ APP_DIR = os.path.dirname(os.path.abspath(__file__))
 preprocessor_path = os.path.join(APP_DIR, "preprocessor.pkl")
 model_path = os.path.join(APP_DIR, "model.pkl")
 clusterer_path = os.path.join(APP_DIR, "clusterer.pkl")
+comparables_path = os.path.join(APP_DIR, "comparables.pkl")
+
+text_cache_config = getattr(settings, "PRICIFIER_TEXT_CACHE", {})
+configure_text_cache(
+    maxsize=text_cache_config.get("MAXSIZE", 50000),
+    path=text_cache_config.get("PATH"),
+    max_disk_entries=text_cache_config.get("MAX_DISK_ENTRIES", 1000000),
+)
+
+profiling_config = getattr(settings, "PRICIFIER_PROFILING", {})
+profiler.configure(
+    enabled=profiling_config.get("ENABLED", True),
+    window=profiling_config.get("WINDOW", 10000),
+    sample_rate=profiling_config.get("PROFILE_SAMPLE_RATE", 0.0),
+    keep=profiling_config.get("PROFILE_KEEP", 20),
+)
+
+artifact_config = getattr(settings, "PRICIFIER_ARTIFACTS", {})
+registry.register("preprocessor", preprocessor_path, mmap_mode=artifact_config.get("MMAP_MODE"))
+registry.register("model", model_path, mmap_mode=artifact_config.get("MMAP_MODE"))
+registry.register("clusterer", clusterer_path, mmap_mode=artifact_config.get("MMAP_MODE"))
+if os.path.exists(comparables_path):
+    registry.register("comparables", comparables_path, mmap_mode=artifact_config.get("MMAP_MODE"))
+
+bundle_config = getattr(settings, "PRICIFIER_BUNDLES", {})
+bundles = BundleRegistry(
+    bundle_config.get("ROOT", os.path.join(APP_DIR, "bundles")),
+    mmap_mode=artifact_config.get("MMAP_MODE"),
+    poll_seconds=bundle_config.get("POLL_SECONDS", 30),
+    # Fingerprinted so cached predictions of replaced pickles are never served
+    fallback=lambda: ModelBundle(f"legacy-{registry.fingerprint()}", registry, compile_model=artifact_config.get("COMPILED_MODEL", False)),
+    compile_model=artifact_config.get("COMPILED_MODEL", False),
+)
+if artifact_config.get("PRELOAD"):
+    bundles.current().artifacts.preload()
+
+comparables_config = getattr(settings, "PRICIFIER_COMPARABLES", {})
+
+preprocessing_config = getattr(settings, "PRICIFIER_PREPROCESSING", {})
+
+def preprocess(preprocessor, listings):
+    """Model features of a DataFrame or list of dicts of raw listings.
+
+    A single dict takes the pandas-free ``transform_one`` path.
+    """
+    if isinstance(listings, pd.DataFrame):
+        return preprocessor.transform(listings)
+    if len(listings) == 1 and preprocessing_config.get("SINGLE_LISTING_FAST_PATH", True):
+        return preprocessor.transform_one(listings[0])
+    return preprocessor.transform(pd.DataFrame(listings))
+
+def predict_with_comparables(df, bundle=None, k=None):
+    """Prices and cluster labels of the listings, plus per row the ``k`` most similar training listings.
+
+    ``df`` is a DataFrame or a list of dicts of listings. The comparables are
+    empty lists when the bundle was saved without a ``ComparablesIndex``.
+    """
+    bundle = bundle or bundles.current()
+    k = comparables_config.get("K", 5) if k is None else k
+    processed = preprocess(bundle.preprocessor, df)
+    with profiler.stage("clustering"):
+        cluster_labels = bundle.clusterer.predict(processed)
+    with profiler.stage("cluster_predict"):
+        predictions = bundle.model.predicts(processed, cluster_labels)
+    index = bundle.comparables
+    with profiler.stage("comparables"):
+        comparables = index.query(processed, k=k) if index is not None else [[] for _ in range(len(df))]
+    return np.round(np.exp(predictions), 2), cluster_labels, comparables
 
-preprocessor = joblib.load(preprocessor_path)
-preprocessor.fitted = True 
-model = joblib.load(model_path)
-clusterer = joblib.load(clusterer_path)
+micro_batch_config = getattr(settings, "PRICIFIER_MICRO_BATCH", {})
+batcher = MicroBatcher(
+    predict_with_comparables,
+    max_batch_size=micro_batch_config.get("MAX_BATCH_SIZE", 32),
+    max_wait_ms=micro_batch_config.get("MAX_WAIT_MS", 5),
+    collate=list,
+    timeout_seconds=micro_batch_config.get("TIMEOUT_SECONDS", 30),
+) if micro_batch_config.get("ENABLED") else None
+
+prediction_cache_config = getattr(settings, "PRICIFIER_PREDICTION_CACHE", {})
+prediction_cache = PredictionCache(
+    caches[prediction_cache_config.get("CACHE", "default")],
+) if prediction_cache_config.get("ENABLED") else None
+
+def predict_listings(rows, k=None):
+    """``predict_with_comparables`` for cleaned form rows, answered from ``prediction_cache`` where possible.
+
+    A single uncached listing goes through the micro-batcher when it is on.
+    """
+    bundle = bundles.current()
+    k = comparables_config.get("K", 5) if k is None else k
+
+    def compute(missing):
+        # A cProfile sample only sees this thread, so sampled requests skip the batcher
+        if len(missing) == 1 and batcher is not None and k == comparables_config.get("K", 5) \
+                and not profiler.profiling():
+            price, cluster, similar = batcher.predict(missing[0])
+            return [price], [cluster], [similar]
+        return predict_with_comparables(missing, bundle, k=k)
+
+    if prediction_cache is None:
+        return compute(rows)
+    return prediction_cache.predict(rows, bundle.version, k, compute)
+
+async def apredict_listings(rows, k=None):
+    """``predict_listings`` for async views: misses run on the ``inference`` executor."""
+    bundle = bundles.current()
+    k = comparables_config.get("K", 5) if k is None else k
+
+    async def compute(missing):
+        return await inference.run(predict_with_comparables, missing, bundle, k=k)
+
+    if prediction_cache is None:
+        return await compute(rows)
+    return await prediction_cache.apredict(rows, bundle.version, k, compute)
+
+def validate_listing(form):
+    """Cleaned form data ready for the pipeline, or None when the form is invalid."""
+    with profiler.stage("form_validation"):
+        valid = form.is_valid()
+    if not valid:
+        logger.debug("Invalid prediction form: %s", form.errors.as_json())
+        return None
+    data = form.cleaned_data
+    data['amenities'] = format_amenities_from_string(data.get('amenities', ''))
+    logger.debug("Predicting for %s", data)
+    return data
+
+def render_prediction(request, form, price=None, comparables=(), error=None, status=200):
+    with profiler.stage("template_render"):
+        return render(request, 'predict.html', {
+            'form': form,
+            'price': price,
+            'comparables': comparables,
+            'error': error,
+        }, status=status)
 
 def predict_view(request):
     price = None
-    formatted_amenities = None
+    comparables = []
 
     if request.method == 'POST':
         form = PredictForm(request.POST)
-        
-        if form.is_valid():
-            data = form.cleaned_data
-            print(data)
+        data = validate_listing(form)
+        if data is not None:
+            prices, _, rows = predict_listings([data])
+            price, comparables = prices[0], rows[0]
+            logger.debug("Predicted price %s", price)
+    else:
+        form = PredictForm()
+
+    return render_prediction(request, form, price, comparables)
+
+def parse_batch_request(request):
+    """``(rows, k, None)`` for a valid batch JSON body, else ``(None, None, error response)``."""
+    try:
+        payload = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return None, None, JsonResponse({'error': 'Request body must be valid JSON.'}, status=400)
 
-            data['amenities'] = format_amenities_from_string(data.get('amenities', ''))
+    listings = payload.get('listings') if isinstance(payload, dict) else payload
+    if not isinstance(listings, list) or not listings:
+        return None, None, JsonResponse({'error': 'Expected a non-empty array of listings.'}, status=400)
 
-            df = pd.DataFrame([data])
+    max_batch_size = getattr(settings, 'PRICIFIER_MAX_BATCH_SIZE', 1000)
+    max_comparables = comparables_config.get("MAX_K", 20)
+    k = comparables_config.get("K", 5)
+    if isinstance(payload, dict):
+        k = payload.get('comparables', k)
+    if not isinstance(k, int) or isinstance(k, bool) or not 0 <= k <= max_comparables:
+        return None, None, JsonResponse(
+            {'error': f'comparables must be an integer from 0 to {max_comparables}.'}, status=400)
+    if len(listings) > max_batch_size:
+        return None, None, JsonResponse({'error': f'At most {max_batch_size} listings per request.'}, status=400)
 
-            processed = preprocessor.transform(df)
-            cluster_labels = clusterer.predict(processed)
-            prediction = model.predicts(processed, cluster_labels)[0]
-            price = round(np.exp(prediction), 2)
-            print(price)
+    rows = []
+    errors = {}
+    with profiler.stage("form_validation"):
+        for i, listing in enumerate(listings):
+            form = PredictForm(listing if isinstance(listing, dict) else {})
+            if form.is_valid():
+                data = form.cleaned_data
+                data['amenities'] = format_amenities_from_string(data.get('amenities', ''))
+                rows.append(data)
+            else:
+                errors[i] = form.errors.get_json_data()
+
+    if errors:
+        return None, None, JsonResponse({'errors': errors}, status=400)
+    return rows, k, None
+
+def batch_response(prices, cluster_labels, comparables):
+    return JsonResponse({
+        'predictions': [
+            {'price': float(price), 'cluster': int(cluster), 'comparables': similar}
+            for price, cluster, similar in zip(prices, cluster_labels, comparables)
+        ]
+    })
 
-        else:
-            print(form.errors)  
+@csrf_exempt
+@require_POST
+def predict_batch_view(request):
+    rows, k, error = parse_batch_request(request)
+    if error is not None:
+        return error
+    return batch_response(*predict_listings(rows, k=k))
+
+async_config = getattr(settings, "PRICIFIER_ASYNC", {})
+inference = BoundedExecutor(
+    max_workers=async_config.get("MAX_WORKERS", 4),
+    max_queue=async_config.get("MAX_QUEUE", 64),
+)
+
+def backpressure_headers(response):
+    response['Retry-After'] = str(async_config.get("RETRY_AFTER_SECONDS", 1))
+    return response
+
+async def predict_view_async(request):
+    """``predict_view`` for ASGI: the pipeline runs on the bounded ``inference`` executor.
+
+    The event loop only validates the form and renders the page. When every
+    executor worker and queue slot is busy the request is answered at once
+    with 503 and ``Retry-After`` instead of waiting.
+    """
+    price = None
+    comparables = []
 
+    if request.method == 'POST':
+        form = PredictForm(request.POST)
+        data = validate_listing(form)
+        if data is not None:
+            try:
+                prices, _, rows = await apredict_listings([data])
+            except ExecutorFull:
+                return backpressure_headers(render_prediction(
+                    request, form, error='The estimator is busy, please try again shortly.', status=503))
+            price, comparables = prices[0], rows[0]
     else:
         form = PredictForm()
 
-    return render(request, 'predict.html', {
-        'form': form,
-        'price': price
-    })
+    return render_prediction(request, form, price, comparables)
+
+@csrf_exempt
+@require_POST
+async def predict_batch_view_async(request):
+    """``predict_batch_view`` for ASGI, with the same executor and 503 backpressure."""
+    rows, k, error = parse_batch_request(request)
+    if error is not None:
+        return error
+    try:
+        result = await apredict_listings(rows, k=k)
+    except ExecutorFull:
+        return backpressure_headers(JsonResponse({'error': 'Inference queue is full.'}, status=503))
+    return batch_response(*result)
+
+whatif_config = getattr(settings, "PRICIFIER_WHATIF", {})
+
+@csrf_exempt
+@require_POST
+def whatif_view(request):
+    """Price surface of one listing over a grid of variations, see ``whatif.price_grid``.
+
+    The body is ``{"listing": {...form fields...}, "grid": {dimension: [values]}}``.
+    """
+    try:
+        payload = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Request body must be valid JSON.'}, status=400)
+    if not isinstance(payload, dict) or not isinstance(payload.get('listing'), dict):
+        return JsonResponse({'error': 'Expected an object with a listing and a grid.'}, status=400)
+
+    form = PredictForm(payload['listing'])
+    data = validate_listing(form)
+    if data is None:
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    bundle = bundles.current()
+    try:
+        dimensions = validate_grid(payload.get('grid'), bundle.preprocessor.encoders["mapping"]["room_type"],
+                                   whatif_config.get("MAX_POINTS", 10000))
+    except GridError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(price_grid(bundle.preprocessor, bundle.clusterer, bundle.model, data, dimensions))
+
+@require_GET
+def metrics_view(request):
+    """Stage latency percentiles of this process, plus batcher, bundle and cache counters.
+
+    ``?profiles=1`` adds the text of the most recent sampled cProfile runs.
+    """
+    metrics = {
+        'pid': os.getpid(),
+        'stages': profiler.stats(),
+        'batcher': batcher.stats() if batcher is not None else None,
+        'inference_executor': inference.stats(),
+        'bundles': bundles.stats(),
+        'text_cache': get_text_cache().stats(),
+        'prediction_cache': prediction_cache.stats() if prediction_cache is not None else None,
+    }
+    if request.GET.get('profiles'):
+        metrics['profiles'] = list(profiler.profiles)
+    return JsonResponse(metrics)
@@ -0,0 +1,144 @@
+import math
+import numbers
+
+import numpy as np
+import pandas as pd
+
+from .geo import EARTH_RADIUS_KM
+from .profiling import profiler
+
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+# Grid dimensions, in the order they are laid out in the price surface
+DIMENSIONS = ("accommodates", "beds", "room_type", "amenities", "offset_km")
+
+
+class GridError(ValueError):
+    """Raised for a what-if grid that cannot be expanded."""
+
+
+def edit_amenities(amenities, add=(), remove=()):
+    """A formatted amenities value with ``remove`` dropped and ``add`` appended."""
+    items = [item.strip().strip('"') for item in (amenities or '').strip('{}').split(',')]
+    removed = set(remove)
+    items = [item for item in items if item and item not in removed]
+    items += [item for item in add if item not in items]
+    return '{' + ','.join(f'"{item}"' for item in items) + '}'
+
+
+def offset_coordinates(latitude, longitude, north_km, east_km):
+    """Coordinates ``north_km`` north and ``east_km`` east of a point."""
+    north_km, east_km = np.asarray(north_km, dtype=float), np.asarray(east_km, dtype=float)
+    return (latitude + north_km / KM_PER_DEGREE,
+            longitude + east_km / (KM_PER_DEGREE * math.cos(math.radians(latitude))))
+
+
+def _is_int(value):
+    return isinstance(value, numbers.Integral) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _check_value(name, value, room_types):
+    if name == "accommodates":
+        return _is_int(value) and value >= 1
+    if name == "beds":
+        return _is_int(value) and value >= 0
+    if name == "room_type":
+        return value in room_types
+    if name == "amenities":
+        return (isinstance(value, dict) and set(value) <= {"add", "remove"} and all(
+            isinstance(items, list) and all(isinstance(item, str) and item.strip() for item in items)
+            for items in value.values()))
+    return isinstance(value, (list, tuple)) and len(value) == 2 and all(_is_number(v) for v in value)
+
+
+def validate_grid(grid, room_types, max_points):
+    """``grid`` as ``(dimension, values)`` pairs in ``DIMENSIONS`` order, or ``GridError``.
+
+    ``grid`` maps dimensions to non-empty lists of values: ``accommodates``
+    and ``beds`` counts, ``room_type`` labels, ``amenities`` changes such as
+    ``{"add": ["Pool"], "remove": ["TV"]}`` and ``offset_km`` pairs of
+    kilometres north and east of the listing.
+    """
+    if not isinstance(grid, dict) or not grid:
+        raise GridError("grid must be a non-empty object of dimension to values.")
+    unknown = sorted(set(grid) - set(DIMENSIONS))
+    if unknown:
+        raise GridError(f"Unknown grid dimensions {unknown}; expected some of {list(DIMENSIONS)}.")
+    dimensions = []
+    for name in DIMENSIONS:
+        if name not in grid:
+            continue
+        values = grid[name]
+        if not isinstance(values, list) or not values:
+            raise GridError(f"{name} must be a non-empty array.")
+        invalid = [value for value in values if not _check_value(name, value, room_types)]
+        if invalid:
+            raise GridError(f"Invalid {name} values: {invalid[:5]}")
+        dimensions.append((name, values))
+    points = math.prod(len(values) for _, values in dimensions)
+    if points > max_points:
+        raise GridError(f"The grid has {points} points; at most {max_points} are allowed.")
+    return dimensions
+
+
+def variation_features(preprocessor, listing, name, values):
+    """Model feature columns that dimension ``name`` changes, one array entry per value."""
+    if name in ("accommodates", "beds"):
+        return {name: np.asarray(values, dtype=float)}
+    if name == "room_type":
+        mapping = preprocessor.encoders["mapping"]["room_type"]
+        return {name: np.array([mapping.get(value, np.nan) for value in values], dtype=float)}
+    if name == "amenities":
+        rows = [preprocessor.amenity_features(edit_amenities(listing.get("amenities"), value.get("add", ()),
+                                                             value.get("remove", ())))
+                for value in values]
+        return {col: np.array([row[col] for row in rows], dtype=float) for col in rows[0]}
+    latitude, longitude = offset_coordinates(listing["latitude"], listing["longitude"], *zip(*values))
+    features = preprocessor.location_features(listing.get("city"), latitude, longitude)
+    return dict(features, latitude=latitude, longitude=longitude)
+
+
+def price_grid(preprocessor, clusterer, model, listing, dimensions):
+    """Predicted prices of ``listing`` under every combination of grid values.
+
+    ``listing`` is one dict of cleaned form data and ``dimensions`` the
+    output of ``validate_grid``. The listing is preprocessed once with
+    ``listing_vector``; each dimension then recomputes only the feature
+    columns it changes, once per distinct value, and the rows of the whole
+    grid are filled in by indexing. One clustering and one model call price
+    every point, plus the unchanged listing as ``base``.
+
+    ``prices`` and ``clusters`` are nested lists shaped as ``shape``, one
+    axis per dimension in the order of ``dimensions``.
+    """
+    shape = tuple(len(values) for _, values in dimensions)
+    index = np.indices(shape).reshape(len(shape), -1)
+    n = index.shape[1]
+    columns = preprocessor.output_features()
+    position = {col: i for i, col in enumerate(columns)}
+
+    base = preprocessor.listing_vector(listing)
+    with profiler.stage("whatif_features"):
+        # The last row stays the unchanged listing
+        X = np.repeat(base[None, :], n + 1, axis=0)
+        for axis, (name, values) in enumerate(dimensions):
+            for col, column in variation_features(preprocessor, listing, name, values).items():
+                if col in position:
+                    X[:n, position[col]] = column[index[axis]]
+        X = pd.DataFrame(X, columns=columns)
+
+    with profiler.stage("clustering"):
+        cluster_labels = clusterer.predict(X)
+    with profiler.stage("cluster_predict"):
+        prices = np.round(np.exp(model.predicts(X, cluster_labels)), 2)
+
+    return {
+        "dimensions": [{"name": name, "values": values} for name, values in dimensions],
+        "shape": list(shape),
+        "prices": prices[:n].reshape(shape).tolist(),
+        "clusters": np.asarray(cluster_labels[:n]).reshape(shape).tolist(),
+        "base": {"price": float(prices[n]), "cluster": int(cluster_labels[n])},
+    }
@@ -27,6 +27,9 @@ SECRET_KEY = "django-insecure-b+)!lcom1i7ohj76#x7ij(ny!4v)*a5+-$xy&zgj0h91@p@dss
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# manage.py test runs keep state such as the text cache out of the working tree
+TESTING = "test" in sys.argv[1:2]
+
 ALLOWED_HOSTS = []
 
 
@@ -50,6 +53,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "pricifier.middleware.StageTimingMiddleware",
 ]
 
 ROOT_URLCONF = "ramseyweb.urls"
@@ -123,3 +127,123 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Sentiment/objectivity scores cached per description hash
+# PATH enables the on-disk SQLite store shared by all workers; tests use memory only
+
+PRICIFIER_TEXT_CACHE = {
+    "MAXSIZE": 50000,
+    "PATH": None if TESTING else BASE_DIR / "text_cache.sqlite3",
+    "MAX_DISK_ENTRIES": 1000000,
+}
+
+# Largest number of listings accepted by the batch JSON prediction endpoint
+
+PRICIFIER_MAX_BATCH_SIZE = 1000
+
+# Pickled pipeline artifacts are loaded on first use. MMAP_MODE "r" maps their
+# plain numpy arrays read-only from the file; replace artifact files by writing a
+# new file and renaming it, never by rewriting in place. Tree models are copied
+# into each process when unpickled whatever MMAP_MODE says, so to share them run
+# gunicorn --preload with PRELOAD, which loads everything at import before the
+# fork and leaves the workers copy-on-write pages.
+# COMPILED_MODEL serves small batches through pricifier.compiled, up to
+# COMPILED_MAX_ROWS rows per cluster; larger batches still use sklearn.
+
+PRICIFIER_ARTIFACTS = {
+    "MMAP_MODE": "r",
+    "PRELOAD": False,
+    "COMPILED_MODEL": True,
+}
+
+# Versioned model bundles written by optimize_model.py. Each worker checks the
+# CURRENT pointer every POLL_SECONDS and swaps in a new bundle in the background.
+# Without a published bundle the standalone pickles above are served.
+
+PRICIFIER_BUNDLES = {
+    "ROOT": BASE_DIR / "pricifier" / "bundles",
+    "POLL_SECONDS": 30,
+}
+
+# Similar training listings returned with each prediction when the bundle has a
+# ComparablesIndex. K is the default count; API callers may ask for up to MAX_K.
+
+PRICIFIER_COMPARABLES = {
+    "K": 5,
+    "MAX_K": 20,
+}
+
+# Per-stage pipeline timings, aggregated over the last WINDOW samples per stage and
+# served at /api/metrics/. Responses carry a Server-Timing header with the
+# request's own breakdown. PROFILE_SAMPLE_RATE runs that share of requests
+# under cProfile; the last PROFILE_KEEP reports are in /api/metrics/?profiles=1.
+
+PRICIFIER_PROFILING = {
+    "ENABLED": True,
+    "WINDOW": 10000,
+    "PROFILE_SAMPLE_RATE": 0.0,
+    "PROFILE_KEEP": 20,
+}
+
+# Async views (/async/, /api/async/predict/) run the pipeline on a bounded thread
+# pool: MAX_WORKERS calls at once, MAX_QUEUE more waiting. Beyond that they answer
+# 503 with Retry-After: RETRY_AFTER_SECONDS. Serve them with an ASGI server.
+
+PRICIFIER_ASYNC = {
+    "MAX_WORKERS": 4,
+    "MAX_QUEUE": 64,
+    "RETRY_AFTER_SECONDS": 1,
+}
+
+# Pipeline outputs cached per normalized listing, comparables count and model
+# bundle version, so a new bundle invalidates them. CACHE names an entry of
+# CACHES below; entries expire after its TIMEOUT and are culled beyond MAX_ENTRIES.
+
+PRICIFIER_PREDICTION_CACHE = {
+    "ENABLED": True,
+    "CACHE": "predictions",
+}
+
+# The local-memory backend is per process. To share predictions across workers
+# use e.g. "django.core.cache.backends.filebased.FileBasedCache" with a LOCATION
+# directory, or a memcached or Redis backend.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "predictions": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "pricifier-predictions",
+        "TIMEOUT": 3600,
+        "OPTIONS": {
+            "MAX_ENTRIES": 50000,
+            "CULL_FREQUENCY": 4,
+        },
+    },
+}
+
+# Single listings are preprocessed by DataPreprocessor.transform_one, a dict to
+# numpy path that skips pandas; batches always go through transform.
+
+PRICIFIER_PREPROCESSING = {
+    "SINGLE_LISTING_FAST_PATH": True,
+}
+
+# Largest number of grid points priced by one /api/whatif/ request
+
+PRICIFIER_WHATIF = {
+    "MAX_POINTS": 10000,
+}
+
+# Coalesce concurrent single-listing predictions into one batched pipeline run.
+# A request that finds no other queued runs at once; MAX_WAIT_MS only applies
+# while several are waiting together. A request that gets no result within
+# TIMEOUT_SECONDS fails instead of holding its worker.
+
+PRICIFIER_MICRO_BATCH = {
+    "ENABLED": True,
+    "MAX_BATCH_SIZE": 32,
+    "MAX_WAIT_MS": 5,
+    "TIMEOUT_SECONDS": 30,
+}
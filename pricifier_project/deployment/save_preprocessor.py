@@ -1,14 +1,13 @@
 import joblib
-import pandas as pd
+from pricifier.ingest import ChunkedCsv
 from pricifier.preprocessor import DataPreprocessor
 
-# Load data
-df = pd.read_csv("deployment/Airbnb_Data.csv").sample(500, random_state=42)
-X_train = df.drop(['log_price'], axis=1)
+# Stream the data in chunks; only the listing columns are parsed
+source = ChunkedCsv("deployment/Airbnb_Data.csv")
 
-# Fit preprocessor
+# Fit preprocessor on every row
 preprocessor = DataPreprocessor()
-preprocessor.fit(X_train)
+preprocessor.fit_chunks(source)
 
 # Save correctly using real import path
 joblib.dump(preprocessor, 'deployment/pricifier/preprocessor.pkl')